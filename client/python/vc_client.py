@@ -25,6 +25,7 @@ def setupArgParser():
     parser.add_argument("--input", type=int, required=True, help="input device index")
     parser.add_argument("--output", type=int, default=-1, help="input device index")
     parser.add_argument("--to", type=str, default="", help="sid")
+    parser.add_argument("--ws", action="store_true", help="use the raw binary websocket (/stream) instead of socket.io")
 
     return parser
 
@@ -104,6 +105,46 @@ class MyCustomNamespace(socketio.ClientNamespace):
             self.audio_output_stream.write(data)
 
 
+# /stream のフレーム(server/mods/audio_codec.py と同じ形式)
+REQUEST_HEADER = struct.Struct("<dIHH")  # timestamp, seq, format(0:int16), flags
+RESPONSE_HEADER = struct.Struct("<dIHH3f")  # timestamp, seq, format, flags, perf x 3
+FLAG_DROPPED = 1
+
+
+def run_websocket(url, audio_input_stream, audio_output_stream, file_output_stream):
+    import threading
+    from websockets.sync.client import connect
+
+    ws_url = url.replace("http", "ws", 1) + "/stream"
+    with connect(ws_url, max_size=None) as ws:
+        print(f'connected')
+
+        def receive():
+            for msg in ws:
+                if isinstance(msg, str):
+                    print(msg)
+                    continue
+                timestamp, seq, format, flags, *perf = RESPONSE_HEADER.unpack_from(msg)
+                if flags & FLAG_DROPPED:
+                    print(f"dropped seq:{seq}")
+                    continue
+                responseTime = time.time() * 1000 - timestamp
+                print(f"RT:{responseTime}msec", perf)
+                data = np.frombuffer(msg, dtype="<i2", offset=RESPONSE_HEADER.size)
+                data = np.clip(data.astype(np.int32) * GAIN, -32768, 32767).astype("<i2").tobytes()
+                if file_output_stream != None:
+                    file_output_stream.write(data)
+                if audio_output_stream != None:
+                    audio_output_stream.write(data)
+
+        threading.Thread(target=receive, daemon=True).start()
+        seq = 0
+        while True:
+            in_wav = audio_input_stream.read(BUFFER_SIZE, exception_on_overflow=False)
+            ws.send(REQUEST_HEADER.pack(time.time() * 1000, seq, 0, 0) + in_wav)
+            seq = (seq + 1) & 0xFFFFFFFF
+
+
 if __name__ == '__main__':
     parser = setupArgParser()
     args, unknown = parser.parse_known_args()
@@ -141,12 +182,15 @@ if __name__ == '__main__':
     # mock_stream_in = MockStream(24000)
     # mock_stream_in.open_outputfile("test_in.wav")
 
-    my_namespace = MyCustomNamespace("/test", audio_output_stream, mock_stream_out)
-
-    sio = socketio.Client(ssl_verify=False)
-    sio.register_namespace(my_namespace)
-    sio.connect(url)
     try:
+        if args.ws:
+            run_websocket(url, audio_input_stream, audio_output_stream, mock_stream_out)
+
+        my_namespace = MyCustomNamespace("/test", audio_output_stream, mock_stream_out)
+
+        sio = socketio.Client(ssl_verify=False)
+        sio.register_namespace(my_namespace)
+        sio.connect(url)
         while True:
             in_wav = audio_input_stream.read(BUFFER_SIZE, exception_on_overflow=False)
             sio.emit('request_message', [time.time() * 1000, in_wav], namespace="/test")
@@ -0,0 +1,155 @@
+"""
+■ BatchConvert
+- 録音済みのファイルをまとめて変換する CLI(RVC のモデルスロットを使う)
+・変換は voice_changer/RVC/RVCBatchConverter.py を参照。
+・入力にディレクトリを指定した場合は中の音声ファイルを全て変換する。出力は output_dir に同じファイル名の wav で書き出す。
+  出力のファイル名が重なる場合(a.wav と a.flac、別のディレクトリの同じ名前など)は何も変換せずに終了する。
+・結果(ファイル毎の処理時間、実時間の何倍の速さで変換できたか)を JSON で出力する。
+
+使い方(server ディレクトリで実行):
+  python BatchConvert.py --slot 0 --output_dir out input1.wav input2.wav recordings/
+"""
+
+import argparse
+from dataclasses import asdict
+import json
+import os
+import sys
+import time
+
+from distutils.util import strtobool
+
+from data.ModelSlot import loadSlotInfo
+from voice_changer.RVC.RVCBatchConverter import BatchConvertSettings, convertFiles
+from voice_changer.VoiceChangerParamsManager import VoiceChangerParamsManager
+from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3")
+
+
+def setupArgParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", type=str, nargs="+", help="input files or directories")
+    parser.add_argument("--output_dir", type=str, required=True, help="directory to write converted files")
+    parser.add_argument("--slot", type=int, required=True, help="model slot index (RVC)")
+
+    parser.add_argument("--tran", type=int, default=None, help="pitch shift (semitones). default: slot default")
+    parser.add_argument("--index_ratio", type=float, default=None, help="index ratio. default: slot default")
+    parser.add_argument("--protect", type=float, default=None, help="protect. default: slot default")
+    parser.add_argument("--dst_id", type=int, default=0, help="speaker id")
+    parser.add_argument("--f0_detector", type=str, default="rmvpe", help="pitch extractor")
+    parser.add_argument("--gpu", type=int, default=0, help="gpu index (-1: cpu)")
+    parser.add_argument("--output_sr", type=int, default=0, help="output sampling rate. 0: model sampling rate")
+
+    parser.add_argument("--window", type=float, default=30.0, help="window length (sec)")
+    parser.add_argument("--context", type=float, default=1.0, help="context added before/after each window (sec)")
+    parser.add_argument("--crossfade", type=float, default=0.05, help="crossfade between windows (sec)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--workers", type=int, default=0, help="number of workers. 0: auto")
+    parser.add_argument("--mode", type=str, default="auto", help="auto|thread|process")
+
+    parser.add_argument("--model_dir", type=str, default="model_dir", help="path to model files")
+    parser.add_argument("--content_vec_500", type=str, default="pretrain/checkpoint_best_legacy_500.pt", help="path to content_vec_500 model(pytorch)")
+    parser.add_argument("--content_vec_500_onnx", type=str, default="pretrain/content_vec_500.onnx", help="path to content_vec_500 model(onnx)")
+    parser.add_argument("--content_vec_500_onnx_on", type=strtobool, default=True, help="use or not onnx for  content_vec_500")
+    parser.add_argument("--hubert_base", type=str, default="pretrain/hubert_base.pt", help="path to hubert_base model(pytorch)")
+    parser.add_argument("--hubert_base_jp", type=str, default="pretrain/rinna_hubert_base_jp.pt", help="path to hubert_base_jp model(pytorch)")
+    parser.add_argument("--hubert_soft", type=str, default="pretrain/hubert/hubert-soft-0d54a1f4.pt", help="path to hubert_soft model(pytorch)")
+    parser.add_argument("--whisper_tiny", type=str, default="pretrain/whisper_tiny.pt", help="path to hubert_soft model(pytorch)")
+    parser.add_argument("--nsf_hifigan", type=str, default="pretrain/nsf_hifigan/model", help="path to nsf_hifigan model(pytorch)")
+    parser.add_argument("--crepe_onnx_full", type=str, default="pretrain/crepe_onnx_full.onnx", help="path to crepe_onnx_full")
+    parser.add_argument("--crepe_onnx_tiny", type=str, default="pretrain/crepe_onnx_tiny.onnx", help="path to crepe_onnx_tiny")
+    parser.add_argument("--rmvpe", type=str, default="pretrain/rmvpe.pt", help="path to rmvpe")
+    parser.add_argument("--rmvpe_onnx", type=str, default="pretrain/rmvpe.onnx", help="path to rmvpe onnx")
+    return parser
+
+
+def collectJobs(inputs: list[str], outputDir: str):
+    jobs = []
+    for path in inputs:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted([os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(AUDIO_EXTENSIONS)])
+        for file in files:
+            name = os.path.splitext(os.path.basename(file))[0] + ".wav"
+            jobs.append((file, os.path.join(outputDir, name)))
+    return jobs
+
+
+def findOutputCollisions(jobs: list[tuple[str, str]]):
+    # 同じ出力ファイルに書き出す入力をまとめて返す。(並列に書き込むと片方の結果が黙って上書きされるので)
+    outputs: dict[str, list[str]] = {}
+    for input, output in jobs:
+        outputs.setdefault(os.path.normcase(os.path.abspath(output)), []).append(input)
+    return {output: inputs for output, inputs in outputs.items() if len(inputs) > 1}
+
+
+def main():
+    parser = setupArgParser()
+    args, _ = parser.parse_known_args()
+
+    voiceChangerParams = VoiceChangerParams(
+        model_dir=args.model_dir,
+        content_vec_500=args.content_vec_500,
+        content_vec_500_onnx=args.content_vec_500_onnx,
+        content_vec_500_onnx_on=args.content_vec_500_onnx_on,
+        hubert_base=args.hubert_base,
+        hubert_base_jp=args.hubert_base_jp,
+        hubert_soft=args.hubert_soft,
+        nsf_hifigan=args.nsf_hifigan,
+        crepe_onnx_full=args.crepe_onnx_full,
+        crepe_onnx_tiny=args.crepe_onnx_tiny,
+        rmvpe=args.rmvpe,
+        rmvpe_onnx=args.rmvpe_onnx,
+        sample_mode="",
+        whisper_tiny=args.whisper_tiny,
+    )
+    VoiceChangerParamsManager.get_instance().setParams(voiceChangerParams)
+
+    slotInfo = loadSlotInfo(args.model_dir, args.slot)
+    if slotInfo.voiceChangerType != "RVC":
+        print(f"slot {args.slot} is not an RVC model: {slotInfo.voiceChangerType}")
+        sys.exit(1)
+    slotInfo.slotIndex = args.slot
+
+    settings = BatchConvertSettings(
+        tran=args.tran if args.tran is not None else slotInfo.defaultTune,
+        dstId=args.dst_id,
+        indexRatio=args.index_ratio if args.index_ratio is not None else slotInfo.defaultIndexRatio,
+        protect=args.protect if args.protect is not None else slotInfo.defaultProtect,
+        f0Detector=args.f0_detector,
+        gpu=args.gpu,
+        windowSec=args.window,
+        contextSec=args.context,
+        crossFadeSec=args.crossfade,
+        seed=args.seed,
+        outputSampleRate=args.output_sr,
+    )
+
+    jobs = collectJobs(args.inputs, args.output_dir)
+    collisions = findOutputCollisions(jobs)
+    if len(collisions) > 0:
+        for output, inputs in collisions.items():
+            print(f"output file collision: {output} <- {', '.join(inputs)}")
+        sys.exit(1)
+    start = time.perf_counter()
+    results = convertFiles(voiceChangerParams, slotInfo, settings, jobs, args.workers, args.mode)
+    elapsed = time.perf_counter() - start
+
+    duration = sum([r.get("duration", 0) for r in results])
+    print(
+        json.dumps(
+            {
+                "settings": asdict(settings),
+                "files": results,
+                "elapsed": elapsed,
+                "duration": duration,
+                "speed": duration / elapsed if elapsed > 0 else 0,  # 全体で実時間の何倍の速さで変換できたか
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+■ codec_bench
+- 音声フレームの変換(受信バッファ -> int16 配列 -> 送信用 bytes)の比較
+・struct: 以前の struct.unpack / struct.pack(サンプル毎に Python の int を作る)
+・codec: mods.audio_codec(np.frombuffer / tobytes)
+・--base64 を付けると REST(/test) と同じく base64 のデコード / エンコードも含めて計測する。
+・メッセージ一つあたりの処理時間(平均 / p95)をチャンク長毎に出す。
+
+使い方(server ディレクトリで実行):
+  python bench/codec_bench.py --chunks 1024 4096 8192 16384
+"""
+
+import argparse
+import base64
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mods.audio_codec import decode_audio, encode_audio  # NOQA
+
+
+def setupArgParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1024, 4096, 8192, 16384], help="samples per message")
+    parser.add_argument("--iterations", type=int, default=500, help="messages per measurement")
+    parser.add_argument("--base64", action="store_true", help="include base64 decode/encode (REST path)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    return parser
+
+
+def structRoundTrip(data: bytes):
+    audio = np.array(struct.unpack("<%sh" % (len(data) // struct.calcsize("<h")), data)).astype(np.int16)
+    return struct.pack("<%sh" % len(audio), *audio)
+
+
+def codecRoundTrip(data: bytes):
+    audio = decode_audio(data)
+    return encode_audio(audio)
+
+
+def withBase64(func):
+    def roundTrip(data: bytes):
+        return base64.b64encode(func(base64.b64decode(data)))
+
+    return roundTrip
+
+
+def measure(func, data: bytes, iterations: int):
+    times = np.zeros(iterations)
+    for i in range(iterations):
+        s = time.perf_counter()
+        func(data)
+        times[i] = time.perf_counter() - s
+    return {
+        "mean_us": float(np.mean(times) * 1e6),
+        "p95_us": float(np.percentile(times, 95) * 1e6),
+    }
+
+
+def main():
+    parser = setupArgParser()
+    args, _ = parser.parse_known_args()
+    rng = np.random.default_rng(args.seed)
+
+    results = {"iterations": args.iterations, "base64": args.base64, "chunks": []}
+    for chunk in args.chunks:
+        data = rng.integers(-32768, 32767, chunk, dtype=np.int16).astype("<i2").tobytes()
+        structFunc, codecFunc = structRoundTrip, codecRoundTrip
+        if args.base64:
+            data = base64.b64encode(data)
+            structFunc, codecFunc = withBase64(structFunc), withBase64(codecFunc)
+
+        # 変換結果が同じであることを確認しておく
+        assert structFunc(data) == codecFunc(data)
+
+        structResult = measure(structFunc, data, args.iterations)
+        codecResult = measure(codecFunc, data, args.iterations)
+        results["chunks"].append(
+            {
+                "samples": chunk,
+                "struct": structResult,
+                "codec": codecResult,
+                "speedup": structResult["mean_us"] / codecResult["mean_us"],
+            }
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
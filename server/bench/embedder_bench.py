@@ -0,0 +1,105 @@
+"""
+■ embedder_bench
+- incremental embedding と 窓全体の embedding の比較
+・RVCr2 と同じように convertSize の窓をチャンク毎にずらしながら embedding する。
+・出力部分(窓の末尾 chunk + crossfade 分)の特徴量のコサイン類似度と、CNN / transformer にかけたフレーム数、処理時間を出力する。
+
+使い方(server ディレクトリで実行):
+  python bench/embedder_bench.py --wav test.wav --hubert pretrain/hubert_base.pt --chunk 0.1 --extra 0.5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import librosa  # NOQA
+import torch  # NOQA
+
+from voice_changer.RVC.embedder.FairseqHubert import FairseqHubert  # NOQA
+from voice_changer.RVC.embedder.IncrementalEmbedder import HOP, IncrementalEmbedder  # NOQA
+
+
+def setupArgParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wav", type=str, default="test.wav", help="input wav")
+    parser.add_argument("--hubert", type=str, default="pretrain/hubert_base.pt", help="path to hubert_base model(pytorch)")
+    parser.add_argument("--chunk", type=float, default=0.1, help="chunk size (sec)")
+    parser.add_argument("--extra", type=float, default=0.5, help="extraConvertSize (sec)")
+    parser.add_argument("--crossfade", type=float, default=0.05, help="crossfade + sola search size (sec)")
+    parser.add_argument("--margin", type=float, default=0.5, help="transformer context for incremental embedding (sec)")
+    parser.add_argument("--layer", type=int, default=12, help="embOutputLayer")
+    parser.add_argument("--finalProj", type=int, default=0, help="useFinalProj 0:off, 1:on")
+    parser.add_argument("--gpu", type=int, default=-1, help="gpu id (-1: cpu)")
+    return parser
+
+
+def main():
+    parser = setupArgParser()
+    args, _ = parser.parse_known_args()
+
+    dev = torch.device("cuda", args.gpu) if args.gpu >= 0 else torch.device("cpu")
+    embedder = FairseqHubert().loadModel(args.hubert, dev, False)
+    incremental = IncrementalEmbedder(args.margin)
+
+    wav, _ = librosa.load(args.wav, sr=16000, mono=True)
+    chunk = int(args.chunk * 16000)
+    outputFrames = int((args.chunk + args.crossfade) * 16000) // HOP
+    convertSize = chunk + int((args.crossfade + args.extra) * 16000)
+    convertSize = convertSize + (160 - convertSize % 160) % 160
+
+    window = np.zeros(convertSize, dtype=np.float32)
+    similarities = []
+    fullTimes = []
+    incrementalTimes = []
+    cnnFrames = []
+    transformerFrames = []
+    fullFrames = 0
+    position = 0
+    for start in range(0, wav.shape[0] - chunk + 1, chunk):
+        window = np.concatenate([window[chunk:], wav[start : start + chunk]])
+        position += chunk
+        feats = torch.from_numpy(window).to(dev).view(1, -1)
+
+        s = time.perf_counter()
+        full = embedder.extractFeatures(feats, args.layer, args.finalProj == 1)[0]
+        fullTimes.append(time.perf_counter() - s)
+
+        s = time.perf_counter()
+        inc = incremental.extract(embedder, feats, position, args.layer, args.finalProj == 1)[0]
+        incrementalTimes.append(time.perf_counter() - s)
+
+        info = incremental.getIncrementalEmbedderInfo()
+        fullFrames = info["fullFrames"]
+        cnnFrames.append(info["cnnFrames"])
+        transformerFrames.append(info["transformerFrames"])
+
+        # 出力に使われる末尾部分で比較
+        a = full[-outputFrames:].float()
+        b = inc[-outputFrames:].float()
+        similarities.append(torch.nn.functional.cosine_similarity(a, b, dim=-1).cpu().numpy())
+
+    similarities = np.concatenate(similarities[1:]) if len(similarities) > 1 else np.concatenate(similarities)
+    results = {
+        "chunks": len(fullTimes),
+        "fullFrames": fullFrames,
+        "cnnFrames_mean": float(np.mean(cnnFrames[1:])),
+        "transformerFrames_mean": float(np.mean(transformerFrames[1:])),
+        "cnnFrames_reduction": float(fullFrames / max(1e-9, np.mean(cnnFrames[1:]))),
+        "transformerFrames_reduction": float(fullFrames / max(1e-9, np.mean(transformerFrames[1:]))),
+        "full_ms": float(np.mean(fullTimes[1:]) * 1000),
+        "incremental_ms": float(np.mean(incrementalTimes[1:]) * 1000),
+        "cosine_mean": float(np.mean(similarities)),
+        "cosine_p05": float(np.percentile(similarities, 5)),
+        "cosine_min": float(np.min(similarities)),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
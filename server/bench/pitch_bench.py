@@ -0,0 +1,99 @@
+"""
+■ pitch_bench
+- incremental pitch extraction と 窓全体のピッチ検出の比較 (harvest / dio)
+・RVCr2 と同じように convertSize の窓をチャンク毎にずらしながら f0 を計算する。
+・出力部分(窓の末尾 chunk + crossfade 分)の f0 の誤差(cent)、有声/無声の一致率、処理時間を出力する。
+
+使い方(server ディレクトリで実行):
+  python bench/pitch_bench.py --wav test.wav --f0Detector harvest --chunk 0.1 --extra 1.0
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import librosa  # NOQA
+
+from voice_changer.RVC.pitchExtractor.DioPitchExtractor import DioPitchExtractor  # NOQA
+from voice_changer.RVC.pitchExtractor.HarvestPitchExtractor import HarvestPitchExtractor  # NOQA
+
+WINDOW = 160
+
+
+def setupArgParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--wav", type=str, default="test.wav", help="input wav")
+    parser.add_argument("--f0Detector", type=str, default="harvest", help="harvest|dio")
+    parser.add_argument("--chunk", type=float, default=0.1, help="chunk size (sec)")
+    parser.add_argument("--extra", type=float, default=1.0, help="extraConvertSize (sec)")
+    parser.add_argument("--crossfade", type=float, default=0.05, help="crossfade + sola search size (sec)")
+    parser.add_argument("--margin", type=float, default=0.1, help="left context for incremental pitch extraction (sec)")
+    return parser
+
+
+def main():
+    parser = setupArgParser()
+    args, _ = parser.parse_known_args()
+
+    extractor = HarvestPitchExtractor() if args.f0Detector == "harvest" else DioPitchExtractor()
+    contextFrames = int(args.margin * 16000) // WINDOW
+
+    wav, _ = librosa.load(args.wav, sr=16000, mono=True)
+    chunk = int(args.chunk * 16000) // WINDOW * WINDOW
+    outputFrames = int((args.chunk + args.crossfade) * 16000) // WINDOW
+    convertSize = chunk + int((args.crossfade + args.extra) * 16000)
+    convertSize = convertSize + (WINDOW - convertSize % WINDOW) % WINDOW
+    featureSize = convertSize // WINDOW
+
+    window = np.zeros(convertSize, dtype=np.float32)
+    pitchf = np.zeros(featureSize)
+    cents = []
+    voicing = []
+    fullTimes = []
+    incrementalTimes = []
+    first = True
+    for start in range(0, wav.shape[0] - chunk + 1, chunk):
+        window = np.concatenate([window[chunk:], wav[start : start + chunk]])
+        pitchf = np.concatenate([pitchf[chunk // WINDOW :], np.zeros(chunk // WINDOW)])
+
+        s = time.perf_counter()
+        full = extractor.extractF0(window, 16000, WINDOW)[:featureSize]
+        fullTimes.append(time.perf_counter() - s)
+
+        s = time.perf_counter()
+        newFrames = featureSize if first else chunk // WINDOW + 2
+        _, pitchf = extractor.extractStream(window, pitchf, 0, 16000, WINDOW, newFrames, contextFrames)
+        incrementalTimes.append(time.perf_counter() - s)
+        if first:
+            first = False
+            continue
+
+        a = full[-outputFrames:]
+        b = pitchf[-outputFrames:]
+        voicing.append((a > 0) == (b > 0))
+        both = (a > 0) & (b > 0)
+        cents.append(np.abs(1200 * np.log2(b[both] / a[both])))
+
+    cents = np.concatenate(cents) if len(cents) > 0 else np.zeros(1)
+    voicing = np.concatenate(voicing) if len(voicing) > 0 else np.ones(1)
+    results = {
+        "f0Detector": args.f0Detector,
+        "chunks": len(fullTimes),
+        "full_ms": float(np.mean(fullTimes[1:]) * 1000),
+        "incremental_ms": float(np.mean(incrementalTimes[1:]) * 1000),
+        "speedup": float(np.mean(fullTimes[1:]) / max(1e-9, np.mean(incrementalTimes[1:]))),
+        "voicing_agreement": float(np.mean(voicing)),
+        "cent_err_mean": float(np.mean(cents)) if cents.shape[0] > 0 else 0.0,
+        "cent_err_p95": float(np.percentile(cents, 95)) if cents.shape[0] > 0 else 0.0,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
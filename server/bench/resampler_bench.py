@@ -0,0 +1,132 @@
+"""
+■ resampler_bench
+- StreamingResampler と resampy(チャンク毎) の比較
+・チャンク毎の処理時間(平均 / p95)
+・チャンク境界付近の誤差(信号全体を一度に変換した結果との差)
+  チャンク長が変換比で割り切れない場合、チャンク毎の変換は出力長の端数が積み重なって位置がずれていくので、
+  その分は interior_rms_err に出る。(境界だけを見たい場合は --chunk 3840 などの割り切れる長さを使う)
+
+使い方(server ディレクトリで実行):
+  python bench/resampler_bench.py --src 48000 --dst 16000 --chunk 4096
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from voice_changer.common.StreamingResampler import StreamingResampler  # NOQA
+
+try:
+    import resampy
+except ImportError:
+    resampy = None
+
+
+def setupArgParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", type=int, default=48000, help="source sampling rate")
+    parser.add_argument("--dst", type=int, default=16000, help="destination sampling rate")
+    parser.add_argument("--chunk", type=int, default=4096, help="chunk size (source samples)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the test signal")
+    parser.add_argument("--edge", type=int, default=32, help="samples around each chunk boundary used for the artifact measurement")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    return parser
+
+
+def generateSignal(sr: int, seconds: float, seed: int):
+    # 帯域内の正弦波の和 + 小さいノイズ
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sr * seconds)) / sr
+    wav = np.zeros_like(t)
+    for f in rng.uniform(80, 3000, 8):
+        wav += np.sin(2 * np.pi * f * t + rng.uniform(0, 2 * np.pi))
+    wav = wav / 8 * 0.5 + rng.normal(0, 0.01, t.shape[0])
+    return wav.astype(np.float32)
+
+
+def runChunked(func, wav: np.ndarray, chunk: int):
+    outs = []
+    times = []
+    for start in range(0, wav.shape[0] - chunk + 1, chunk):
+        s = time.perf_counter()
+        outs.append(func(wav[start : start + chunk]))
+        times.append(time.perf_counter() - s)
+    return np.concatenate(outs), np.array(times)
+
+
+def boundaryError(out: np.ndarray, reference: np.ndarray, boundaries: list[int], edge: int):
+    length = min(out.shape[0], reference.shape[0])
+    out = out[:length]
+    reference = reference[:length]
+
+    mask = np.zeros(length, dtype=bool)
+    for b in boundaries:
+        mask[max(0, b - edge) : min(length, b + edge)] = True
+    interior = ~mask
+    # 信号の先頭/末尾は除外
+    mask[: 4 * edge] = False
+    mask[-4 * edge :] = False
+    interior[: 4 * edge] = False
+    interior[-4 * edge :] = False
+
+    diff = out - reference
+    return {
+        "boundary_max_abs_err": float(np.max(np.abs(diff[mask]))) if mask.any() else 0.0,
+        "boundary_rms_err": float(np.sqrt(np.mean(diff[mask] ** 2))) if mask.any() else 0.0,
+        "interior_rms_err": float(np.sqrt(np.mean(diff[interior] ** 2))) if interior.any() else 0.0,
+    }
+
+
+def timeStats(times: np.ndarray):
+    return {
+        "mean_ms": float(np.mean(times) * 1000),
+        "p95_ms": float(np.percentile(times, 95) * 1000),
+        "max_ms": float(np.max(times) * 1000),
+    }
+
+
+def main():
+    parser = setupArgParser()
+    args, _ = parser.parse_known_args()
+
+    wav = generateSignal(args.src, args.seconds, args.seed)
+    ratio = args.dst / args.src
+    boundaries = [int(i * ratio) for i in range(args.chunk, wav.shape[0], args.chunk)]
+    usable = (wav.shape[0] // args.chunk) * args.chunk
+
+    results = {"src": args.src, "dst": args.dst, "chunk": args.chunk, "seconds": args.seconds}
+
+    # StreamingResampler
+    reference = StreamingResampler(args.src, args.dst).resample(wav[:usable])
+    streaming = StreamingResampler(args.src, args.dst)
+    streaming_out, times = runChunked(streaming.process, wav[:usable], args.chunk)
+    if streaming.filter is not None:
+        # process() は右側のフィルタ半幅分だけ遅れて出てくるので、末尾に無音を流して出し切る
+        tail = streaming.process(np.zeros(streaming.filter.taps + 1, dtype=np.float32))
+        streaming_out = np.concatenate([streaming_out, tail])
+    results["streaming"] = {**timeStats(times), **boundaryError(streaming_out, reference, boundaries, args.edge)}
+
+    stateless = StreamingResampler(args.src, args.dst)
+    stateless_out, times = runChunked(stateless.resample, wav[:usable], args.chunk)
+    results["stateless"] = {**timeStats(times), **boundaryError(stateless_out, reference, boundaries, args.edge)}
+
+    # resampy(チャンク毎)
+    if resampy is not None:
+        for filter in ["kaiser_fast", "kaiser_best"]:
+            resampy_reference = resampy.resample(wav[:usable], args.src, args.dst, filter=filter)
+            out, times = runChunked(lambda x: resampy.resample(x, args.src, args.dst, filter=filter), wav[:usable], args.chunk)
+            results[f"resampy_{filter}"] = {**timeStats(times), **boundaryError(out, resampy_reference, boundaries, args.edge)}
+    else:
+        results["resampy"] = "not installed"
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+■ streaming_bench
+- VoiceChangerManager.changeVoice をチャンク毎に呼び出す、end-to-end のストリーミングのベンチマーク
+・入力は決定的な合成音声(声帯パルス列 + フォルマント + 音節の包絡 + 無音区間)。同じ seed なら毎回同じ入力になる。
+・モデルは stub(bench/stub_model.py、重み無し)か、model_dir のスロット(--slot、実際のチェックポイント)。
+・チャンク毎に以下を記録し、p50 / p95 / p99 などを JSON で出力する。(--out でファイルにも書き出す)
+  changeVoice 全体、VoiceChangerV2 の main / post、モデルの stageTimes(RVC は pitch / feature / infer など)、
+  real time factor(処理時間 / チャンク長)、VAD で省略したチャンク数
+・メモリ: ピークの RSS。--tracemalloc を付けるとチャンク毎の Python のメモリ確保量(ピーク)も記録する。(その分遅くなる)
+・VoiceChangerManager は headless で作る。(オーディオデバイスのスレッドを起動せず、保存された設定も読み書きしない)
+
+使い方(server ディレクトリで実行):
+  python bench/streaming_bench.py --model stub --chunk 4096 --sr 48000
+  python bench/streaming_bench.py --model slot --slot 0 --gpu -1 --chunk 8192 --out result.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.signal import lfilter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from voice_changer.SessionManager import DEFAULT_SESSION  # NOQA
+from voice_changer.VoiceChangerManager import VoiceChangerManager  # NOQA
+from voice_changer.VoiceChangerParamsManager import VoiceChangerParamsManager  # NOQA
+from voice_changer.VoiceChangerV2 import VoiceChangerV2  # NOQA
+from voice_changer.utils.Metrics import processRssBytes  # NOQA
+from voice_changer.utils.VoiceChangerParams import VoiceChangerParams  # NOQA
+from stub_model import StubModel  # NOQA
+
+
+def setupArgParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="stub", help="stub|slot")
+    parser.add_argument("--slot", type=int, default=0, help="model slot index (--model slot)")
+    parser.add_argument("--gpu", type=int, default=-1, help="gpu id (-1: cpu)")
+    parser.add_argument("--stubCost", type=int, default=256, help="size of the matmul used as stub inference cost")
+    parser.add_argument("--stubSr", type=int, default=40000, help="processing sampling rate of the stub model")
+
+    parser.add_argument("--sr", type=int, default=48000, help="input/output sampling rate")
+    parser.add_argument("--chunk", type=int, default=4096, help="chunk size (samples at --sr)")
+    parser.add_argument("--seconds", type=float, default=20.0, help="length of the input")
+    parser.add_argument("--warmup", type=int, default=10, help="chunks excluded from the statistics")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the input")
+    parser.add_argument("--set", type=str, action="append", default=[], help="extra setting key=val (e.g. --set extraConvertSize=8192)")
+    parser.add_argument("--tracemalloc", action="store_true", help="record python allocations per chunk")
+    parser.add_argument("--out", type=str, default="", help="write the result json to this file")
+
+    parser.add_argument("--model_dir", type=str, default="model_dir", help="path to model files")
+    parser.add_argument("--content_vec_500", type=str, default="pretrain/checkpoint_best_legacy_500.pt")
+    parser.add_argument("--content_vec_500_onnx", type=str, default="pretrain/content_vec_500.onnx")
+    parser.add_argument("--hubert_base", type=str, default="pretrain/hubert_base.pt")
+    parser.add_argument("--hubert_base_jp", type=str, default="pretrain/rinna_hubert_base_jp.pt")
+    parser.add_argument("--hubert_soft", type=str, default="pretrain/hubert/hubert-soft-0d54a1f4.pt")
+    parser.add_argument("--whisper_tiny", type=str, default="pretrain/whisper_tiny.pt")
+    parser.add_argument("--nsf_hifigan", type=str, default="pretrain/nsf_hifigan/model")
+    parser.add_argument("--crepe_onnx_full", type=str, default="pretrain/crepe_onnx_full.onnx")
+    parser.add_argument("--crepe_onnx_tiny", type=str, default="pretrain/crepe_onnx_tiny.onnx")
+    parser.add_argument("--rmvpe", type=str, default="pretrain/rmvpe.pt")
+    parser.add_argument("--rmvpe_onnx", type=str, default="pretrain/rmvpe.onnx")
+    return parser
+
+
+def generateSpeechLike(sr: int, seconds: float, seed: int):
+    # 声帯パルス列(f0 は 100~250Hz でゆっくり変化) -> フォルマント(3つの共振) -> 音節(約4Hz)の包絡。ところどころ無音。
+    rng = np.random.default_rng(seed)
+    n = int(sr * seconds)
+    t = np.arange(n) / sr
+    f0 = 170 + 50 * np.sin(2 * np.pi * 0.3 * t) + 15 * np.sin(2 * np.pi * 5.5 * t)
+    phase = np.cumsum(f0 / sr)
+    source = (np.diff(np.floor(phase), prepend=0) > 0).astype(np.float64)
+    source += rng.normal(0, 0.02, n)  # 気息音
+
+    voice = np.zeros(n)
+    for formant, bandwidth in [(700, 130), (1220, 70), (2600, 160)]:
+        r = np.exp(-np.pi * bandwidth / sr)
+        theta = 2 * np.pi * formant / sr
+        voice += lfilter([1 - r], [1, -2 * r * np.cos(theta), r * r], source)
+
+    syllable = 0.5 * (1 - np.cos(2 * np.pi * 4 * t))
+    # 3 秒毎に 0.8 秒の無音(VAD の経路も通す)
+    pause = ((t % 3.0) > 2.2).astype(np.float64)
+    envelope = syllable * (1 - pause)
+    wav = voice * envelope
+    wav = wav / (np.max(np.abs(wav)) + 1e-9) * 0.5 + rng.normal(0, 0.001, n)
+    return (wav * 32767).astype(np.int16)
+
+
+def stats(values: list[float]):
+    if len(values) == 0:
+        return {}
+    v = np.array(values)
+    return {
+        "mean": float(np.mean(v)),
+        "p50": float(np.percentile(v, 50)),
+        "p95": float(np.percentile(v, 95)),
+        "p99": float(np.percentile(v, 99)),
+        "max": float(np.max(v)),
+    }
+
+
+def sessionVoiceChanger(manager: VoiceChangerManager):
+    # 変換に使われた VoiceChangerV2(セッション用のコピー)
+    session = manager.sessionManager.sessions.get(DEFAULT_SESSION)
+    return session.voiceChanger if session is not None and session.voiceChanger is not None else manager.voiceChanger
+
+
+def main():
+    parser = setupArgParser()
+    args, _ = parser.parse_known_args()
+
+    params = VoiceChangerParams(
+        model_dir=args.model_dir,
+        content_vec_500=args.content_vec_500,
+        content_vec_500_onnx=args.content_vec_500_onnx,
+        content_vec_500_onnx_on=False,
+        hubert_base=args.hubert_base,
+        hubert_base_jp=args.hubert_base_jp,
+        hubert_soft=args.hubert_soft,
+        nsf_hifigan=args.nsf_hifigan,
+        crepe_onnx_full=args.crepe_onnx_full,
+        crepe_onnx_tiny=args.crepe_onnx_tiny,
+        rmvpe=args.rmvpe,
+        rmvpe_onnx=args.rmvpe_onnx,
+        sample_mode="",
+        whisper_tiny=args.whisper_tiny,
+    )
+    VoiceChangerParamsManager.get_instance().setParams(params)
+    manager = VoiceChangerManager(params, headless=True)
+
+    loadStart = time.perf_counter()
+    if args.model == "stub":
+        manager.voiceChangerModel = StubModel(args.stubSr, args.stubCost, args.seed)
+        manager.voiceChanger = VoiceChangerV2(params)
+        manager.voiceChanger.setModel(manager.voiceChangerModel)
+    else:
+        manager.generateVoiceChanger(args.slot)
+        if manager.voiceChanger is None:
+            print(f"slot {args.slot} could not be loaded")
+            sys.exit(1)
+        manager.voiceChanger.update_settings("gpu", args.gpu)  # RVC はここでパイプラインを作る
+    loadTime = time.perf_counter() - loadStart
+
+    manager.voiceChanger.update_settings("inputSampleRate", args.sr)
+    manager.voiceChanger.update_settings("outputSampleRate", args.sr)
+    for item in args.set:
+        key, val = item.split("=", 1)
+        manager.voiceChanger.update_settings(key, val)
+
+    wav = generateSpeechLike(args.sr, args.seconds, args.seed)
+    chunkTime = args.chunk / args.sr
+
+    records: dict[str, list[float]] = {"changeVoice": [], "main": [], "post": [], "rtf": []}
+    allocations: list[float] = []
+    skipped = 0
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    for i, start in enumerate(range(0, wav.shape[0] - args.chunk + 1, args.chunk)):
+        chunk = wav[start : start + args.chunk]
+        skippedBefore = sessionVoiceChanger(manager).voiceActivityGate.skippedChunks
+        if args.tracemalloc:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+
+        s = time.perf_counter()
+        _, perf = manager.changeVoice(chunk)
+        elapsed = time.perf_counter() - s
+
+        if i < args.warmup:
+            continue
+        records["changeVoice"].append(elapsed * 1000)
+        records["rtf"].append(elapsed / chunkTime)
+        if len(perf) == 3:
+            records["main"].append(perf[1] * 1000)
+            records["post"].append(perf[2] * 1000)
+        if args.tracemalloc:
+            allocations.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+
+        voiceChanger = sessionVoiceChanger(manager)
+        if voiceChanger.voiceActivityGate.skippedChunks > skippedBefore:
+            skipped += 1
+            continue
+        # モデルの各ステージ(VAD で省略したチャンクは含めない)
+        model = voiceChanger.voiceChanger
+        stageTimes = getattr(getattr(model, "pipeline", None), "stageTimes", None) or getattr(model, "stageTimes", {})
+        for key, val in stageTimes.items():
+            records.setdefault(f"model.{key}", []).append(float(val))
+
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    measured = len(records["changeVoice"])
+    result = {
+        "config": {
+            "model": args.model if args.model == "stub" else f"slot{args.slot}",
+            "gpu": args.gpu,
+            "sr": args.sr,
+            "chunk": args.chunk,
+            "chunkMs": chunkTime * 1000,
+            "seconds": args.seconds,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "settings": args.set,
+        },
+        "loadTime": loadTime,
+        "chunks": measured,
+        "vadSkipped": skipped,
+        "latencyMs": {key: stats(val) for key, val in records.items() if key != "rtf"},
+        "rtf": stats(records["rtf"]),
+        "memory": {
+            "peakRssMB": processRssBytes(peak=True) / 1024 / 1024,
+            "allocPerChunkKB": stats(allocations),
+        },
+    }
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out != "":
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
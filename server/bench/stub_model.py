@@ -0,0 +1,106 @@
+"""
+■ stub_model
+- streaming_bench 用の軽いモデル(重みを読み込まない)
+・VoiceChangerV2 から見ると RVCr2 と同じように振る舞う。
+  (入力のリサンプル、extraConvertSize 込みの窓のリングバッファ、SOLA 用に block + crossfade + sola search 分を返す、
+   skipInference、セッション用の cloneStream / getStreamState / setStreamState)
+・変換は簡単なフィルタ(一次のローパス)だけ。推論の重さは --stubCost で指定した大きさの行列積で代用する。
+  (VoiceChangerV2 / SessionManager / VAD などモデル以外の部分のオーバーヘッドを見るため)
+"""
+
+from dataclasses import dataclass, field
+import copy
+import time
+
+import numpy as np
+from scipy.signal import lfilter
+
+from voice_changer.common.RingBuffer import RingBuffer
+from voice_changer.common.StreamingResampler import StreamingResampler
+
+
+@dataclass
+class StubSettings:
+    gpu: int = -1
+    extraConvertSize: int = 1024 * 4
+    silentThreshold: float = 0.00001
+    cost: int = 0  # 推論の代わりの行列積のサイズ(0: なし)
+
+    intData: list[str] = field(default_factory=lambda: ["gpu", "extraConvertSize", "cost"])
+    floatData: list[str] = field(default_factory=lambda: ["silentThreshold"])
+    strData: list[str] = field(default_factory=lambda: [])
+
+
+class StubModel:
+    def __init__(self, processingSampleRate: int = 40000, cost: int = 0, seed: int = 0):
+        self.voiceChangerType = "Stub"
+        self.settings = StubSettings(cost=cost)
+        self.processingSampleRate = processingSampleRate
+        self.weight = np.random.default_rng(seed).standard_normal((cost, cost)).astype(np.float32) if cost > 0 else None
+        self.stageTimes: dict[str, float] = {}
+        self.audio_buffer: RingBuffer | None = None
+        self.inputSampleRate = 48000
+        self.outputSampleRate = 48000
+
+    def setSamplingRate(self, inputSampleRate, outputSampleRate):
+        self.inputSampleRate = inputSampleRate
+        self.outputSampleRate = outputSampleRate
+        self.inputResampler = StreamingResampler(inputSampleRate, self.processingSampleRate)
+        self.outputResampler = StreamingResampler(self.processingSampleRate, outputSampleRate)
+
+    def get_processing_sampling_rate(self):
+        return self.processingSampleRate
+
+    def get_info(self):
+        return {"voiceChangerType": self.voiceChangerType, "cost": self.settings.cost}
+
+    def update_settings(self, key: str, val: int | float | str):
+        if key in self.settings.intData:
+            setattr(self.settings, key, int(val))
+        elif key in self.settings.floatData:
+            setattr(self.settings, key, float(val))
+        else:
+            return False
+        return True
+
+    def cloneStream(self):
+        clone = copy.copy(self)
+        clone.settings = copy.copy(self.settings)
+        clone.stageTimes = {}
+        return clone
+
+    def getStreamState(self):
+        return {"audio_buffer": self.audio_buffer, "inputResampler": self.inputResampler}
+
+    def setStreamState(self, state: dict | None):
+        self.audio_buffer = state["audio_buffer"] if state is not None else None
+        self.inputResampler = state["inputResampler"] if state is not None else StreamingResampler(self.inputSampleRate, self.processingSampleRate)
+
+    def skipInference(self, receivedData):
+        inputSize = self.inputResampler.skip(receivedData.shape[0])
+        if self.audio_buffer is not None:
+            self.audio_buffer.append_zeros(inputSize)
+
+    def inference(self, receivedData, crossfade_frame: int, sola_search_frame: int):
+        start = time.perf_counter()
+        data = self.inputResampler.process(receivedData)
+        ratio = self.processingSampleRate / self.inputSampleRate
+        convertSize = data.shape[0] + int((crossfade_frame + sola_search_frame + self.settings.extraConvertSize) * ratio)
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
+        else:
+            self.audio_buffer.resize(convertSize)
+        self.audio_buffer.append(data.astype(np.float32))
+        audio = self.audio_buffer.view()
+        self.stageTimes["pre"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        if self.weight is not None:
+            x = np.resize(audio, (self.weight.shape[0], max(1, audio.shape[0] // self.weight.shape[0])))
+            np.dot(self.weight, x)
+        out = lfilter([0.5], [1.0, -0.5], audio)
+        self.stageTimes["infer"] = (time.perf_counter() - start) * 1000
+
+        # SOLA に使う分(extraConvertSize を除いた末尾)だけ出力のサンプリングレートにする
+        outSize = int((convertSize - self.settings.extraConvertSize * ratio))
+        return self.outputResampler.resample(out[-outSize:])
@@ -0,0 +1,71 @@
+"""
+■ tracer_bench
+- voice_changer/utils/Tracer.py の計測自体のコスト
+・span(開始と終了)と lap 一回あたりの時間を測り、一チャンクあたりの計測の回数(--spans, --laps)から
+  チャンクの長さ(--chunk / --sr)に対する割合を出す。(目安: 1% 未満)
+・既定の回数は RVC の一チャンク分(vc.main, vc.post, rvc.exec, rvc.extract, rvc.pitch, rvc.feature の span と lap 9 回)
+
+使い方(server ディレクトリで実行):
+  python bench/tracer_bench.py --chunk 4096 --sr 48000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from voice_changer.utils.Tracer import Tracer  # NOQA
+
+
+def setupArgParser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--spans", type=int, default=6, help="spans per chunk")
+    parser.add_argument("--laps", type=int, default=9, help="laps per chunk")
+    parser.add_argument("--chunk", type=int, default=4096, help="chunk size (samples)")
+    parser.add_argument("--sr", type=int, default=48000)
+    return parser
+
+
+def main():
+    args = setupArgParser().parse_args()
+    tracer = Tracer()
+
+    start = time.perf_counter_ns()
+    for _ in range(args.iterations):
+        with tracer.span("bench.span"):
+            pass
+    spanNs = (time.perf_counter_ns() - start) / args.iterations
+
+    with tracer.span("bench.lap") as t:
+        start = time.perf_counter_ns()
+        for _ in range(args.iterations):
+            t.lap("x")
+        lapNs = (time.perf_counter_ns() - start) / args.iterations
+
+    start = time.perf_counter_ns()
+    tracer.getTracerInfo()
+    infoNs = time.perf_counter_ns() - start
+
+    chunkNs = args.chunk / args.sr * 1_000_000_000
+    perChunkNs = spanNs * args.spans + lapNs * args.laps
+    print(
+        json.dumps(
+            {
+                "spanNs": spanNs,
+                "lapNs": lapNs,
+                "perChunkUs": perChunkNs / 1000,
+                "chunkMs": chunkNs / 1_000_000,
+                "overheadPercent": perChunkNs / chunkNs * 100,
+                "getTracerInfoUs": infoNs / 1000,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
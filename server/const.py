@@ -93,6 +93,12 @@ PitchExtractorType: TypeAlias = Literal[
     "fcpe",
 ]
 
+SolaEngineType: TypeAlias = Literal[
+    "time",
+    "fft",
+    "torch",
+]
+
 ServerAudioDeviceType: TypeAlias = Literal["audioinput", "audiooutput"]
 
 RVCSampleMode: TypeAlias = Literal[
@@ -0,0 +1,66 @@
+"""
+■ audio_codec
+- クライアントとやり取りする音声フレーム(リトルエンディアンの int16 PCM)の変換
+・decode_audio: 受信したバッファを np.frombuffer でそのまま int16 の配列として見る。(コピーしない)
+  返る配列は読み取り専用。(変換処理は入力を書き換えないこと)
+・encode_audio: int16 の配列を tobytes で一回だけコピーして送信用の bytes にする。
+・struct.pack / struct.unpack でサンプル毎に Python の int を作っていた処理の置き換え。
+・生の WebSocket(/stream)用に、固定長ヘッダ付きのフレームの変換も持つ。
+  リクエスト: [REQUEST_HEADER][PCM]  レスポンス: [RESPONSE_HEADER][PCM]
+  PCM はヘッダの format で int16 (FORMAT_INT16) か float32 (FORMAT_FLOAT32, -1.0 ~ 1.0)。
+"""
+
+import struct
+import numpy as np
+
+PCM_DTYPE = np.dtype("<i2")
+FLOAT_DTYPE = np.dtype("<f4")
+
+FORMAT_INT16 = 0
+FORMAT_FLOAT32 = 1
+
+FLAG_DROPPED = 1  # レスポンス: 古くなったので変換せずに捨てた(PCM なし)
+
+# timestamp(クライアントの時刻 ms, そのまま返す), seq, format, flags
+REQUEST_HEADER = struct.Struct("<dIHH")
+# timestamp, seq, format, flags, perf x 3 (changeVoice の perf と同じ値, 秒)
+RESPONSE_HEADER = struct.Struct("<dIHH3f")
+
+
+def decode_audio(data: bytes | bytearray | memoryview) -> np.ndarray:
+    # 端数のバイトは無視する
+    return np.frombuffer(data, dtype=PCM_DTYPE, count=len(data) // PCM_DTYPE.itemsize)
+
+
+def encode_audio(audio: np.ndarray) -> bytes:
+    return np.asarray(audio).astype(PCM_DTYPE, copy=False).tobytes()
+
+
+def decode_pcm(data: bytes | bytearray | memoryview, format: int) -> np.ndarray:
+    # format の PCM を int16 の配列にする(int16 ならコピーしない)
+    if format == FORMAT_FLOAT32:
+        audio = np.frombuffer(data, dtype=FLOAT_DTYPE, count=len(data) // FLOAT_DTYPE.itemsize)
+        return np.clip(audio * 32768.0, -32768, 32767).astype(np.int16)
+    elif format == FORMAT_INT16:
+        return decode_audio(data)
+    raise ValueError(f"unknown audio format: {format}")
+
+
+def encode_pcm(audio: np.ndarray, format: int) -> bytes:
+    if format == FORMAT_FLOAT32:
+        return (np.asarray(audio).astype(FLOAT_DTYPE) / 32768.0).astype(FLOAT_DTYPE, copy=False).tobytes()
+    return encode_audio(audio)
+
+
+def decode_frame(data: bytes) -> tuple[float, int, int, np.ndarray]:
+    # (timestamp, seq, format, int16 の音声) を返す
+    timestamp, seq, format, _ = REQUEST_HEADER.unpack_from(data)
+    return timestamp, seq, format, decode_pcm(memoryview(data)[REQUEST_HEADER.size :], format)
+
+
+def encode_frame(timestamp: float, seq: int, format: int, audio: np.ndarray | None, perf: list[float] | None = None, flags: int = 0) -> bytes:
+    perf = (list(perf) + [0, 0, 0])[:3] if perf is not None else [0, 0, 0]
+    header = RESPONSE_HEADER.pack(timestamp, seq, format, flags, *perf)
+    if audio is None:
+        return header
+    return header + encode_pcm(audio, format)
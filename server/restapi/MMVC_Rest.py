@@ -12,6 +12,8 @@ from voice_changer.VoiceChangerManager import VoiceChangerManager
 
 from restapi.MMVC_Rest_Hello import MMVC_Rest_Hello
 from restapi.MMVC_Rest_VoiceChanger import MMVC_Rest_VoiceChanger
+from restapi.MMVC_Rest_Stream import MMVC_Rest_Stream
+from restapi.MMVC_Rest_Metrics import MMVC_Rest_Metrics
 from restapi.MMVC_Rest_Fileuploader import MMVC_Rest_Fileuploader
 from const import MODEL_DIR_STATIC, UPLOAD_DIR, getFrontendPath, TMP_DIR
 from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
@@ -183,6 +185,10 @@ class MMVC_Rest:
             app_fastapi.include_router(restHello.router)
             restVoiceChanger = MMVC_Rest_VoiceChanger(voiceChangerManager)
             app_fastapi.include_router(restVoiceChanger.router)
+            restStream = MMVC_Rest_Stream(voiceChangerManager)
+            app_fastapi.include_router(restStream.router)
+            restMetrics = MMVC_Rest_Metrics(voiceChangerManager)
+            app_fastapi.include_router(restMetrics.router)
             fileUploader = MMVC_Rest_Fileuploader(voiceChangerManager)
             app_fastapi.include_router(fileUploader.router)
 
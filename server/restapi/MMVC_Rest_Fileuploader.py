@@ -57,9 +57,9 @@ class MMVC_Rest_Fileuploader:
         except Exception as e:
             print("[Voice Changer] get_info ex:", e)
 
-    def get_performance(self):
+    def get_performance(self, stages: bool = False):
         try:
-            info = self.voiceChangerManager.get_performance()
+            info = self.voiceChangerManager.get_performance(stages)
             json_compatible_item_data = jsonable_encoder(info)
             return JSONResponse(content=json_compatible_item_data)
         except Exception as e:
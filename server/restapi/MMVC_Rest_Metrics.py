@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from voice_changer.VoiceChangerManager import VoiceChangerManager
+
+# Prometheus のテキスト形式(version 0.0.4)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MMVC_Rest_Metrics:
+    def __init__(self, voiceChangerManager: VoiceChangerManager):
+        self.voiceChangerManager = voiceChangerManager
+        self.router = APIRouter()
+        self.router.add_api_route("/metrics", self.get_metrics, methods=["GET"])
+        self.router.add_api_route("/trace", self.get_trace, methods=["GET"])
+
+    def get_metrics(self):
+        return PlainTextResponse(content=self.voiceChangerManager.get_metrics(), media_type=CONTENT_TYPE)
+
+    def get_trace(self):
+        # update_settings で traceRecorder を 1 にしてから取得する。chrome://tracing や ui.perfetto.dev で開ける
+        return JSONResponse(content=self.voiceChangerManager.get_trace(), headers={"Content-Disposition": 'attachment; filename="trace.json"'})
@@ -0,0 +1,104 @@
+"""
+■ MMVC_Rest_Stream
+- 生のバイナリフレームで音声をやり取りする WebSocket(/stream)
+・socket.io(engine.io + msgpack のフレーム)や /test(base64 の JSON)より一チャンクあたりのオーバーヘッドが小さい。
+  ネイティブのクライアント(client/python/vc_client.py --ws など)向け。
+・フレームの形式は mods.audio_codec を参照。(固定長ヘッダ + int16 / float32 の PCM)
+・受信と変換は別のタスク。受信したフレームは maxQueue 件までのキューに積み、溢れたら一番古いフレームを捨てる。
+  キューで staleAfter 秒以上待ったフレームも捨てる。捨てたフレームには FLAG_DROPPED を立てたヘッダだけを返す。
+・変換は socket.io と同じく VoiceChangerManager.conversionExecutor で実行する。(接続毎に一つのセッション)
+・テキストのメッセージ {"key": ..., "val": ...} はこの接続だけの設定の上書き。(update_session_settings の結果を JSON で返す)
+"""
+
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from mods.audio_codec import FLAG_DROPPED, REQUEST_HEADER, decode_frame, encode_frame
+from mods.log_control import VoiceChangaerLogger
+from voice_changer.VoiceChangerManager import VoiceChangerManager
+from voice_changer.utils.Metrics import MetricsRegistry
+from voice_changer.utils.Tracer import Tracer
+
+logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
+metrics = MetricsRegistry.get_instance()
+overflowCounter = metrics.counter("vc_dropped_chunks_total", "dropped chunks", reason="stream_overflow")
+staleCounter = metrics.counter("vc_dropped_chunks_total", "dropped chunks", reason="stream_stale")
+
+
+class MMVC_Rest_Stream:
+    def __init__(self, voiceChangerManager: VoiceChangerManager, maxQueue: int = 4, staleAfter: float = 0.5):
+        self.voiceChangerManager = voiceChangerManager
+        self.maxQueue = maxQueue
+        self.staleAfter = staleAfter
+        self.router = APIRouter()
+        self.router.add_api_websocket_route("/stream", self.stream)
+
+    async def stream(self, websocket: WebSocket):
+        await websocket.accept()
+        sid = f"ws-{uuid.uuid4().hex[:8]}"
+        logger.info(f"[Voice Changer] stream connected: {sid}")
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.maxQueue)
+        sendLock = asyncio.Lock()  # 受信側(捨てたフレームの通知)と変換側の送信が混ざらないようにする
+        worker = asyncio.create_task(self._convert(websocket, sid, queue, sendLock))
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    if queue.full():
+                        # 変換が追いついていないので一番古いフレームを捨てる
+                        overflowCounter.inc()
+                        await self._sendDropped(websocket, queue.get_nowait()[0], sendLock)
+                    queue.put_nowait((message["bytes"], time.perf_counter()))
+                elif message.get("text") is not None:
+                    req = json.loads(message["text"])
+                    info = self.voiceChangerManager.update_session_settings(sid, str(req["key"]), req["val"])
+                    async with sendLock:
+                        await websocket.send_text(json.dumps(info))
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning(f"[Voice Changer] stream {sid} closed: {e}")
+        finally:
+            worker.cancel()
+            self.voiceChangerManager.remove_session(sid)
+            logger.info(f"[Voice Changer] stream disconnected: {sid}")
+
+    async def _convert(self, websocket: WebSocket, sid: str, queue: asyncio.Queue, sendLock: asyncio.Lock):
+        try:
+            while True:
+                data, receivedAt = await queue.get()
+                if time.perf_counter() - receivedAt > self.staleAfter:
+                    staleCounter.inc()
+                    await self._sendDropped(websocket, data, sendLock)
+                    continue
+
+                start = time.perf_counter_ns()
+                timestamp, seq, format, audio = decode_frame(data)
+                decoded = time.perf_counter_ns()
+                res = await self.voiceChangerManager.conversionExecutor.submit(sid, self.voiceChangerManager.changeVoice, audio, sid)
+                if res is None:  # セッションの in-flight の上限(ConversionExecutor で数えている)
+                    await self._sendDropped(websocket, data, sendLock)
+                    continue
+                perf = res[1] if len(res) == 2 else [0, 0, 0]
+                converted = time.perf_counter_ns()
+                async with sendLock:
+                    await websocket.send_bytes(encode_frame(timestamp, seq, format, res[0], perf))
+                tracer.record("transport", decoded - start + time.perf_counter_ns() - converted)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[Voice Changer] stream {sid} conversion failed: {e}")
+            await websocket.close()
+
+    async def _sendDropped(self, websocket: WebSocket, data: bytes, sendLock: asyncio.Lock):
+        timestamp, seq, format, _ = REQUEST_HEADER.unpack_from(data)
+        async with sendLock:
+            await websocket.send_bytes(encode_frame(timestamp, seq, format, None, flags=FLAG_DROPPED))
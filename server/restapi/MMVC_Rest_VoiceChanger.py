@@ -1,15 +1,22 @@
 import base64
-import struct
-import numpy as np
+import threading
+import time
 import traceback
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
+from mods.audio_codec import FORMAT_FLOAT32, FORMAT_INT16, decode_audio, decode_pcm, encode_audio, encode_pcm
+from voice_changer.SessionManager import DEFAULT_SESSION
 from voice_changer.VoiceChangerManager import VoiceChangerManager
+from voice_changer.common.StreamingResampler import StreamingResampler
+from voice_changer.utils.Tracer import Tracer
 from pydantic import BaseModel
-import threading
+
+tracer = Tracer.get_instance()
+
+AUDIO_FORMATS = {"int16": FORMAT_INT16, "float32": FORMAT_FLOAT32}
 
 
 class VoiceModel(BaseModel):
@@ -22,31 +29,24 @@ class MMVC_Rest_VoiceChanger:
         self.voiceChangerManager = voiceChangerManager
         self.router = APIRouter()
         self.router.add_api_route("/test", self.test, methods=["POST"])
+        self.router.add_api_route("/convert", self.convert, methods=["POST"])
 
-        self.tlock = threading.Lock()
+        # /convert で X-Sample-Rate が変換のサンプリングレートと違う場合のセッション毎のリサンプラ (入力用, 出力用)
+        self.resamplers: dict[str, tuple[StreamingResampler, StreamingResampler]] = {}
+        self.resamplerAccess: dict[str, float] = {}  # 最後に使った時刻。SessionManager の ttl の間使われなかったら捨てる
+        self.resamplerLock = threading.Lock()  # 別のセッションの変換が同時に触るので
 
     def test(self, voice: VoiceModel):
+        # 同じセッション(DEFAULT_SESSION)の要求は changeVoice の中で順番に処理される
         try:
             timestamp = voice.timestamp
             buffer = voice.buffer
             wav = base64.b64decode(buffer)
 
-            # if wav == 0:
-            #     samplerate, data = read("dummy.wav")
-            #     unpackedData = data
-            # else:
-            #     unpackedData = np.array(
-            #         struct.unpack("<%sh" % (len(wav) // struct.calcsize("<h")), wav)
-            #     )
-
-            unpackedData = np.array(struct.unpack("<%sh" % (len(wav) // struct.calcsize("<h")), wav)).astype(np.int16)
-            # print(f"[REST] unpackedDataType {unpackedData.dtype}")
-
-            self.tlock.acquire()
+            unpackedData = decode_audio(wav)
             changedVoice = self.voiceChangerManager.changeVoice(unpackedData)
-            self.tlock.release()
 
-            changedVoiceBase64 = base64.b64encode(changedVoice[0]).decode("utf-8")
+            changedVoiceBase64 = base64.b64encode(encode_audio(changedVoice[0])).decode("utf-8")
             data = {"timestamp": timestamp, "changedVoiceBase64": changedVoiceBase64}
 
             json_compatible_item_data = jsonable_encoder(data)
@@ -55,5 +55,92 @@ class MMVC_Rest_VoiceChanger:
         except Exception as e:
             print("REQUEST PROCESSING!!!! EXCEPTION!!!", e)
             print(traceback.format_exc())
-            self.tlock.release()
             return str(e)
+
+    async def convert(self, request: Request):
+        # body: 生の PCM (リトルエンディアン, モノラル)
+        # header: X-Audio-Format(int16 | float32, 省略時 int16), X-Sample-Rate(省略時 変換のサンプリングレート), X-Session-Id(省略時 default)
+        # response: 同じ形式 / サンプリングレートの PCM。X-Perf に changeVoice の perf(秒)をカンマ区切りで返す
+        formatName = request.headers.get("x-audio-format", "int16")
+        if formatName not in AUDIO_FORMATS:
+            return JSONResponse(status_code=400, content={"error": f"unknown X-Audio-Format: {formatName}"})
+        format = AUDIO_FORMATS[formatName]
+        sampleRateHeader = request.headers.get("x-sample-rate", "0")
+        try:
+            sampleRate = int(sampleRateHeader)
+        except ValueError:
+            sampleRate = -1
+        if sampleRate < 0:
+            return JSONResponse(status_code=400, content={"error": f"invalid X-Sample-Rate: {sampleRateHeader}"})
+        sid = request.headers.get("x-session-id", DEFAULT_SESSION)
+
+        try:
+            start = time.perf_counter_ns()
+            body = await request.body()
+            audio = decode_pcm(body, format)
+            decoded = time.perf_counter_ns()
+            if self.voiceChangerManager.voiceChanger is None:
+                sampleRate = 0  # モデル未選択(changeVoice は無音を返す)
+
+            # リサンプラは実行が決まってから(submit の中で)通す。上限で断ったチャンクで履歴が進まないように
+            res = await self.voiceChangerManager.conversionExecutor.submit(sid, self._convertChunk, sid, audio, sampleRate)
+            if res is None:  # セッションの in-flight の上限
+                return Response(status_code=503, headers={"Retry-After": "0"})
+            changedVoice, perf = res
+            converted = time.perf_counter_ns()
+
+            headers = {
+                "X-Audio-Format": formatName,
+                "X-Perf": ",".join([str(float(x)) for x in perf]),
+            }
+            if sampleRate > 0:
+                headers["X-Sample-Rate"] = str(sampleRate)
+            content = encode_pcm(changedVoice, format)
+            tracer.record("transport", decoded - start + time.perf_counter_ns() - converted)  # 応答の送信は含まない
+            return Response(content=content, media_type="application/octet-stream", headers=headers)
+
+        except Exception as e:
+            print("REQUEST PROCESSING!!!! EXCEPTION!!!", e)
+            print(traceback.format_exc())
+            return JSONResponse(status_code=500, content={"error": str(e)})
+
+    def _convertChunk(self, sid: str, audio, sampleRate: int):
+        # 変換用のスレッドで実行される。同じセッションのチャンクは ConversionExecutor が順番に実行する
+        if sampleRate > 0:
+            audio = self._resampleInput(sid, audio, sampleRate)
+        res = self.voiceChangerManager.changeVoice(audio, sid)
+        changedVoice, perf = res[0], res[1] if len(res) == 2 else []
+        if sampleRate > 0:
+            changedVoice = self._resampleOutput(sid, changedVoice, sampleRate)
+        return changedVoice, perf
+
+    def _getResamplers(self, sid: str, sampleRate: int):
+        settings = self.voiceChangerManager.voiceChanger.settings
+        now = time.time()
+        with self.resamplerLock:
+            # 長い間使われていないセッションの分は消しておく。
+            # (SessionManager にまだ登録されていないだけのセッション(最初のチャンクを変換中)を消さないように、セッションの有無ではなく時刻で判断する)
+            ttl = self.voiceChangerManager.sessionManager.ttl
+            for key in [key for key, lastAccess in self.resamplerAccess.items() if key != sid and now - lastAccess > ttl]:
+                self.resamplers.pop(key, None)
+                self.resamplerAccess.pop(key, None)
+            self.resamplerAccess[sid] = now
+
+            inputResampler, outputResampler = self.resamplers.get(sid, (None, None))
+            if inputResampler is None or inputResampler.isFor(sampleRate, settings.inputSampleRate) is False or outputResampler.isFor(settings.outputSampleRate, sampleRate) is False:
+                inputResampler = StreamingResampler(sampleRate, settings.inputSampleRate)
+                outputResampler = StreamingResampler(settings.outputSampleRate, sampleRate)
+                self.resamplers[sid] = (inputResampler, outputResampler)
+            return inputResampler, outputResampler
+
+    def _resampleInput(self, sid: str, audio, sampleRate: int):
+        inputResampler, _ = self._getResamplers(sid, sampleRate)
+        if inputResampler.filter is None:
+            return audio
+        return inputResampler.process(audio.astype("float32")).clip(-32768, 32767).astype("int16")
+
+    def _resampleOutput(self, sid: str, audio, sampleRate: int):
+        _, outputResampler = self._getResamplers(sid, sampleRate)
+        if outputResampler.filter is None:
+            return audio
+        return outputResampler.process(audio.astype("float32")).clip(-32768, 32767).astype("int16")
@@ -1,31 +1,42 @@
-import struct
 from datetime import datetime
+import time
 import numpy as np
 import socketio
+from mods.audio_codec import decode_audio, encode_audio
+from sio.MMVC_Telemetry import MMVC_Telemetry
 from voice_changer.VoiceChangerManager import VoiceChangerManager
+from voice_changer.utils.Tracer import Tracer
 
 import asyncio
 
+# サーバーオーディオの performance 通知に付けるダミーの音声(クライアントの response の形式に合わせる)
+DUMMY_AUDIO = encode_audio(np.zeros(1).astype(np.int16))
+
+tracer = Tracer.get_instance()
+
 
 class MMVC_Namespace(socketio.AsyncNamespace):
     sid: int = 0
 
     async def emitTo(self, data):
         timestamp = 0
-        audio1 = np.zeros(1).astype(np.int16)
-        bin = struct.pack("<%sh" % len(audio1), *audio1)
         perf = data
 
-        await self.emit("response", [timestamp, bin, perf], to=self.sid)
+        await self.emit("response", [timestamp, DUMMY_AUDIO, perf], to=self.sid)
+        self.stageTelemetry.publish(timestamp)
 
-    def emit_coroutine(self, data):
-        asyncio.run(self.emitTo(data))
+    async def emitStageStats(self, _):
+        # ステージ毎の統計。集計は送る直前に一回だけ行う
+        # 統計はサーバー全体のものなので、最後に接続したクライアントだけでなく namespace の全クライアントに送る
+        await self.emit("stage_stats", tracer.getStageInfo())
 
     def __init__(self, namespace: str, voiceChangerManager: VoiceChangerManager):
         super().__init__(namespace)
         self.voiceChangerManager = voiceChangerManager
-        # self.voiceChangerManager.voiceChanger.emitTo = self.emit_coroutine
-        self.voiceChangerManager.setEmitTo(self.emit_coroutine)
+        # サーバーオーディオの処理スレッドからはキューに積むだけ。送信はイベントループで行う
+        self.telemetry = MMVC_Telemetry(self.emitTo)
+        self.stageTelemetry = MMVC_Telemetry(self.emitStageStats, minInterval=1.0, maxSize=1)
+        self.voiceChangerManager.setEmitTo(self.telemetry.publish)
 
     @classmethod
     def get_instance(cls, voiceChangerManager: VoiceChangerManager):
@@ -35,6 +46,8 @@ class MMVC_Namespace(socketio.AsyncNamespace):
 
     def on_connect(self, sid, environ):
         self.sid = sid
+        self.telemetry.bind(asyncio.get_running_loop())
+        self.stageTelemetry.bind(asyncio.get_running_loop())
         print("[{}] connet sid : {}".format(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), sid))
         pass
 
@@ -47,14 +60,28 @@ class MMVC_Namespace(socketio.AsyncNamespace):
             print(data)
             await self.emit("response", [timestamp, 0], to=sid)
         else:
-            unpackedData = np.array(struct.unpack("<%sh" % (len(data) // struct.calcsize("<h")), data)).astype(np.int16)
+            start = time.perf_counter_ns()
+            unpackedData = decode_audio(data)
+            decoded = time.perf_counter_ns()
 
-            res = self.voiceChangerManager.changeVoice(unpackedData)
+            # 変換はイベントループの外(ConversionExecutor のスレッド)で実行する
+            res = await self.voiceChangerManager.conversionExecutor.submit(sid, self.voiceChangerManager.changeVoice, unpackedData, sid)
+            if res is None:  # 処理が追いついていないので、このチャンクは変換せずに無音を返す
+                res = (np.zeros(unpackedData.shape[0], dtype=np.int16), [0, 0, 0])
             audio1 = res[0]
             perf = res[1] if len(res) == 2 else [0, 0, 0]
-            bin = struct.pack("<%sh" % len(audio1), *audio1)
+            converted = time.perf_counter_ns()
+            bin = encode_audio(audio1)
             await self.emit("response", [timestamp, bin, perf], to=sid)
+            tracer.record("transport", decoded - start + time.perf_counter_ns() - converted)
+            self.stageTelemetry.publish(timestamp)
+
+    def on_update_session_setting(self, sid, msg):
+        # このクライアントだけの設定 [key, val]。ackで現在のセッション情報を返す
+        key = str(msg[0])
+        val = msg[1]
+        return self.voiceChangerManager.update_session_settings(sid, key, val)
 
     def on_disconnect(self, sid):
         # print('[{}] disconnect'.format(datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-        pass
+        self.voiceChangerManager.remove_session(sid)
@@ -0,0 +1,79 @@
+"""
+■ MMVC_Telemetry
+- サーバーオーディオの処理スレッドから、クライアントへ処理時間(performance)を送るためのチャネル
+・publish() は処理スレッドから呼ぶ。キューに積んで、必要ならイベントループに call_soon_threadsafe で drain を予約するだけ。
+  (イベントループを作ったり、送信を待ったりしないので、処理スレッドがネットワークで止まることはない)
+・キューは maxSize 件まで。溢れたら古いものから捨てる。
+・drain はイベントループ上で実行する。minInterval 秒に一回まで送信し、その間に溜まったものはまとめて最新の一件だけ送る。
+・イベントループは bind() で登録する。(クライアントが接続するまでは送る先がないので publish は捨てるだけ)
+"""
+
+import asyncio
+from collections import deque
+import threading
+import time
+from typing import Any, Callable, Coroutine
+
+
+class MMVC_Telemetry:
+    def __init__(self, emitFunc: Callable[[Any], Coroutine[Any, Any, None]], minInterval: float = 0.1, maxSize: int = 16):
+        self.emitFunc = emitFunc
+        self.minInterval = minInterval
+        self.queue: deque[Any] = deque(maxlen=maxSize)
+        self.lock = threading.Lock()  # queue と scheduled 用。送信中には取らない
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.scheduled = False
+        self.lastEmit = 0.0
+
+        self.published = 0
+        self.emitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def publish(self, data: Any):
+        # 処理スレッドから呼ぶ。ブロックしない
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        with self.lock:
+            self.published += 1
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(data)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._drain)
+        except RuntimeError:  # ループが止まっている
+            with self.lock:
+                self.scheduled = False
+
+    def _drain(self):
+        # イベントループ上で実行される
+        wait = self.lastEmit + self.minInterval - time.monotonic()
+        if wait > 0:
+            self.loop.call_later(wait, self._drain)
+            return
+        with self.lock:
+            items = list(self.queue)
+            self.queue.clear()
+            self.scheduled = False
+        if len(items) == 0:
+            return
+        self.coalesced += len(items) - 1
+        self.emitted += 1
+        self.lastEmit = time.monotonic()
+        self.loop.create_task(self.emitFunc(items[-1]))
+
+    def getTelemetryInfo(self):
+        return {
+            "minInterval": self.minInterval,
+            "published": self.published,
+            "emitted": self.emitted,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# server ディレクトリから import できるようにする(bench と同じ)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,29 @@
+import numpy as np
+
+from voice_changer.Local.AudioFifo import AudioFifo
+
+
+def test_audio_fifo_wraps_around():
+    fifo = AudioFifo(8)
+    out = np.zeros(8, dtype=np.float32)
+    written = 0
+    read = []
+    for i in range(10):
+        data = np.arange(written, written + 5, dtype=np.float32)
+        assert fifo.write(data)
+        written += 5
+        n = fifo.read(out[:5])
+        read.extend(out[:n].tolist())
+    assert read == list(range(written))
+    assert fifo.available() == 0
+
+
+def test_audio_fifo_rejects_overrun_and_skips():
+    fifo = AudioFifo(8)
+    assert fifo.write(np.ones(6, dtype=np.float32))
+    assert fifo.write(np.ones(3, dtype=np.float32)) is False  # 書き込まずに False
+    assert fifo.available() == 6
+    assert fifo.space() == 2
+    assert fifo.skip(10) == 6
+    out = np.zeros(4, dtype=np.float32)
+    assert fifo.read(out) == 0
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+
+from voice_changer.utils.ConversionExecutor import ConversionExecutor
+
+
+def test_same_session_runs_in_order():
+    async def run():
+        executor = ConversionExecutor(maxWorkers=4, maxInFlight=8)
+        order: list[int] = []
+
+        def work(i: int):
+            time.sleep(0.01 * (4 - i))  # 先に来たものほど遅い
+            order.append(i)
+            return i
+
+        results = await asyncio.gather(*[executor.submit("a", work, i) for i in range(4)])
+        return results, order, executor.getConversionExecutorInfo()
+
+    results, order, info = asyncio.run(run())
+    assert results == [0, 1, 2, 3]
+    assert order == [0, 1, 2, 3]
+    assert info["inFlight"] == 0
+    assert info["submitted"] == 4
+
+
+def test_sessions_run_concurrently():
+    async def run():
+        executor = ConversionExecutor(maxWorkers=2, maxInFlight=4)
+        barrier = threading.Barrier(2, timeout=2)
+
+        def work(sid: str):
+            barrier.wait()  # 二つのセッションが同時に実行されないとタイムアウトする
+            return sid
+
+        return await asyncio.gather(executor.submit("a", work, "a"), executor.submit("b", work, "b"))
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_drops_when_in_flight_limit_reached():
+    async def run():
+        executor = ConversionExecutor(maxWorkers=1, maxInFlight=2)
+        release = threading.Event()
+
+        def work(i: int):
+            release.wait(2)
+            return i
+
+        tasks = [asyncio.ensure_future(executor.submit("a", work, i)) for i in range(2)]
+        await asyncio.sleep(0)
+        dropped = await executor.submit("a", work, 2)
+        release.set()
+        return dropped, await asyncio.gather(*tasks), executor.getConversionExecutorInfo()
+
+    dropped, results, info = asyncio.run(run())
+    assert dropped is None
+    assert results == [0, 1]
+    assert info["dropped"] == 1
+    assert info["peakInFlight"] == 2
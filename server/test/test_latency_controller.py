@@ -0,0 +1,51 @@
+from voice_changer.utils.LatencyController import LatencyController, LatencyKnob
+
+
+def _knobs(chunk: int = 192, extra: int = 8192, overlap: int = 2048):
+    return [
+        LatencyKnob("serverReadChunkSize", chunk, 64, 1024, 1.25),
+        LatencyKnob("extraConvertSize", extra, 4096, 131072, 2.0),
+        LatencyKnob("crossFadeOverlapSize", overlap, 1024, 4096, 2.0),
+    ]
+
+
+def _feed(controller: LatencyController, rtf: float, count: int):
+    for _ in range(count):
+        controller.record(rtf, 1.0)
+
+
+def test_waits_for_min_samples():
+    controller = LatencyController(window=16, minSamples=8)
+    _feed(controller, 2.0, 7)
+    assert controller.decide(_knobs(), 0.8, 0.6) is None
+    _feed(controller, 2.0, 1)
+    assert controller.decide(_knobs(), 0.8, 0.6) == ("extraConvertSize", 4096)
+
+
+def test_relieve_order_and_limits():
+    controller = LatencyController(window=16, minSamples=4)
+    # extraConvertSize が下限なら crossFadeOverlapSize、それも下限ならチャンクを大きくする
+    _feed(controller, 2.0, 4)
+    assert controller.decide(_knobs(extra=4096), 0.8, 0.6) == ("crossFadeOverlapSize", 1024)
+    _feed(controller, 2.0, 4)
+    assert controller.decide(_knobs(extra=4096, overlap=1024), 0.8, 0.6) == ("serverReadChunkSize", 240)
+
+
+def test_tighten_and_hysteresis():
+    controller = LatencyController(window=16, minSamples=4)
+    _feed(controller, 0.7, 4)
+    assert controller.decide(_knobs(), 0.8, 0.6) is None  # targetRTF * hysteresis と targetRTF の間は動かさない
+    _feed(controller, 0.2, 16)
+    assert controller.decide(_knobs(), 0.8, 0.6) == ("serverReadChunkSize", 154)
+
+
+def test_backoff_on_oscillation():
+    controller = LatencyController(window=16, minSamples=4)
+    _feed(controller, 2.0, 4)
+    assert controller.decide(_knobs(chunk=192, extra=4096, overlap=1024), 0.8, 0.6) == ("serverReadChunkSize", 240)
+    assert controller.wait == 4
+    _feed(controller, 0.2, 4)
+    assert controller.decide(_knobs(chunk=240, extra=4096, overlap=1024), 0.8, 0.6) == ("serverReadChunkSize", 192)
+    # 直前と逆向きに同じ設定を動かしたので待ちが倍になる
+    assert controller.wait == 8
+    assert controller.getLatencyControllerInfo()["steps"] == 2
@@ -0,0 +1,20 @@
+import importlib
+import sys
+
+from voice_changer.utils import Metrics
+
+
+def test_process_rss_bytes():
+    assert Metrics.processRssBytes() > 0
+    assert Metrics.processRssBytes(peak=True) >= Metrics.processRssBytes()
+
+
+def test_import_without_resource_module(monkeypatch):
+    # Windows には resource モジュールが無い
+    monkeypatch.setitem(sys.modules, "resource", None)
+    try:
+        module = importlib.reload(Metrics)
+        assert module.processRssBytes() >= 0
+    finally:
+        monkeypatch.undo()
+        importlib.reload(Metrics)
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from voice_changer.RVC.pipeline.MicroBatcher import MicroBatcher  # NOQA
+
+
+def _batchFn(calls: list[int]):
+    def fn(argsList):
+        calls.append(len(argsList))
+        x = torch.cat([args[0] for args in argsList])
+        return list((x * 2).split(1))
+
+    return fn
+
+
+def test_single_stream_does_not_wait():
+    batcher = MicroBatcher(torch.device("cpu"), maxWait=1.0)
+    calls: list[int] = []
+    batcher.enter()
+    result = batcher.submit("k", (torch.ones(1, 3),), _batchFn(calls))
+    batcher.leave()
+    assert torch.equal(result, torch.full((1, 3), 2.0))
+    assert calls == [1]
+
+
+def test_batches_requests_from_active_streams():
+    batcher = MicroBatcher(torch.device("cpu"), maxWait=1.0)
+    calls: list[int] = []
+    results: dict[int, torch.Tensor] = {}
+
+    def run(i: int):
+        results[i] = batcher.submit("k", (torch.full((1, 3), float(i)),), _batchFn(calls))
+
+    for _ in range(3):
+        batcher.enter()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert calls == [3]
+    for i in range(3):
+        assert torch.equal(results[i], torch.full((1, 3), float(i * 2)))
+    assert batcher.getMicroBatcherInfo()["largestBatch"] == 3
+
+
+def test_error_is_raised_in_every_request():
+    batcher = MicroBatcher(torch.device("cpu"), maxWait=0.0)
+
+    def fail(argsList):
+        raise RuntimeError("batch failed")
+
+    with pytest.raises(RuntimeError):
+        batcher.submit("k", (torch.ones(1),), fail)
+
+
+def test_batch_size_is_capped():
+    batcher = MicroBatcher(torch.device("cpu"), maxWait=0.2, maxBatch=2)
+    calls: list[int] = []
+    results: dict[int, torch.Tensor] = {}
+
+    def run(i: int):
+        results[i] = batcher.submit("k", (torch.full((1, 3), float(i)),), _batchFn(calls))
+
+    for _ in range(5):
+        batcher.enter()
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    # 残った要求も次の leader がまとめて実行する
+    assert sum(calls) == 5
+    assert max(calls) <= 2
+    for i in range(5):
+        assert torch.equal(results[i], torch.full((1, 3), float(i * 2)))
@@ -0,0 +1,43 @@
+import numpy as np
+
+from voice_changer.common.RingBuffer import RingBuffer
+
+
+def test_ring_buffer_keeps_latest_window():
+    ring = RingBuffer(8, slack=2)
+    expected = np.zeros(0, dtype=np.float32)
+    for i in range(20):
+        data = np.arange(i * 3, i * 3 + 3, dtype=np.float32)
+        ring.append(data)
+        expected = np.concatenate([expected, data])[-8:]
+        assert np.array_equal(ring.filled_view(), expected)
+    assert np.array_equal(ring.view(4), expected[-4:])
+    assert len(ring) == 8
+
+
+def test_ring_buffer_zero_fill_and_resize():
+    ring = RingBuffer(6, shape=(2,))
+    ring.append(np.ones((2, 2), dtype=np.float32))
+    assert ring.filled == 2
+    assert np.array_equal(ring.view(), np.concatenate([np.zeros((4, 2)), np.ones((2, 2))]))
+
+    ring.append_zeros(1)
+    ring.overwrite_tail(np.full((1, 2), 5, dtype=np.float32))
+    assert np.array_equal(ring.view(3), [[1, 1], [1, 1], [5, 5]])
+
+    ring.resize(2)
+    assert np.array_equal(ring.view(), [[1, 1], [5, 5]])
+    ring.resize(4)
+    assert ring.filled == 2
+    assert np.array_equal(ring.view(), [[0, 0], [0, 0], [1, 1], [5, 5]])
+
+    # 容量を超えるデータは末尾だけ残る
+    ring.append(np.arange(20, dtype=np.float32).reshape(10, 2))
+    assert np.array_equal(ring.view(), np.arange(12, 20).reshape(4, 2))
+
+
+def test_ring_buffer_view_is_not_a_copy():
+    ring = RingBuffer(4)
+    ring.append(np.ones(4, dtype=np.float32))
+    ring.view(2)[:] = 3
+    assert np.array_equal(ring.view(), [1, 1, 3, 3])
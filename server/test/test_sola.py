@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from voice_changer.common.sola.FFTSolaEngine import FFTSolaEngine
+from voice_changer.common.sola.TimeDomainSolaEngine import TimeDomainSolaEngine
+
+
+def _correlation(audio: np.ndarray, sola_buffer: np.ndarray, crossfade_frame: int, sola_search_frame: int):
+    # TimeDomainSolaEngine と同じ正規化相互相関(全オフセット分)
+    audio = audio[: crossfade_frame + sola_search_frame].astype(np.float64)
+    cor_nom = np.convolve(audio, np.flip(sola_buffer), "valid")
+    cor_den = np.sqrt(np.convolve(audio**2, np.ones(crossfade_frame), "valid") + 1e-3)
+    return cor_nom / cor_den
+
+
+@pytest.mark.parametrize("crossfade_frame,sola_search_frame", [(1024, 480), (2048, 576), (4096, 1200)])
+def test_fft_matches_time_domain(crossfade_frame: int, sola_search_frame: int):
+    rng = np.random.default_rng(crossfade_frame)
+    fft = FFTSolaEngine()
+    time = TimeDomainSolaEngine()
+    for _ in range(8):
+        audio = (rng.standard_normal(crossfade_frame + sola_search_frame + 256) * 0.1).astype(np.float32)
+        sola_buffer = (rng.standard_normal(crossfade_frame) * 0.1).astype(np.float32)
+        offsetFFT = fft.search(audio, sola_buffer, crossfade_frame, sola_search_frame)
+        offsetTime = time.search(audio, sola_buffer, crossfade_frame, sola_search_frame)
+        assert 0 <= offsetFFT <= sola_search_frame
+        if offsetFFT != offsetTime:
+            # 相関がほぼ同じ値のオフセットが並んだ場合は丸め誤差で入れ替わってもよい
+            cor = _correlation(audio, sola_buffer, crossfade_frame, sola_search_frame)
+            assert cor[offsetFFT] == pytest.approx(cor[offsetTime], rel=1e-4, abs=1e-6)
+
+
+def test_fft_finds_shifted_block():
+    crossfade_frame, sola_search_frame = 2048, 576
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(crossfade_frame + sola_search_frame) * 0.1).astype(np.float32)
+    fft = FFTSolaEngine()
+    for shift in [0, 1, 123, sola_search_frame]:
+        sola_buffer = audio[shift : shift + crossfade_frame].copy()
+        assert fft.search(audio, sola_buffer, crossfade_frame, sola_search_frame) == shift
+        assert TimeDomainSolaEngine().search(audio, sola_buffer, crossfade_frame, sola_search_frame) == shift
+
+
+def test_fft_reuses_size_until_frames_change():
+    fft = FFTSolaEngine()
+    audio = np.zeros(4096, dtype=np.float32)
+    fft.search(audio, np.zeros(1024, dtype=np.float32), 1024, 480)
+    nfft = fft.nfft
+    assert nfft >= 1024 + 480
+    fft.search(audio, np.ones(1024, dtype=np.float32), 1024, 480)
+    assert fft.nfft == nfft
+    fft.search(audio, np.ones(2048, dtype=np.float32), 2048, 480)
+    assert fft.nfft >= 2048 + 480
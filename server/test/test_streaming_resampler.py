@@ -0,0 +1,38 @@
+import numpy as np
+
+from voice_changer.common.StreamingResampler import StreamingResampler
+
+
+def test_streaming_resampler_chunks_match_whole_signal():
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(48000) * 0.1).astype(np.float32)
+    resampler = StreamingResampler(48000, 16000)
+    streamed = np.concatenate([resampler.process(audio[i : i + 4096]) for i in range(0, audio.shape[0], 4096)])
+    whole = StreamingResampler(48000, 16000).resample(audio)
+    # 右側のフィルタ半幅分は次の入力が来るまで出てこない
+    assert 0 < whole.shape[0] - streamed.shape[0] < 64
+    assert np.allclose(streamed, whole[: streamed.shape[0]], atol=1e-6)
+
+
+def test_streaming_resampler_skip_matches_silence():
+    rng = np.random.default_rng(1)
+    audio = (rng.standard_normal(30000) * 0.1).astype(np.float32)
+    silent = audio.copy()
+    silent[10000:15000] = 0
+
+    resampler = StreamingResampler(48000, 16000)
+    head = resampler.process(audio[:10000])
+    skipped = resampler.skip(5000)
+    tail = resampler.process(audio[15000:])
+
+    reference = StreamingResampler(48000, 16000).process(silent)
+    assert head.shape[0] + skipped + tail.shape[0] == reference.shape[0]
+    assert np.allclose(head, reference[: head.shape[0]], atol=1e-6)
+    assert np.allclose(tail, reference[head.shape[0] + skipped :], atol=1e-6)
+
+
+def test_streaming_resampler_same_rate_passthrough():
+    resampler = StreamingResampler(16000, 16000)
+    audio = np.arange(100, dtype=np.float64)
+    assert np.array_equal(resampler.process(audio), audio.astype(np.float32))
+    assert resampler.skip(10) == 10
@@ -20,6 +20,7 @@ else:
 
 from .models.diffusion.infer_gt_mel import DiffGtMel
 
+from voice_changer.common.RingBuffer import RingBuffer
 from voice_changer.utils.VoiceChangerModel import AudioInOut, VoiceChangerModel
 from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
 from voice_changer.DDSP_SVC.DDSP_SVCSetting import DDSP_SVCSettings
@@ -68,7 +69,7 @@ class DDSP_SVC(VoiceChangerModel):
         self.svc_model.setVCParams(params)
         EmbedderManager.initialize(params)
 
-        self.audio_buffer: AudioInOut | None = None
+        self.audio_buffer: RingBuffer | None = None
         self.prevVol = 0.0
         self.slotInfo = slotInfo
         self.initialize()
@@ -126,13 +127,6 @@ class DDSP_SVC(VoiceChangerModel):
         newData = newData.astype(np.float32) / 32768.0
         # newData = newData.astype(np.float32)
 
-        if self.audio_buffer is not None:
-            self.audio_buffer = np.concatenate(
-                [self.audio_buffer, newData], 0
-            )  # 過去のデータに連結
-        else:
-            self.audio_buffer = newData
-
         convertSize = (
             inputSize + crossfadeSize + solaSearchFrame + self.settings.extraConvertSize
         )
@@ -140,9 +134,13 @@ class DDSP_SVC(VoiceChangerModel):
         # if convertSize % self.hop_size != 0:  # モデルの出力のホップサイズで切り捨てが発生するので補う。
         #     convertSize = convertSize + (self.hop_size - (convertSize % self.hop_size))
 
-        convertOffset = -1 * convertSize
-        self.audio_buffer = self.audio_buffer[convertOffset:]  # 変換対象の部分だけ抽出
-        return (self.audio_buffer,)
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
+        else:
+            self.audio_buffer.resize(convertSize)
+        self.audio_buffer.append(newData)  # 過去のデータに連結
+        audio_buffer = self.audio_buffer.filled_view()  # 変換対象の部分だけ抽出(コピー無し)
+        return (audio_buffer,)
 
     # def _onnx_inference(self, data):
     #     if hasattr(self, "onnx_session") is False or self.onnx_session is None:
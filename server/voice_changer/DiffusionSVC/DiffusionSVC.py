@@ -1,4 +1,5 @@
 from dataclasses import asdict
+import copy
 import numpy as np
 from data.ModelSlot import DiffusionSVCModelSlot
 from mods.log_control import VoiceChangaerLogger
@@ -10,6 +11,7 @@ from voice_changer.DiffusionSVC.pitchExtractor.PitchExtractorManager import (
     PitchExtractorManager,
 )
 from voice_changer.ModelSlotManager import ModelSlotManager
+from voice_changer.common.RingBuffer import RingBuffer
 
 from voice_changer.utils.VoiceChangerModel import (
     AudioInOut,
@@ -45,9 +47,9 @@ class DiffusionSVC(VoiceChangerModel):
 
         self.pipeline: Pipeline | None = None
 
-        self.audio_buffer: AudioInOut | None = None
-        self.pitchf_buffer: PitchfInOut | None = None
-        self.feature_buffer: FeatureInOut | None = None
+        self.audio_buffer: RingBuffer | None = None
+        self.pitchf_buffer: RingBuffer | None = None
+        self.feature_buffer: RingBuffer | None = None
         self.prevVol = 0.0
         self.slotInfo = slotInfo
 
@@ -85,6 +87,32 @@ class DiffusionSVC(VoiceChangerModel):
         self.outputSampleRate = outputSampleRate
         self.initialize()
 
+    def cloneStream(self):
+        # pipeline はチャンク間の状態を持たないので共有する
+        clone = copy.copy(self)
+        clone.settings = copy.copy(self.settings)
+        return clone
+
+    def getStreamState(self):
+        return {
+            "audio_buffer": self.audio_buffer,
+            "pitchf_buffer": self.pitchf_buffer,
+            "feature_buffer": self.feature_buffer,
+            "prevVol": self.prevVol,
+        }
+
+    def setStreamState(self, state: dict | None):
+        if state is None:
+            self.audio_buffer = None
+            self.pitchf_buffer = None
+            self.feature_buffer = None
+            self.prevVol = 0.0
+            return
+        self.audio_buffer = state["audio_buffer"]
+        self.pitchf_buffer = state["pitchf_buffer"]
+        self.feature_buffer = state["feature_buffer"]
+        self.prevVol = state["prevVol"]
+
     def update_settings(self, key: str, val: int | float | str):
         logger.info(f"[Voice Changer][DiffusionSVC]: update_settings {key}:{val}")
         if key in self.settings.intData:
@@ -131,25 +159,6 @@ class DiffusionSVC(VoiceChangerModel):
             / 512
         )  # 100 は hubertのhosizeから (16000 / 160).
         # ↑newData.shape[0]//sampleRate でデータ秒数。これに16000かけてhubertの世界でのデータ長。これにhop数(160)でわるとfeatsのデータサイズになる。
-        if self.audio_buffer is not None:
-            # 過去のデータに連結
-            self.audio_buffer = np.concatenate([self.audio_buffer, newData], 0)
-            self.pitchf_buffer = np.concatenate(
-                [self.pitchf_buffer, np.zeros(new_feature_length)], 0
-            )
-            self.feature_buffer = np.concatenate(
-                [
-                    self.feature_buffer,
-                    np.zeros([new_feature_length, self.slotInfo.embChannels]),
-                ],
-                0,
-            )
-        else:
-            self.audio_buffer = newData
-            self.pitchf_buffer = np.zeros(new_feature_length)
-            self.feature_buffer = np.zeros(
-                [new_feature_length, self.slotInfo.embChannels]
-            )
 
         convertSize = (
             newData.shape[0]
@@ -161,7 +170,7 @@ class DiffusionSVC(VoiceChangerModel):
         if convertSize % 128 != 0:  # モデルの出力のホップサイズで切り捨てが発生するので補う。
             convertSize = convertSize + (128 - (convertSize % 128))
 
-        # バッファがたまっていない場合はzeroで補う
+        # バッファはconvertSizeで確保(たまっていない部分はzero)
         generateFeatureLength = (
             int(
                 ((convertSize / self.inputSampleRate) * self.slotInfo.samplingRate)
@@ -169,42 +178,52 @@ class DiffusionSVC(VoiceChangerModel):
             )
             + 1
         )
-        if self.audio_buffer.shape[0] < convertSize:
-            self.audio_buffer = np.concatenate(
-                [np.zeros([convertSize]), self.audio_buffer]
-            )
-            self.pitchf_buffer = np.concatenate(
-                [np.zeros(generateFeatureLength), self.pitchf_buffer]
-            )
-            self.feature_buffer = np.concatenate(
-                [
-                    np.zeros([generateFeatureLength, self.slotInfo.embChannels]),
-                    self.feature_buffer,
-                ]
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
+            self.pitchf_buffer = RingBuffer(generateFeatureLength, dtype=np.float64)
+            self.feature_buffer = RingBuffer(
+                generateFeatureLength, (self.slotInfo.embChannels,), dtype=np.float64
             )
+        else:
+            self.audio_buffer.resize(convertSize)
+            self.pitchf_buffer.resize(generateFeatureLength)
+            self.feature_buffer.resize(generateFeatureLength)
 
-        convertOffset = -1 * convertSize
-        featureOffset = -1 * generateFeatureLength
-        self.audio_buffer = self.audio_buffer[convertOffset:]  # 変換対象の部分だけ抽出
-        self.pitchf_buffer = self.pitchf_buffer[featureOffset:]
-        self.feature_buffer = self.feature_buffer[featureOffset:]
+        # 過去のデータに連結
+        self.audio_buffer.append(newData)
+        self.pitchf_buffer.append_zeros(new_feature_length)
+        self.feature_buffer.append_zeros(new_feature_length)
+
+        audio = self.audio_buffer.view()  # 変換対象の部分(コピー無し)
 
         # 出力部分だけ切り出して音量を確認。(TODO:段階的消音にする)
         cropOffset = -1 * (newData.shape[0] + crossfadeSize)
         cropEnd = -1 * (crossfadeSize)
-        crop = self.audio_buffer[cropOffset:cropEnd]
+        crop = audio[cropOffset:cropEnd]
         vol = np.sqrt(np.square(crop).mean())
         vol = float(max(vol, self.prevVol * 0.0))
         self.prevVol = vol
 
         return (
-            self.audio_buffer,
-            self.pitchf_buffer,
-            self.feature_buffer,
+            audio,
+            self.pitchf_buffer.view(),
+            self.feature_buffer.view(),
             convertSize,
             vol,
         )
 
+    def skipInference(self, receivedData: AudioInOut):
+        # VoiceChangerV2 で無音と判定されたチャンク。バッファだけ進める。
+        if self.audio_buffer is None:
+            return
+        new_feature_length = int(
+            ((receivedData.shape[0] / self.inputSampleRate) * self.slotInfo.samplingRate)
+            / 512
+        )
+        self.audio_buffer.append_zeros(receivedData.shape[0])
+        self.pitchf_buffer.append_zeros(new_feature_length)
+        self.feature_buffer.append_zeros(new_feature_length)
+
     def inference(
         self, receivedData: AudioInOut, crossfade_frame: int, sola_search_frame: int
     ):
@@ -218,9 +237,6 @@ class DiffusionSVC(VoiceChangerModel):
         convertSize: int = data[3]
         vol: float = data[4]
 
-        if vol < self.settings.silentThreshold:
-            return np.zeros(convertSize).astype(np.int16) * np.sqrt(vol)
-
         if self.pipeline is None:
             return np.zeros(convertSize).astype(np.int16) * np.sqrt(vol)
 
@@ -242,7 +258,7 @@ class DiffusionSVC(VoiceChangerModel):
         )  # extaraConvertSize(既にモデルのサンプリングレートにリサンプリング済み)の秒数。モデルのサンプリングレートで処理(★１)。
 
         try:
-            audio_out, self.pitchf_buffer, self.feature_buffer = self.pipeline.exec(
+            audio_out, pitchf_out, feature_out = self.pipeline.exec(
                 sid,
                 audio,
                 self.inputSampleRate,
@@ -257,6 +273,9 @@ class DiffusionSVC(VoiceChangerModel):
                 protect,
                 skip_diffusion=self.settings.skipDiffusion,
             )
+            if pitchf_out is not None:
+                self.pitchf_buffer.overwrite_tail(pitchf_out.numpy())
+            self.feature_buffer.overwrite_tail(feature_out.numpy())
             result = audio_out.detach().cpu().numpy()
             return result
         except DeviceCannotSupportHalfPrecisionException as e:  # NOQA
@@ -7,7 +7,9 @@ from voice_changer.DiffusionSVC.inferencer.diffusion_svc_model.diffusion.vocoder
 from voice_changer.DiffusionSVC.inferencer.onnx.VocoderOnnx import VocoderOnnx
 
 from voice_changer.RVC.deviceManager.DeviceManager import DeviceManager
-from voice_changer.utils.Timer import Timer2
+from voice_changer.utils.Tracer import Tracer
+
+tracer = Tracer.get_instance()
 
 
 class DiffusionSVCInferencer(Inferencer):
@@ -107,25 +109,20 @@ class DiffusionSVCInferencer(Inferencer):
         silence_front: float,
         skip_diffusion: bool = True,
     ) -> torch.Tensor:
-        use_timer = False
-        with Timer2("    Naive", use_timer) as t:
+        with tracer.span("synth.naive"):
             gt_spec = self.naive_model_call(feats, pitch, volume, spk_id=sid, spk_mix_dict=None, aug_shift=0, spk_emb=None)
 
-        # print("[    ----Timer::1: ]", t.secs)
-
-        with Timer2("    Diffuser", use_timer) as t:
+        with tracer.span("synth.diffuser"):
             if skip_diffusion == 0:
                 out_mel = self.__call__(feats, pitch, volume, spk_id=sid, spk_mix_dict=None, aug_shift=0, gt_spec=gt_spec, infer_speedup=infer_speedup, method="dpm-solver", k_step=k_step, use_tqdm=False, spk_emb=None)
                 gt_spec = out_mel
-        # print("[    ----Timer::2: ]", t.secs)
 
-        with Timer2("    Vocoder", use_timer) as t:  # NOQA
+        with tracer.span("synth.vocoder"):
             if self.vocoder_onnx is None:
                 start_frame = int(silence_front * self.vocoder.vocoder_sample_rate / self.vocoder.vocoder_hop_size)
                 out_wav = self.mel2wav(gt_spec, pitch, start_frame=start_frame)
                 out_wav *= mask
             else:
                 out_wav = self.vocoder_onnx.infer(gt_spec, pitch, silence_front, mask)
-        # print("[    ----Timer::3: ]", t.secs)
 
         return out_wav.squeeze()
@@ -13,13 +13,15 @@ from voice_changer.DiffusionSVC.inferencer.Inferencer import Inferencer
 from voice_changer.DiffusionSVC.pitchExtractor.PitchExtractor import PitchExtractor
 
 from voice_changer.RVC.embedder.Embedder import Embedder
+from voice_changer.RVC.embedder.EmbedderManager import EmbedderManager
 
 from voice_changer.common.VolumeExtractor import VolumeExtractor
 from torchaudio.transforms import Resample
 
-from voice_changer.utils.Timer import Timer2
+from voice_changer.utils.Tracer import Tracer
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 class Pipeline(object):
@@ -102,17 +104,15 @@ class Pipeline(object):
         protect=0.5,
         skip_diffusion=True,
     ):
-        use_timer = False
         # print("---------- pipe line --------------------")
-        with Timer2("pre-process", use_timer) as t:
+        with tracer.span("resampleIn"):  # 音量の抽出を含む
             audio_t = torch.from_numpy(audio).float().unsqueeze(0).to(self.device)
             audio16k = self.resamplerIn(audio_t)
             volume, mask = self.extract_volume_and_mask(audio16k, threshold=-60.0)
             sid = torch.tensor(sid, device=self.device).unsqueeze(0).long()
             n_frames = int(audio16k.size(-1) // self.hop_size + 1)
-        # print("[Timer::1: ]", t.secs)
 
-        with Timer2("extract pitch", use_timer) as t:
+        with tracer.span("pitch"):
             # ピッチ検出
             try:
                 # pitch = self.pitchExtractor.extract(
@@ -140,9 +140,8 @@ class Pipeline(object):
             if feats.dim() == 2:  # double channels
                 feats = feats.mean(-1)
             feats = feats.view(1, -1)
-        # print("[Timer::2: ]", t.secs)
 
-        with Timer2("extract feature", use_timer) as t:
+        with tracer.span("embed"):
             # embedding
             with autocast(enabled=self.isHalf):
                 try:
@@ -157,9 +156,8 @@ class Pipeline(object):
                     else:
                         raise e
             feats = F.interpolate(feats.permute(0, 2, 1), size=int(n_frames), mode="nearest").permute(0, 2, 1)
-        # print("[Timer::3: ]", t.secs)
 
-        with Timer2("infer", use_timer) as t:
+        with tracer.span("synth"):
             # 推論実行
             try:
                 with torch.no_grad():
@@ -178,9 +176,8 @@ class Pipeline(object):
                     raise HalfPrecisionChangingException()
                 else:
                     raise e
-        # print("[Timer::4: ]", t.secs)
 
-        with Timer2("post-process", use_timer) as t:  # NOQA
+        with tracer.span("resampleOut"):
             feats_buffer = feats.squeeze(0).detach().cpu()
             if pitch is not None:
                 pitch_buffer = pitch.squeeze(0).detach().cpu()
@@ -189,5 +186,7 @@ class Pipeline(object):
 
             del pitch, pitchf, feats, sid
             audio1 = self.resamplerOut(audio1.float())
-        # print("[Timer::5: ]", t.secs)
         return audio1, pitch_buffer, feats_buffer
+
+    def __del__(self):
+        EmbedderManager.releaseEmbedder(self.embedder)  # 他のパイプラインと共有している
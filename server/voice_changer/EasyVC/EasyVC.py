@@ -3,6 +3,7 @@ VoiceChangerV2向け
 """
 
 from dataclasses import asdict
+import copy
 import numpy as np
 import torch
 from data.ModelSlot import RVCModelSlot
@@ -13,11 +14,12 @@ from voice_changer.EasyVC.pipeline.PipelineGenerator import createPipeline
 
 from voice_changer.RVC.RVCSettings import RVCSettings
 from voice_changer.RVC.embedder.EmbedderManager import EmbedderManager
-from voice_changer.utils.Timer import Timer2
+from voice_changer.utils.Tracer import Tracer
+from voice_changer.common.RingBuffer import RingBuffer
+from voice_changer.common.StreamingResampler import StreamingResampler
 from voice_changer.utils.VoiceChangerModel import (
     AudioInOut,
     PitchfInOut,
-    FeatureInOut,
     VoiceChangerModel,
 )
 from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
@@ -30,10 +32,10 @@ from Exceptions import (
     PipelineCreateException,
     PipelineNotInitializedException,
 )
-import resampy
 from typing import cast
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 class EasyVC(VoiceChangerModel):
@@ -50,9 +52,9 @@ class EasyVC(VoiceChangerModel):
 
         self.pipeline: Pipeline | None = None
 
-        self.audio_buffer: AudioInOut | None = None
-        self.pitchf_buffer: PitchfInOut | None = None
-        self.feature_buffer: FeatureInOut | None = None
+        self.audio_buffer: RingBuffer | None = None
+        self.pitchf_buffer: PitchfInOut | None = None  # EasyVCではpitchは使わない
+        self.feature_buffer: RingBuffer | None = None
         self.prevVol = 0.0
         self.slotInfo = slotInfo
         # self.initialize()
@@ -73,8 +75,38 @@ class EasyVC(VoiceChangerModel):
     def setSamplingRate(self, inputSampleRate, outputSampleRate):
         self.inputSampleRate = inputSampleRate
         self.outputSampleRate = outputSampleRate
+        self.inputResampler = StreamingResampler(self.inputSampleRate, 16000)
+        self.outputResampler = StreamingResampler(16000, self.outputSampleRate)
         # self.initialize()
 
+    def cloneStream(self):
+        # pipeline はチャンク間の状態を持たないので共有する
+        clone = copy.copy(self)
+        clone.settings = copy.copy(self.settings)
+        return clone
+
+    def getStreamState(self):
+        return {
+            "audio_buffer": self.audio_buffer,
+            "feature_buffer": self.feature_buffer,
+            "prevVol": self.prevVol,
+            "inputResampler": self.inputResampler,
+        }
+
+    def setStreamState(self, state: dict | None):
+        if state is None:
+            self.audio_buffer = None
+            self.feature_buffer = None
+            self.prevVol = 0.0
+            self.inputResampler = StreamingResampler(self.inputSampleRate, 16000)
+            return
+        self.audio_buffer = state["audio_buffer"]
+        self.feature_buffer = state["feature_buffer"]
+        self.prevVol = state["prevVol"]
+        self.inputResampler = state["inputResampler"]
+        if self.inputResampler.isFor(self.inputSampleRate, 16000) is False:
+            self.inputResampler = StreamingResampler(self.inputSampleRate, 16000)
+
     def update_settings(self, key: str, val: int | float | str):
         logger.info(f"[Voice Changer][RVC]: update_settings {key}:{val}")
         if key in self.settings.intData:
@@ -117,104 +149,76 @@ class EasyVC(VoiceChangerModel):
         newData = newData.astype(np.float32) / 32768.0
         newFeatureLength = inputSize // 160  # hopsize:=160
 
-        if self.audio_buffer is not None:
-            # 過去のデータに連結
-            self.audio_buffer = np.concatenate([self.audio_buffer, newData], 0)
-            # if self.slotInfo.f0:
-            #     self.pitchf_buffer = np.concatenate([self.pitchf_buffer, np.zeros(newFeatureLength)], 0)
-            self.feature_buffer = np.concatenate(
-                [
-                    self.feature_buffer,
-                    # np.zeros([newFeatureLength, self.slotInfo.embChannels]),
-                    np.zeros([newFeatureLength, 768]),
-                ],
-                0,
-            )
-        else:
-            self.audio_buffer = newData
-            # if self.slotInfo.f0:
-            #     self.pitchf_buffer = np.zeros(newFeatureLength)
-            self.feature_buffer = np.zeros([newFeatureLength, 768])
-
         convertSize = inputSize + crossfadeSize + solaSearchFrame + extra_frame
 
         if convertSize % 160 != 0:  # モデルの出力のホップサイズで切り捨てが発生するので補う。
             convertSize = convertSize + (160 - (convertSize % 160))
         outSize = int(((convertSize - extra_frame) / 16000) * self.slotInfo.samplingRate)
 
-        # バッファがたまっていない場合はzeroで補う
-        if self.audio_buffer.shape[0] < convertSize:
-            self.audio_buffer = np.concatenate([np.zeros([convertSize]), self.audio_buffer])
-            # if self.slotInfo.f0:
-            #     self.pitchf_buffer = np.concatenate([np.zeros([convertSize // 160]), self.pitchf_buffer])
-            self.feature_buffer = np.concatenate(
-                [
-                    np.zeros([convertSize // 160, 768]),
-                    self.feature_buffer,
-                ]
-            )
-
-        # 不要部分をトリミング
-        convertOffset = -1 * convertSize
-        featureOffset = convertOffset // 160
-        self.audio_buffer = self.audio_buffer[convertOffset:]  # 変換対象の部分だけ抽出
-        # if self.slotInfo.f0:
-        #     self.pitchf_buffer = self.pitchf_buffer[featureOffset:]
-        self.feature_buffer = self.feature_buffer[featureOffset:]
+        # バッファはconvertSizeで確保(たまっていない部分はzero)
+        featureSize = convertSize // 160
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
+            # self.feature_buffer = RingBuffer(featureSize, (self.slotInfo.embChannels,), dtype=np.float64)
+            self.feature_buffer = RingBuffer(featureSize, (768,), dtype=np.float64)
+        else:
+            self.audio_buffer.resize(convertSize)
+            self.feature_buffer.resize(featureSize)
+
+        # 過去のデータに連結
+        self.audio_buffer.append(newData)
+        self.feature_buffer.append_zeros(newFeatureLength)
+
+        audio = self.audio_buffer.view()  # 変換対象の部分(コピー無し)
 
         # 出力部分だけ切り出して音量を確認。(TODO:段階的消音にする)
         cropOffset = -1 * (inputSize + crossfadeSize)
         cropEnd = -1 * (crossfadeSize)
-        crop = self.audio_buffer[cropOffset:cropEnd]
+        crop = audio[cropOffset:cropEnd]
         vol = np.sqrt(np.square(crop).mean())
         vol = max(vol, self.prevVol * 0.0)
         self.prevVol = vol
 
         return (
-            self.audio_buffer,
+            audio,
             self.pitchf_buffer,
-            self.feature_buffer,
+            self.feature_buffer.view(),
             convertSize,
             vol,
             outSize,
         )
 
+    def skipInference(self, receivedData: AudioInOut):
+        # VoiceChangerV2 で無音と判定されたチャンク。リサンプルせずにバッファだけ進める。
+        inputSize = self.inputResampler.skip(receivedData.shape[0])
+        if self.audio_buffer is None:
+            return
+        self.audio_buffer.append_zeros(inputSize)
+        self.feature_buffer.append_zeros(inputSize // 160)
+
     def inference(self, receivedData: AudioInOut, crossfade_frame: int, sola_search_frame: int):
         if self.pipeline is None:
             logger.info("[Voice Changer] Pipeline is not initialized.")
             raise PipelineNotInitializedException()
 
-        enableTimer = False
-        with Timer2("infer-easyvc", enableTimer) as t:
+        with tracer.span("easyvc.inference") as t:
 
             # 処理は16Kで実施(Pitch, embed, (infer))
-            receivedData = cast(
-                AudioInOut,
-                resampy.resample(
-                    receivedData,
-                    self.inputSampleRate,
-                    16000,
-                    filter="kaiser_fast",
-                ),
-            )
+            receivedData = cast(AudioInOut, self.inputResampler.process(receivedData))
             crossfade_frame = int((crossfade_frame / self.inputSampleRate) * 16000)
             sola_search_frame = int((sola_search_frame / self.inputSampleRate) * 16000)
             extra_frame = int((self.settings.extraConvertSize / self.inputSampleRate) * 16000)
 
             # 入力データ生成
             data = self.generate_input(receivedData, crossfade_frame, sola_search_frame, extra_frame)
-            t.record("generate-input")
+            t.lap("generate_input")
 
             audio = data[0]
             pitchf = data[1]
             feature = data[2]
-            convertSize = data[3]
             vol = data[4]
             outSize = data[5]
 
-            if vol < self.settings.silentThreshold:
-                return np.zeros(convertSize).astype(np.int16) * np.sqrt(vol)
-
             device = self.pipeline.device
 
             audio = torch.from_numpy(audio).to(device=device, dtype=torch.float32)
@@ -228,10 +232,10 @@ class EasyVC(VoiceChangerModel):
             if_f0 = 0
             # embOutputLayer = self.slotInfo.embOutputLayer
             # useFinalProj = self.slotInfo.useFinalProj
-            t.record("pre-process")
+            t.lap("pre")
 
             try:
-                audio_out, self.pitchf_buffer, self.feature_buffer = self.pipeline.exec(
+                audio_out, _pitchf_out, feature_out = self.pipeline.exec(
                     sid,
                     audio,
                     pitchf,
@@ -244,20 +248,14 @@ class EasyVC(VoiceChangerModel):
                     repeat,
                     outSize,
                 )
-                t.record("pipeline-exec")
+                self.feature_buffer.overwrite_tail(feature_out.numpy())
+                t.lap("exec")
                 # result = audio_out.detach().cpu().numpy() * np.sqrt(vol)
                 result = audio_out[-outSize:].detach().cpu().numpy() * np.sqrt(vol)
 
-                result = cast(
-                    AudioInOut,
-                    resampy.resample(
-                        result,
-                        16000,
-                        self.outputSampleRate,
-                        filter="kaiser_fast",
-                    ),
-                )
-                t.record("resample")
+                # 出力はチャンク毎にウィンドウが重なっているので状態を持たない変換
+                result = cast(AudioInOut, self.outputResampler.resample(result))
+                t.lap("resample")
 
                 return result
             except DeviceCannotSupportHalfPrecisionException as e:  # NOQA
@@ -12,14 +12,16 @@ from Exceptions import (
 from mods.log_control import VoiceChangaerLogger
 
 from voice_changer.RVC.embedder.Embedder import Embedder
+from voice_changer.RVC.embedder.EmbedderManager import EmbedderManager
 from voice_changer.RVC.inferencer.Inferencer import Inferencer
 from voice_changer.RVC.inferencer.OnnxRVCInferencer import OnnxRVCInferencer
 from voice_changer.RVC.inferencer.OnnxRVCInferencerNono import OnnxRVCInferencerNono
 
 from voice_changer.RVC.pitchExtractor.PitchExtractor import PitchExtractor
-from voice_changer.utils.Timer import Timer2
+from voice_changer.utils.Tracer import Tracer
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 class Pipeline(object):
@@ -138,8 +140,7 @@ class Pipeline(object):
         # print(f"pipeline exec input, audio:{audio.shape}, pitchf:{pitchf.shape}, feature:{feature.shape}")
         # print(f"pipeline exec input, silence_front:{silence_front}, out_size:{out_size}")
 
-        enablePipelineTimer = False
-        with Timer2("Pipeline-Exec", enablePipelineTimer) as t:  # NOQA
+        with tracer.span("easyvc.exec") as t:
             # 16000のサンプリングレートで入ってきている。以降この世界は16000で処理。
             # self.t_pad = self.sr * repeat  # 1秒
             # self.t_pad_tgt = self.targetSR * repeat  # 1秒　出力時のトリミング(モデルのサンプリングで出力される)
@@ -165,14 +166,14 @@ class Pipeline(object):
             assert feats.dim() == 1, feats.dim()
             feats = feats.view(1, -1)
 
-            t.record("pre-process")
+            t.lap("pre")
             # ピッチ検出
             pitch, pitchf = self.extractPitch(audio_pad, if_f0, pitchf, f0_up_key, silence_front)
-            t.record("extract-pitch")
+            t.lap("pitch")
 
             # embedding
             feats = self.extractFeatures(feats)
-            t.record("extract-feats")
+            t.lap("feature")
 
             feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
             # if protect < 0.5 and search_index:
@@ -203,10 +204,10 @@ class Pipeline(object):
                 pitchf = pitchf[:, -feats_len:]
             p_len = torch.tensor([feats_len], device=self.device).long()
 
-            t.record("mid-precess")
+            t.lap("mid")
             # 推論実行
             audio1 = self.infer(feats, p_len, pitch, pitchf, sid, out_size)
-            t.record("infer")
+            t.lap("infer")
 
             feats_buffer = feats.squeeze(0).detach().cpu()
             if pitchf is not None:
@@ -225,12 +226,13 @@ class Pipeline(object):
                 audio1 = audio1[offset:end]
 
             del sid
-            t.record("post-process")
+            t.lap("post")
             # torch.cuda.empty_cache()
         # print("EXEC AVERAGE:", t.avrSecs)
         return audio1, pitchf_buffer, feats_buffer
 
     def __del__(self):
+        EmbedderManager.releaseEmbedder(self.embedder)  # 他のパイプラインと共有している
         del self.embedder
         del self.inferencer
         del self.pitchExtractor
@@ -1,16 +1,17 @@
+import copy
 import traceback
 from typing import Any, cast
 from scipy import signal
 import os
 from dataclasses import dataclass, asdict, field
-import resampy
 from data.ModelSlot import LLVCModelSlot
 from mods.log_control import VoiceChangaerLogger
 import numpy as np
 from voice_changer.LLVC.LLVCInferencer import LLVCInferencer
 from voice_changer.ModelSlotManager import ModelSlotManager
 from voice_changer.VoiceChangerParamsManager import VoiceChangerParamsManager
-from voice_changer.utils.Timer import Timer2
+from voice_changer.common.StreamingResampler import StreamingResampler
+from voice_changer.utils.Tracer import Tracer
 from voice_changer.utils.VoiceChangerModel import AudioInOut, AudioInOutFloat, VoiceChangerModel
 from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
 import math
@@ -18,6 +19,7 @@ import torchaudio
 import torch
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 @dataclass
@@ -74,6 +76,8 @@ class LLVC(VoiceChangerModel):
 
         self.downsampler = torchaudio.transforms.Resample(self.inputSampleRate, self.processingSampleRate)
         self.upsampler = torchaudio.transforms.Resample(self.processingSampleRate, self.outputSampleRate)
+        self.inputResampler: StreamingResampler | None = None
+        self.outputResampler = StreamingResampler(self.processingSampleRate, self.outputSampleRate)
 
         self.inferencer = LLVCInferencer().loadModel(modelPath, configPath)
         self.prev_audio1 = None
@@ -99,6 +103,27 @@ class LLVC(VoiceChangerModel):
         self.outputSampleRate = outputSampleRate
         self.downsampler = torchaudio.transforms.Resample(self.inputSampleRate, self.processingSampleRate)
         self.upsampler = torchaudio.transforms.Resample(self.processingSampleRate, self.outputSampleRate)
+        self.inputResampler = StreamingResampler(self.inputSampleRate, self.processingSampleRate)
+        self.outputResampler = StreamingResampler(self.processingSampleRate, self.outputSampleRate)
+
+    def cloneStream(self):
+        clone = copy.copy(self)
+        clone.settings = copy.copy(self.settings)
+        clone.inferencer = copy.copy(self.inferencer)  # モデルは共有し、バッファは setStreamState で作り直す
+        return clone
+
+    def getStreamState(self):
+        return {
+            "inputResampler": self.inputResampler,
+            "prev_audio1": self.prev_audio1,
+            "inferencer": self.inferencer.getStreamState(),
+        }
+
+    def setStreamState(self, state: dict | None):
+        # inputResampler は _preprocess でサンプリングレートを確認して作り直される
+        self.inputResampler = state["inputResampler"] if state is not None else None
+        self.prev_audio1 = state["prev_audio1"] if state is not None else None
+        self.inferencer.setStreamState(state["inferencer"] if state is not None else None)
 
     def _preprocess(self, waveform: AudioInOutFloat, srcSampleRate: int) -> AudioInOutFloat:
         """データ前処理(torch independent)
@@ -118,7 +143,9 @@ class LLVC(VoiceChangerModel):
         """
         if waveform.ndim == 2:  # double channels
             waveform = waveform.mean(axis=-1)
-        waveform16K = resampy.resample(waveform, srcSampleRate, self.processingSampleRate)
+        if self.inputResampler is None or self.inputResampler.isFor(srcSampleRate, self.processingSampleRate) is False:
+            self.inputResampler = StreamingResampler(srcSampleRate, self.processingSampleRate)
+        waveform16K = self.inputResampler.process(waveform)
         # waveform16K = self.downsampler(torch.from_numpy(waveform)).numpy()
         waveform16K = signal.filtfilt(self.bh, self.ah, waveform16K)
         return waveform16K.copy()
@@ -129,7 +156,7 @@ class LLVC(VoiceChangerModel):
             crossfade_frame16k = math.ceil((crossfade_frame / self.outputSampleRate) * self.processingSampleRate)
             sola_search_frame16k = math.ceil((sola_search_frame / self.outputSampleRate) * self.processingSampleRate)
 
-            with Timer2("mainPorcess timer", False) as t:
+            with tracer.span("llvc.inference"):
                 # 起動パラメータ
                 # vcParams = VoiceChangerParamsManager.get_instance().params
 
@@ -159,7 +186,7 @@ class LLVC(VoiceChangerModel):
                 self.prev_audio1 = new_audio[-crossfade_audio_length:]  # 次回のクロスフェード用に保存
                 # (2) リサンプル
                 if self.outputSampleRate != self.processingSampleRate:
-                    new_audio = resampy.resample(new_audio, self.processingSampleRate, self.outputSampleRate)
+                    new_audio = self.outputResampler.resample(new_audio)  # prev_audio1と重なっているので状態を持たない変換
                     # new_audio = self.upsampler(torch.from_numpy(new_audio)).numpy()
                     # new_audio = np.repeat(new_audio, 3)
 
@@ -15,6 +15,25 @@ class LLVCInferencer:
 
         self.config = config
         self.model = model
+        self.setStreamState(None)
+
+        return self
+
+    def getStreamState(self):
+        return {
+            "enc_buf": self.enc_buf,
+            "dec_buf": self.dec_buf,
+            "out_buf": self.out_buf,
+            "convnet_pre_ctx": self.convnet_pre_ctx,
+            "audio_buffer": self.audio_buffer,
+            "front_ctx": self.front_ctx,
+        }
+
+    def setStreamState(self, state: dict | None):
+        if state is not None:
+            for key, val in state.items():
+                setattr(self, key, val)
+            return
 
         self.enc_buf, self.dec_buf, self.out_buf = self.model.init_buffers(1, torch.device("cpu"))
 
@@ -26,8 +45,6 @@ class LLVCInferencer:
         self.audio_buffer: AudioInOutFloat = np.zeros(0, dtype=np.float32)
         self.front_ctx: AudioInOutFloat | None = None
 
-        return self
-
     def infer(
         self,
         audio: AudioInOutFloat,
@@ -0,0 +1,53 @@
+"""
+■ AudioFifo
+- サーバーオーディオ用の single-producer / single-consumer のリングバッファ
+・書き込み側(producer)は writePos だけ、読み出し側(consumer)は readPos だけを更新する。ロックは使わない。
+  (位置は単調増加する int。CPython では int の代入はアトミックなので、データを書き終えてから位置を進めれば安全)
+・sounddevice のコールバックからはコピーだけを行い、推論は別スレッドで行うために使う。
+"""
+
+import numpy as np
+
+
+class AudioFifo:
+    def __init__(self, capacity: int, dtype=np.float32):
+        self.capacity = max(1, int(capacity))
+        self.buffer = np.zeros(self.capacity, dtype=dtype)
+        self.writePos = 0
+        self.readPos = 0
+
+    def available(self) -> int:
+        return self.writePos - self.readPos
+
+    def space(self) -> int:
+        return self.capacity - self.available()
+
+    def write(self, data: np.ndarray) -> bool:
+        # producer 側。空きが足りない場合は書き込まずに False を返す。(呼び出し側で overrun として数える)
+        length = data.shape[0]
+        if length > self.space():
+            return False
+        start = self.writePos % self.capacity
+        first = min(length, self.capacity - start)
+        self.buffer[start : start + first] = data[:first]
+        if first < length:
+            self.buffer[: length - first] = data[first:]
+        self.writePos += length
+        return True
+
+    def read(self, out: np.ndarray) -> int:
+        # consumer 側。最大 len(out) サンプルを out の先頭に読み出して、読み出したサンプル数を返す。
+        length = min(out.shape[0], self.available())
+        start = self.readPos % self.capacity
+        first = min(length, self.capacity - start)
+        out[:first] = self.buffer[start : start + first]
+        if first < length:
+            out[first:length] = self.buffer[: length - first]
+        self.readPos += length
+        return length
+
+    def skip(self, length: int) -> int:
+        # consumer 側。古いデータを捨てる。
+        length = min(length, self.available())
+        self.readPos += length
+        return length
@@ -3,14 +3,14 @@ from dataclasses import dataclass, asdict
 import numpy as np
 from const import SERVER_DEVICE_SAMPLE_RATES
 
-from queue import Queue
+import threading
 from mods.log_control import VoiceChangaerLogger
 
 from voice_changer.Local.AudioDeviceList import checkSamplingRate, list_audio_device
+from voice_changer.Local.AudioFifo import AudioFifo
 import time
 import sounddevice as sd
-from voice_changer.utils.Timer import Timer2
-import librosa
+from voice_changer.utils.Tracer import Tracer
 
 from voice_changer.utils.VoiceChangerModel import AudioInOut
 from typing import Protocol
@@ -20,6 +20,7 @@ from typing import Literal, TypeAlias
 AudioDeviceKind: TypeAlias = Literal["input", "output"]
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 # See https://github.com/w-okada/voice-changer/issues/620
 LocalServerDeviceMode: TypeAlias = Literal[
@@ -48,6 +49,7 @@ class ServerDeviceSettings:
     serverInputAudioGain: float = 1.0
     serverOutputAudioGain: float = 1.0
     serverMonitorAudioGain: float = 1.0
+    serverOutputLatency: int = 0  # ms 出力リングに貯めておく目標量(0: 1ブロック分)
 
     exclusiveMode: bool = False
 
@@ -64,6 +66,7 @@ EditableServerDeviceSettings = {
         "serverOutputDeviceId",
         "serverMonitorDeviceId",
         "serverReadChunkSize",
+        "serverOutputLatency",
     ],
     "floatData": [
         "serverInputAudioGain",
@@ -99,10 +102,25 @@ class ServerDevice:
         self.mon_wav = None
         self.serverAudioInputDevices = None
         self.serverAudioOutputDevices = None
-        self.outQueue = Queue()
-        self.monQueue = Queue()
         self.performance = []
 
+        # オーディオデバイスのコールバックはリングへのコピーだけを行い、推論は専用のスレッドで実行する
+        self.inputFifo: AudioFifo | None = None
+        self.outputFifo: AudioFifo | None = None
+        self.monitorFifo: AudioFifo | None = None
+        self.outputPrimed = False
+        self.monitorPrimed = False
+        self.targetLatency = 0  # samples
+        self.inferenceThread: threading.Thread | None = None
+        self.inferenceStop = threading.Event()
+        self.inputReady = threading.Event()
+
+        self.inputOverrun = 0  # 推論が追いつかず入力を捨てた回数
+        self.outputOverrun = 0  # 出力が目標量を大きく超えたので古いデータを捨てた回数
+        self.outputUnderrun = 0  # 出力デバイスに渡すデータが足りなかった回数
+        self.monitorUnderrun = 0
+        self.monitorOverrun = 0
+
         # setting change確認用
         self.currentServerInputDeviceId = -1
         self.currentServerOutputDeviceId = -1
@@ -110,6 +128,7 @@ class ServerDevice:
         self.currentModelSamplingRate = -1
         self.currentInputChunkNum = -1
         self.currentAudioSampleRate = -1
+        self.currentOutputLatency = -1
 
     def getServerInputAudioDevice(self, index: int):
         audioinput, _audiooutput = list_audio_device()
@@ -132,46 +151,62 @@ class ServerDevice:
     ###########################################
 
     def _processData(self, indata: np.ndarray):
-        indata = indata * self.settings.serverInputAudioGain
-        unpackedData = librosa.to_mono(indata.T) * 32768.0
-        unpackedData = unpackedData.astype(np.int16)
+        unpackedData = (indata * 32768.0).astype(np.int16)
         out_wav, times = self.serverDeviceCallbacks.on_request(unpackedData)
         return out_wav, times
 
     def _processDataWithTime(self, indata: np.ndarray):
-        with Timer2("all_inference_time", False) as t:
+        with tracer.span("server.inference") as t:
             out_wav, times = self._processData(indata)
         all_inference_time = t.secs
         self.performance = [all_inference_time] + times
-        self.serverDeviceCallbacks.emitTo(self.performance)
+        self.serverDeviceCallbacks.emitTo(list(self.performance))  # ブロックしない(送信はイベントループ側)
         self.performance = [round(x * 1000) for x in self.performance]
         return out_wav
 
-    def audio_callback_outQueue(self, indata: np.ndarray, outdata: np.ndarray, frames, times, status):
+    def _writeInput(self, indata: np.ndarray):
+        # コールバック内ではゲインとモノラル化とコピーだけ
+        mono = indata.mean(axis=1) * self.settings.serverInputAudioGain
+        if self.inputFifo.write(mono) is False:
+            self.inputOverrun += 1
+        self.inputReady.set()
+
+    def _readOutput(self, fifo: AudioFifo, outdata: np.ndarray, gain: float, primed: bool):
+        # 目標量が貯まるまでは無音を出す。足りなくなったら underrun として貯め直す。
+        # 戻り値は (primed, underrun, overrun)。回数は呼び出し元で出力 / モニターのどちらかに数える。
+        frames = outdata.shape[0]
+        if primed is False:
+            if fifo.available() < self.targetLatency:
+                outdata.fill(0)
+                return False, False, False
+            primed = True
+        overrun = False
+        if fifo.available() > self.targetLatency + 2 * frames:
+            # 遅延が増えすぎたので古いデータを捨てて目標量に戻す
+            fifo.skip(fifo.available() - self.targetLatency)
+            overrun = True
+        mono = np.zeros(frames, dtype=np.float32)
+        read = fifo.read(mono)
+        outdata[:] = mono[:, None] * gain
+        if read < frames:
+            return False, True, overrun
+        return True, False, overrun
+
+    def audio_callback(self, indata: np.ndarray, outdata: np.ndarray, frames, times, status):
+        # 入力とモニターが同じデバイス(sd.Stream)の場合
         try:
-            out_wav = self._processDataWithTime(indata)
-
-            self.outQueue.put(out_wav)
-            outputChannels = outdata.shape[1]  # Monitorへのアウトプット
-            outdata[:] = np.repeat(out_wav, outputChannels).reshape(-1, outputChannels) / 32768.0
-            outdata[:] = outdata * self.settings.serverMonitorAudioGain
+            self._writeInput(indata)
+            self.monitorPrimed, underrun, overrun = self._readOutput(self.monitorFifo, outdata, self.settings.serverMonitorAudioGain, self.monitorPrimed)
+            if underrun:
+                self.monitorUnderrun += 1
+            if overrun:
+                self.monitorOverrun += 1
         except Exception as e:
             print("[Voice Changer] ex:", e)
 
-    def audioInput_callback_outQueue(self, indata: np.ndarray, frames, times, status):
+    def audioInput_callback(self, indata: np.ndarray, frames, times, status):
         try:
-            out_wav = self._processDataWithTime(indata)
-            self.outQueue.put(out_wav)
-        except Exception as e:
-            print("[Voice Changer][ServerDevice][audioInput_callback] ex:", e)
-            # import traceback
-            # traceback.print_exc()
-
-    def audioInput_callback_outQueue_monQueue(self, indata: np.ndarray, frames, times, status):
-        try:
-            out_wav = self._processDataWithTime(indata)
-            self.outQueue.put(out_wav)
-            self.monQueue.put(out_wav)
+            self._writeInput(indata)
         except Exception as e:
             print("[Voice Changer][ServerDevice][audioInput_callback] ex:", e)
             # import traceback
@@ -179,12 +214,11 @@ class ServerDevice:
 
     def audioOutput_callback(self, outdata: np.ndarray, frames, times, status):
         try:
-            out_wav = self.outQueue.get()
-            while self.outQueue.qsize() > 0:
-                self.outQueue.get()
-            outputChannels = outdata.shape[1]
-            outdata[:] = np.repeat(out_wav, outputChannels).reshape(-1, outputChannels) / 32768.0
-            outdata[:] = outdata * self.settings.serverOutputAudioGain
+            self.outputPrimed, underrun, overrun = self._readOutput(self.outputFifo, outdata, self.settings.serverOutputAudioGain, self.outputPrimed)
+            if underrun:
+                self.outputUnderrun += 1
+            if overrun:
+                self.outputOverrun += 1
         except Exception as e:
             print("[Voice Changer][ServerDevice][audioOutput_callback]  ex:", e)
             # import traceback
@@ -192,17 +226,63 @@ class ServerDevice:
 
     def audioMonitor_callback(self, outdata: np.ndarray, frames, times, status):
         try:
-            mon_wav = self.monQueue.get()
-            while self.monQueue.qsize() > 0:
-                self.monQueue.get()
-            outputChannels = outdata.shape[1]
-            outdata[:] = np.repeat(mon_wav, outputChannels).reshape(-1, outputChannels) / 32768.0
-            outdata[:] = outdata * self.settings.serverMonitorAudioGain
+            self.monitorPrimed, underrun, overrun = self._readOutput(self.monitorFifo, outdata, self.settings.serverMonitorAudioGain, self.monitorPrimed)
+            if underrun:
+                self.monitorUnderrun += 1
+            if overrun:
+                self.monitorOverrun += 1
         except Exception as e:
             print("[Voice Changer][ServerDevice][audioMonitor_callback]  ex:", e)
             # import traceback
             # traceback.print_exc()
 
+    ###########################################
+    # Inference Thread Section
+    ###########################################
+    def _inferenceLoop(self, block_frame: int):
+        block = np.zeros(block_frame, dtype=np.float32)
+        while self.inferenceStop.is_set() is False:
+            if self.inputFifo.available() < block_frame:
+                self.inputReady.wait(timeout=0.1)
+                self.inputReady.clear()
+                continue
+            self.inputFifo.read(block)
+            try:
+                out_wav = self._processDataWithTime(block)
+            except Exception as e:
+                print("[Voice Changer][ServerDevice][inference] ex:", e)
+                continue
+            out_wav = out_wav.astype(np.float32) / 32768.0
+            if self.outputFifo.write(out_wav) is False:
+                self.outputOverrun += 1
+            if self.monitorFifo is not None and self.monitorFifo.write(out_wav) is False:
+                self.monitorOverrun += 1
+
+    def startInferenceThread(self, block_frame: int, withMonitor: bool):
+        sampleRate = self.settings.serverOutputAudioSampleRate
+        self.targetLatency = max(block_frame, int(self.settings.serverOutputLatency * sampleRate / 1000))
+        self.inputFifo = AudioFifo(block_frame * 8)
+        self.outputFifo = AudioFifo(self.targetLatency + block_frame * 8)
+        self.monitorFifo = AudioFifo(self.targetLatency + block_frame * 8) if withMonitor else None
+        self.outputPrimed = False
+        self.monitorPrimed = False
+        self.inputOverrun = 0
+        self.outputOverrun = 0
+        self.outputUnderrun = 0
+        self.monitorUnderrun = 0
+        self.monitorOverrun = 0
+
+        self.inferenceStop.clear()
+        self.inferenceThread = threading.Thread(target=self._inferenceLoop, args=(block_frame,), daemon=True, name="server-audio-inference")
+        self.inferenceThread.start()
+
+    def stopInferenceThread(self):
+        self.inferenceStop.set()
+        self.inputReady.set()
+        if self.inferenceThread is not None:
+            self.inferenceThread.join()
+            self.inferenceThread = None
+
     ###########################################
     # Main Loop Section
     ###########################################
@@ -228,39 +308,46 @@ class ServerDevice:
         elif self.currentAudioSampleRate != self.settings.serverAudioSampleRate:
             print(f"currentAudioSampleRate Changed: {self.currentAudioSampleRate} -> {self.settings.serverAudioSampleRate}")
             return True
+        elif self.currentOutputLatency != self.settings.serverOutputLatency:
+            print(f"currentOutputLatency Changed: {self.currentOutputLatency} -> {self.settings.serverOutputLatency}")
+            return True
         else:
             return False
 
+    def printStatus(self):
+        print(f"[Voice Changer] server audio performance {self.performance}")
+        print(f"                engine: latency:{self.targetLatency}, in_overrun:{self.inputOverrun}, out_overrun:{self.outputOverrun}, out_underrun:{self.outputUnderrun}, mon_underrun:{self.monitorUnderrun}, mon_overrun:{self.monitorOverrun}")
+
     def runNoMonitorSeparate(self, block_frame: int, inputMaxChannel: int, outputMaxChannel: int, inputExtraSetting, outputExtraSetting):
-        with sd.InputStream(callback=self.audioInput_callback_outQueue, dtype="float32", device=self.settings.serverInputDeviceId, blocksize=block_frame, samplerate=self.settings.serverInputAudioSampleRate, channels=inputMaxChannel, extra_settings=inputExtraSetting):
+        with sd.InputStream(callback=self.audioInput_callback, dtype="float32", device=self.settings.serverInputDeviceId, blocksize=block_frame, samplerate=self.settings.serverInputAudioSampleRate, channels=inputMaxChannel, extra_settings=inputExtraSetting):
             with sd.OutputStream(callback=self.audioOutput_callback, dtype="float32", device=self.settings.serverOutputDeviceId, blocksize=block_frame, samplerate=self.settings.serverOutputAudioSampleRate, channels=outputMaxChannel, extra_settings=outputExtraSetting):
                 while True:
                     changed = self.checkSettingChanged()
                     if changed:
                         break
                     time.sleep(2)
-                    print(f"[Voice Changer] server audio performance {self.performance}")
+                    self.printStatus()
                     print(f"                status: started:{self.settings.serverAudioStated}, model_sr:{self.currentModelSamplingRate}, chunk:{self.currentInputChunkNum}")
                     print(f"                input  : id:{self.settings.serverInputDeviceId}, sr:{self.settings.serverInputAudioSampleRate}, ch:{inputMaxChannel}")
                     print(f"                output : id:{self.settings.serverOutputDeviceId}, sr:{self.settings.serverOutputAudioSampleRate}, ch:{outputMaxChannel}")
                     # print(f"                monitor: id:{self.settings.serverMonitorDeviceId}, sr:{self.settings.serverMonitorAudioSampleRate}, ch:{self.serverMonitorAudioDevice.maxOutputChannels}")
 
     def runWithMonitorStandard(self, block_frame: int, inputMaxChannel: int, outputMaxChannel: int, monitorMaxChannel: int, inputExtraSetting, outputExtraSetting, monitorExtraSetting):
-        with sd.Stream(callback=self.audio_callback_outQueue, dtype="float32", device=(self.settings.serverInputDeviceId, self.settings.serverMonitorDeviceId), blocksize=block_frame, samplerate=self.settings.serverInputAudioSampleRate, channels=(inputMaxChannel, monitorMaxChannel), extra_settings=[inputExtraSetting, monitorExtraSetting]):
+        with sd.Stream(callback=self.audio_callback, dtype="float32", device=(self.settings.serverInputDeviceId, self.settings.serverMonitorDeviceId), blocksize=block_frame, samplerate=self.settings.serverInputAudioSampleRate, channels=(inputMaxChannel, monitorMaxChannel), extra_settings=[inputExtraSetting, monitorExtraSetting]):
             with sd.OutputStream(callback=self.audioOutput_callback, dtype="float32", device=self.settings.serverOutputDeviceId, blocksize=block_frame, samplerate=self.settings.serverOutputAudioSampleRate, channels=outputMaxChannel, extra_settings=outputExtraSetting):
                 while True:
                     changed = self.checkSettingChanged()
                     if changed:
                         break
                     time.sleep(2)
-                    print(f"[Voice Changer] server audio performance {self.performance}")
+                    self.printStatus()
                     print(f"                status: started:{self.settings.serverAudioStated}, model_sr:{self.currentModelSamplingRate}, chunk:{self.currentInputChunkNum}")
                     print(f"                input  : id:{self.settings.serverInputDeviceId}, sr:{self.settings.serverInputAudioSampleRate}, ch:{inputMaxChannel}")
                     print(f"                output : id:{self.settings.serverOutputDeviceId}, sr:{self.settings.serverOutputAudioSampleRate}, ch:{outputMaxChannel}")
                     print(f"                monitor: id:{self.settings.serverMonitorDeviceId}, sr:{self.settings.serverMonitorAudioSampleRate}, ch:{monitorMaxChannel}")
 
     def runWithMonitorAllSeparate(self, block_frame: int, inputMaxChannel: int, outputMaxChannel: int, monitorMaxChannel: int, inputExtraSetting, outputExtraSetting, monitorExtraSetting):
-        with sd.InputStream(callback=self.audioInput_callback_outQueue_monQueue, dtype="float32", device=self.settings.serverInputDeviceId, blocksize=block_frame, samplerate=self.settings.serverInputAudioSampleRate, channels=inputMaxChannel, extra_settings=inputExtraSetting):
+        with sd.InputStream(callback=self.audioInput_callback, dtype="float32", device=self.settings.serverInputDeviceId, blocksize=block_frame, samplerate=self.settings.serverInputAudioSampleRate, channels=inputMaxChannel, extra_settings=inputExtraSetting):
             with sd.OutputStream(callback=self.audioOutput_callback, dtype="float32", device=self.settings.serverOutputDeviceId, blocksize=block_frame, samplerate=self.settings.serverOutputAudioSampleRate, channels=outputMaxChannel, extra_settings=outputExtraSetting):
                 with sd.OutputStream(callback=self.audioMonitor_callback, dtype="float32", device=self.settings.serverMonitorDeviceId, blocksize=block_frame, samplerate=self.settings.serverMonitorAudioSampleRate, channels=monitorMaxChannel, extra_settings=monitorExtraSetting):
                     while True:
@@ -268,7 +355,7 @@ class ServerDevice:
                         if changed:
                             break
                         time.sleep(2)
-                        print(f"[Voice Changer] server audio performance {self.performance}")
+                        self.printStatus()
                         print(f"                status: started:{self.settings.serverAudioStated}, model_sr:{self.currentModelSamplingRate}, chunk:{self.currentInputChunkNum}")
                         print(f"                input  : id:{self.settings.serverInputDeviceId}, sr:{self.settings.serverInputAudioSampleRate}, ch:{inputMaxChannel}")
                         print(f"                output : id:{self.settings.serverOutputDeviceId}, sr:{self.settings.serverOutputAudioSampleRate}, ch:{outputMaxChannel}")
@@ -381,6 +468,7 @@ class ServerDevice:
 
                 # Blockサイズを計算
                 self.currentInputChunkNum = self.settings.serverReadChunkSize
+                self.currentOutputLatency = self.settings.serverOutputLatency
                 # block_frame = currentInputChunkNum * 128
                 block_frame = int(self.currentInputChunkNum * 128 * (self.settings.serverInputAudioSampleRate / 48000))
 
@@ -407,6 +495,7 @@ class ServerDevice:
                                 raise RuntimeError(f"Cannot JudgeServerMode, in:{serverInputAudioDevice.hostAPI}, mon:{serverMonitorAudioDevice.hostAPI}, out:{serverOutputAudioDevice.hostAPI}")
 
                     serverDeviceMode = judgeServerDeviceMode()
+                    self.startInferenceThread(block_frame, serverDeviceMode != "NoMonitorSeparate")
                     if serverDeviceMode == "NoMonitorSeparate":
                         self.runNoMonitorSeparate(block_frame, serverInputAudioDevice.maxInputChannels, serverOutputAudioDevice.maxOutputChannels, inputExtraSetting, outputExtraSetting)
                     elif serverDeviceMode == "WithMonitorStandard":
@@ -422,6 +511,8 @@ class ServerDevice:
 
                     traceback.print_exc()
                     time.sleep(2)
+                finally:
+                    self.stopInferenceThread()
 
     ###########################################
     # Info Section
@@ -437,6 +528,14 @@ class ServerDevice:
 
         data["serverAudioInputDevices"] = self.serverAudioInputDevices
         data["serverAudioOutputDevices"] = self.serverAudioOutputDevices
+        data["serverAudioEngine"] = {
+            "targetLatency": self.targetLatency,
+            "inputOverrun": self.inputOverrun,
+            "outputOverrun": self.outputOverrun,
+            "outputUnderrun": self.outputUnderrun,
+            "monitorUnderrun": self.monitorUnderrun,
+            "monitorOverrun": self.monitorOverrun,
+        }
         return data
 
     def update_settings(self, key: str, val: str | int | float):
@@ -3,6 +3,7 @@ import os
 from data.ModelSlot import MMVCv13ModelSlot
 from voice_changer.VoiceChangerParamsManager import VoiceChangerParamsManager
 
+from voice_changer.common.RingBuffer import RingBuffer
 from voice_changer.utils.VoiceChangerModel import AudioInOut, VoiceChangerModel
 
 if sys.platform.startswith("darwin"):
@@ -59,7 +60,7 @@ class MMVCv13(VoiceChangerModel):
         self.gpu_num = torch.cuda.device_count()
         self.text_norm = torch.LongTensor([0, 6, 0])
 
-        self.audio_buffer: AudioInOut | None = None
+        self.audio_buffer: RingBuffer | None = None
         self.slotInfo = slotInfo
         self.initialize()
 
@@ -186,13 +187,6 @@ class MMVCv13(VoiceChangerModel):
     ):
         newData = newData.astype(np.float32) / self.hps.data.max_wav_value
 
-        if self.audio_buffer is not None:
-            self.audio_buffer = np.concatenate(
-                [self.audio_buffer, newData], 0
-            )  # 過去のデータに連結
-        else:
-            self.audio_buffer = newData
-
         convertSize = inputSize + crossfadeSize + solaSearchFrame
 
         # if convertSize < 8192:
@@ -202,10 +196,14 @@ class MMVCv13(VoiceChangerModel):
                 self.hps.data.hop_length - (convertSize % self.hps.data.hop_length)
             )
 
-        convertOffset = -1 * convertSize
-        self.audio_buffer = self.audio_buffer[convertOffset:]  # 変換対象の部分だけ抽出
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
+        else:
+            self.audio_buffer.resize(convertSize)
+        self.audio_buffer.append(newData)  # 過去のデータに連結
+        audio_buffer = self.audio_buffer.filled_view()  # 変換対象の部分だけ抽出(コピー無し)
 
-        audio = torch.FloatTensor(self.audio_buffer)
+        audio = torch.FloatTensor(audio_buffer)
         audio_norm = audio.unsqueeze(0)  # unsqueeze
         spec = self._get_spec(audio_norm)
         sid = torch.LongTensor([int(self.settings.srcId)])
@@ -2,6 +2,7 @@ import sys
 import os
 from data.ModelSlot import MMVCv15ModelSlot
 from voice_changer.VoiceChangerParamsManager import VoiceChangerParamsManager
+from voice_changer.common.RingBuffer import RingBuffer
 from voice_changer.utils.VoiceChangerModel import AudioInOut, VoiceChangerModel
 
 if sys.platform.startswith("darwin"):
@@ -67,7 +68,7 @@ class MMVCv15(VoiceChangerModel):
         self.gpu_num = torch.cuda.device_count()
 
         self.slotInfo = slotInfo
-        self.audio_buffer: AudioInOut | None = None
+        self.audio_buffer: RingBuffer | None = None
         self.initialize()
 
     def initialize(self):
@@ -249,13 +250,6 @@ class MMVCv15(VoiceChangerModel):
 
         newData = newData.astype(np.float32) / self.hps.data.max_wav_value
 
-        if self.audio_buffer is not None:
-            self.audio_buffer = np.concatenate(
-                [self.audio_buffer, newData], 0
-            )  # 過去のデータに連結
-        else:
-            self.audio_buffer = newData
-
         convertSize = inputSize + crossfadeSize + solaSearchFrame
 
         # if convertSize < 8192:
@@ -269,12 +263,16 @@ class MMVCv15(VoiceChangerModel):
         if self.slotInfo.isONNX:
             convertSize = self.onxx_input_length
 
-        convertOffset = -1 * convertSize
-        self.audio_buffer = self.audio_buffer[convertOffset:]  # 変換対象の部分だけ抽出
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
+        else:
+            self.audio_buffer.resize(convertSize)
+        self.audio_buffer.append(newData)  # 過去のデータに連結
+        audio_buffer = self.audio_buffer.filled_view()  # 変換対象の部分だけ抽出(コピー無し)
 
-        f0 = self._get_f0(self.settings.f0Detector, self.audio_buffer)  # torch
+        f0 = self._get_f0(self.settings.f0Detector, audio_buffer)  # torch
         f0 = (f0 * self.settings.f0Factor).unsqueeze(0).unsqueeze(0)
-        spec = self._get_spec(self.audio_buffer)  # torch
+        spec = self._get_spec(audio_buffer)  # torch
         sid = torch.LongTensor([int(self.settings.srcId)])
         return [spec, f0, sid]
 
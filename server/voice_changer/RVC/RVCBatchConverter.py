@@ -0,0 +1,193 @@
+"""
+■ RVCBatchConverter
+- ファイルをまとめて変換するオフライン(非リアルタイム)の変換
+・リアルタイムの経路(VoiceChangerV2 + RVCr2)は使わず、Pipeline(embedder, pitch extractor, inferencer, index)を直接使う。
+  チャンク毎の SOLA、クロスフェード、extraConvertSize の再計算が無い。
+・ファイル全体を windowSec 秒の大きなウィンドウに分けて、前後に contextSec 秒のコンテキストを付けて exec する。
+  ウィンドウの中央部分だけを使い、つなぎ目は crossFadeSec 秒の直線のクロスフェードでつなぐ。(SOLA の探索はしない)
+  ウィンドウの位置はファイルの長さだけで決まり、ウィンドウ毎に乱数の seed を固定するので、同じ入力からは同じ出力になる。
+・convertFiles で複数ファイルを並列に変換する。
+  process: ファイル毎にプロセスを分ける。(CPU で変換する場合。プロセス毎にモデルを読み込む)
+  thread: 一つのパイプラインを共有する。exec は一つずつ実行し、読み込み / リサンプル / 書き出しを並行して行う。(GPU の場合)
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+import os
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from data.ModelSlot import RVCModelSlot
+from mods.log_control import VoiceChangaerLogger
+from voice_changer.RVC.embedder.EmbedderManager import EmbedderManager
+from voice_changer.RVC.pipeline.PipelineGenerator import createPipeline
+from voice_changer.RVC.pitchExtractor.PitchExtractorManager import PitchExtractorManager
+from voice_changer.common.StreamingResampler import StreamingResampler
+from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
+
+logger = VoiceChangaerLogger.get_instance().getLogger()
+
+HOP = 160  # pitch / feature のフレーム(16k)
+EMBED_HOP = 320  # embedder のフレーム(16k)
+
+
+@dataclass
+class BatchConvertSettings:
+    tran: int = 0
+    dstId: int = 0
+    indexRatio: float = 0.0
+    protect: float = 0.5
+    f0Detector: str = "rmvpe"
+    gpu: int = 0
+
+    windowSec: float = 30.0  # 一回の exec で変換する長さ(コンテキストを除く)
+    contextSec: float = 1.0  # ウィンドウの前後に付けるコンテキスト
+    crossFadeSec: float = 0.05  # ウィンドウのつなぎ目のクロスフェード
+    seed: int = 0
+    outputSampleRate: int = 0  # 0: モデルのサンプリングレートのまま
+
+
+def resampleLong(audio: np.ndarray, src_sr: int, dst_sr: int, block: int = 65536):
+    # 長い音声のリサンプル。StreamingResampler.resample は一度に全体を計算するのでメモリが足りなくなる。
+    resampler = StreamingResampler(src_sr, dst_sr)
+    if resampler.filter is None:
+        return audio.astype(np.float32)
+    outs = [resampler.process(audio[start : start + block]) for start in range(0, audio.shape[0], block)]
+    outs.append(resampler.process(np.zeros(resampler.filter.taps + 1, dtype=np.float32)))  # 遅れて出てくる分を出し切る
+    return np.concatenate(outs)[: resampler.filter.output_length(audio.shape[0])]
+
+
+class RVCBatchConverter:
+    def __init__(self, params: VoiceChangerParams, slotInfo: RVCModelSlot, settings: BatchConvertSettings):
+        EmbedderManager.initialize(params)
+        PitchExtractorManager.initialize(params)
+        self.slotInfo = slotInfo
+        self.settings = settings
+        self.pipeline = createPipeline(params, slotInfo, settings.gpu, settings.f0Detector)
+        self.execLock = threading.Lock()  # exec はパイプラインの状態と torch の乱数を使うので一つずつ
+
+    def convert(self, audio: np.ndarray) -> np.ndarray:
+        # audio: 16k, float32(-1.0 ~ 1.0)。モデルのサンプリングレートの float32 を返す。
+        targetSR = self.slotInfo.samplingRate
+        window = max(EMBED_HOP, int(self.settings.windowSec * 16000) // EMBED_HOP * EMBED_HOP)
+        context = int(self.settings.contextSec * 16000) // EMBED_HOP * EMBED_HOP
+        crossFade = int(self.settings.crossFadeSec * 16000) // HOP * HOP
+
+        length = audio.shape[0]
+        # 全てのウィンドウが同じ形になるように前後をゼロで埋める
+        padded = np.zeros(context + length + window + crossFade + context, dtype=np.float32)
+        padded[context : context + length] = audio
+
+        ratio = targetSR / 16000
+        outCrossFade = int(crossFade * ratio)
+        result = np.zeros(int((length + window + crossFade) * ratio), dtype=np.float32)
+        fadeIn = np.linspace(0.0, 1.0, outCrossFade, endpoint=False, dtype=np.float32)
+
+        for i, coreStart in enumerate(range(0, max(length, 1), window)):
+            segment = padded[coreStart : coreStart + context + window + crossFade + context]
+            out = self._exec(segment, i)
+
+            # コンテキストを除いた部分(次のウィンドウとのクロスフェード分を含む)
+            keepStart = int(context * ratio)
+            keepLength = int((window + crossFade) * ratio)
+            kept = np.zeros(keepLength, dtype=np.float32)
+            available = out[keepStart : keepStart + keepLength]
+            kept[: available.shape[0]] = available
+
+            pos = int(coreStart * ratio)
+            if i > 0 and outCrossFade > 0:
+                result[pos : pos + outCrossFade] = result[pos : pos + outCrossFade] * (1 - fadeIn) + kept[:outCrossFade] * fadeIn
+                result[pos + outCrossFade : pos + keepLength] = kept[outCrossFade:]
+            else:
+                result[pos : pos + keepLength] = kept
+
+        return result[: int(length * ratio)]
+
+    def _exec(self, segment: np.ndarray, windowIndex: int) -> np.ndarray:
+        frames = segment.shape[0] // HOP
+        with self.execLock:
+            torch.manual_seed(self.settings.seed + windowIndex)
+            audio = torch.from_numpy(segment).to(device=self.pipeline.device, dtype=torch.float32)
+            out, _, _ = self.pipeline.exec(
+                self.settings.dstId,
+                audio,
+                np.zeros(frames, dtype=np.float64),
+                np.zeros((frames, self.slotInfo.embChannels), dtype=np.float64),
+                self.settings.tran,
+                self.settings.indexRatio,
+                1 if self.slotInfo.f0 else 0,
+                0.0,
+                self.slotInfo.embOutputLayer,
+                self.slotInfo.useFinalProj,
+                0,
+                self.settings.protect,
+            )
+            return out.detach().cpu().numpy().astype(np.float32) / 32768.0
+
+    def convertFile(self, inputPath: str, outputPath: str):
+        start = time.perf_counter()
+        wav, sr = sf.read(inputPath, dtype="float32", always_2d=True)
+        wav = wav.mean(axis=1)
+        audio = resampleLong(wav, sr, 16000)
+
+        out = self.convert(audio)
+        outputSampleRate = self.settings.outputSampleRate if self.settings.outputSampleRate > 0 else self.slotInfo.samplingRate
+        out = resampleLong(out, self.slotInfo.samplingRate, outputSampleRate)
+
+        os.makedirs(os.path.dirname(os.path.abspath(outputPath)), exist_ok=True)
+        sf.write(outputPath, np.clip(out, -1.0, 1.0), outputSampleRate, subtype="PCM_16")
+        processTime = time.perf_counter() - start
+        duration = wav.shape[0] / sr
+        return {
+            "input": inputPath,
+            "output": outputPath,
+            "duration": duration,
+            "processTime": processTime,
+            "speed": duration / processTime if processTime > 0 else 0,  # 実時間の何倍の速さで変換できたか
+        }
+
+
+# process モードのワーカー(プロセス毎に一つ)
+_workerConverter: RVCBatchConverter | None = None
+
+
+def _initWorker(params: VoiceChangerParams, slotInfo: RVCModelSlot, settings: BatchConvertSettings, threads: int):
+    global _workerConverter
+    torch.set_num_threads(threads)
+    _workerConverter = RVCBatchConverter(params, slotInfo, settings)
+
+
+def _convertInWorker(inputPath: str, outputPath: str):
+    return _workerConverter.convertFile(inputPath, outputPath)
+
+
+def convertFiles(params: VoiceChangerParams, slotInfo: RVCModelSlot, settings: BatchConvertSettings, jobs: list[tuple[str, str]], workers: int = 0, mode: str = "auto"):
+    # jobs: (入力ファイル, 出力ファイル) のリスト。ファイル毎の結果(convertFile の戻り値 or エラー)を jobs の順に返す。
+    if mode == "auto":
+        mode = "thread" if settings.gpu >= 0 and torch.cuda.is_available() else "process"
+    if workers <= 0:
+        workers = 2 if mode == "thread" else max(1, min(len(jobs), (os.cpu_count() or 1) // 2))
+    logger.info(f"[Voice Changer] batch convert: {len(jobs)} files, {workers} {mode} workers")
+
+    if mode == "process":
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(params, slotInfo, settings, threads))
+        futures = [executor.submit(_convertInWorker, inputPath, outputPath) for inputPath, outputPath in jobs]
+    else:
+        converter = RVCBatchConverter(params, slotInfo, settings)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vc-batch")
+        futures = [executor.submit(converter.convertFile, inputPath, outputPath) for inputPath, outputPath in jobs]
+
+    results = []
+    with executor:
+        for (inputPath, outputPath), future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"[Voice Changer] batch convert failed: {inputPath}: {e}")
+                results.append({"input": inputPath, "output": outputPath, "error": str(e)})
+    return results
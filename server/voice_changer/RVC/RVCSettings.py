@@ -15,6 +15,13 @@ class RVCSettings:
     protect: float = 0.5
     rvcQuality: int = 0
     silenceFront: int = 1  # 0:off, 1:on
+    incrementalEmbed: int = 0  # 0:off, 1:on 新しく入ってきた音声だけをembeddingする
+    incrementalEmbedMargin: float = 0.5  # incrementalEmbed時にtransformerに渡す前方のコンテキスト(秒)
+    incrementalPitch: int = 0  # 0:off, 1:on 新しいフレームのf0だけを計算する
+    incrementalPitchMargin: float = 0.1  # incrementalPitch時にピッチ検出器に渡す前方のコンテキスト(秒)
+    concurrentExtract: int = 0  # 0:off, 1:on ピッチ検出とembeddingを並行して実行する
+    microBatch: int = 0  # 0:off, 1:on 複数セッションのembedding / 推論をまとめて実行する
+    microBatchWait: float = 0.003  # microBatch時に他のセッションを待つ最大時間(秒)
     modelSamplingRate: int = 48000
 
     speakers: dict[str, int] = field(default_factory=lambda: {})
@@ -28,6 +35,10 @@ class RVCSettings:
         "extraConvertSize",
         "rvcQuality",
         "silenceFront",
+        "incrementalEmbed",
+        "incrementalPitch",
+        "concurrentExtract",
+        "microBatch",
     ]
-    floatData = ["silentThreshold", "indexRatio", "protect"]
+    floatData = ["silentThreshold", "indexRatio", "protect", "incrementalEmbedMargin", "incrementalPitchMargin", "microBatchWait"]
     strData = ["f0Detector"]
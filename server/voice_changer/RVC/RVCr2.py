@@ -3,6 +3,7 @@ VoiceChangerV2向け
 """
 
 from dataclasses import asdict
+import copy
 import numpy as np
 import torch
 from data.ModelSlot import RVCModelSlot
@@ -10,16 +11,17 @@ from mods.log_control import VoiceChangaerLogger
 
 from voice_changer.RVC.RVCSettings import RVCSettings
 from voice_changer.RVC.embedder.EmbedderManager import EmbedderManager
+from voice_changer.common.RingBuffer import RingBuffer
+from voice_changer.common.StreamingResampler import StreamingResampler
+from voice_changer.utils.Tracer import Tracer
 from voice_changer.utils.VoiceChangerModel import (
     AudioInOut,
-    PitchfInOut,
-    FeatureInOut,
     VoiceChangerModel,
 )
 from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
 from voice_changer.RVC.onnxExporter.export2onnx import export2onnx
 from voice_changer.RVC.pitchExtractor.PitchExtractorManager import PitchExtractorManager
-from voice_changer.RVC.pipeline.PipelineGenerator import createPipeline
+from voice_changer.RVC.pipeline.PipelineCache import PipelineCache
 from voice_changer.RVC.deviceManager.DeviceManager import DeviceManager
 from voice_changer.RVC.pipeline.Pipeline import Pipeline
 
@@ -28,10 +30,11 @@ from Exceptions import (
     PipelineCreateException,
     PipelineNotInitializedException,
 )
-import resampy
+from torchaudio.transforms import Resample
 from typing import cast
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 class RVCr2(VoiceChangerModel):
@@ -48,22 +51,33 @@ class RVCr2(VoiceChangerModel):
 
         self.pipeline: Pipeline | None = None
 
-        self.audio_buffer: AudioInOut | None = None
-        self.pitchf_buffer: PitchfInOut | None = None
-        self.feature_buffer: FeatureInOut | None = None
+        self.audio_buffer: RingBuffer | None = None
+        self.pitchf_buffer: RingBuffer | None = None
+        self.feature_buffer: RingBuffer | None = None
         self.prevVol = 0.0
+        self.streamPosition = 0  # これまでに入力された音声の長さ(16K)。incremental embedding / pitch用
         self.slotInfo = slotInfo
+
+        self.tensorOutput = False  # True: 出力をpipeline.device上のtensorのまま返す(VoiceChangerV2のtorch SOLA用)
+        self.resample_kernel: dict[str, Resample] = {}
         # self.initialize()
 
     def initialize(self):
         logger.info("[Voice Changer][RVCr2] Initializing... ")
 
-        # pipelineの生成
+        # pipelineの生成(最近使ったスロットはキャッシュから取り出す)
+        pipelineCache = PipelineCache.get_instance()
+        pipelineCache.release(self.pipeline)
+        self.pipeline = None
         try:
-            self.pipeline = createPipeline(self.params, self.slotInfo, self.settings.gpu, self.settings.f0Detector)
+            self.pipeline = pipelineCache.acquire(self.params, self.slotInfo, self.settings.gpu, self.settings.f0Detector)
         except PipelineCreateException as e:  # NOQA
             logger.error("[Voice Changer] pipeline create failed. check your model is valid.")
             return
+        self.pipeline.setIncrementalEmbedding(self.settings.incrementalEmbed == 1, self.settings.incrementalEmbedMargin)
+        self.pipeline.setIncrementalPitch(self.settings.incrementalPitch == 1, self.settings.incrementalPitchMargin)
+        self.pipeline.setConcurrentExtract(self.settings.concurrentExtract == 1)
+        self.pipeline.setMicroBatch(self.settings.microBatch == 1, self.settings.microBatchWait)
 
         # その他の設定
         self.settings.tran = self.slotInfo.defaultTune
@@ -74,8 +88,61 @@ class RVCr2(VoiceChangerModel):
     def setSamplingRate(self, inputSampleRate, outputSampleRate):
         self.inputSampleRate = inputSampleRate
         self.outputSampleRate = outputSampleRate
+        self.inputResampler = StreamingResampler(self.inputSampleRate, 16000)
+        self.outputResampler = StreamingResampler(self.slotInfo.samplingRate, self.outputSampleRate)
         # self.initialize()
 
+    def cloneStream(self):
+        clone = copy.copy(self)
+        clone.settings = copy.copy(self.settings)
+        if self.pipeline is not None:
+            clone.pipeline = self.pipeline.cloneStream()
+        return clone
+
+    def getStreamState(self):
+        return {
+            "audio_buffer": self.audio_buffer,
+            "pitchf_buffer": self.pitchf_buffer,
+            "feature_buffer": self.feature_buffer,
+            "prevVol": self.prevVol,
+            "streamPosition": self.streamPosition,
+            "inputResampler": self.inputResampler,
+            "pipeline": self.pipeline.getStreamState() if self.pipeline is not None else None,
+        }
+
+    def setStreamState(self, state: dict | None):
+        if state is None:
+            self.audio_buffer = None
+            self.pitchf_buffer = None
+            self.feature_buffer = None
+            self.prevVol = 0.0
+            self.streamPosition = 0
+            self.inputResampler = StreamingResampler(self.inputSampleRate, 16000)
+            pipelineState = None
+        else:
+            self.audio_buffer = state["audio_buffer"]
+            self.pitchf_buffer = state["pitchf_buffer"]
+            self.feature_buffer = state["feature_buffer"]
+            self.prevVol = state["prevVol"]
+            self.streamPosition = state["streamPosition"]
+            self.inputResampler = state["inputResampler"]
+            if self.inputResampler.isFor(self.inputSampleRate, 16000) is False:
+                self.inputResampler = StreamingResampler(self.inputSampleRate, 16000)
+            pipelineState = state["pipeline"]
+        if self.pipeline is not None:
+            self.pipeline.setStreamState(pipelineState)
+
+    def setTensorOutput(self, tensorOutput: bool):
+        self.tensorOutput = tensorOutput
+
+    def _resample_on_device(self, audio: torch.Tensor, orig_sr: int, new_sr: int):
+        if orig_sr == new_sr:
+            return audio
+        key_str = f"{orig_sr}_{new_sr}_{audio.device}"
+        if key_str not in self.resample_kernel:
+            self.resample_kernel[key_str] = Resample(orig_sr, new_sr).to(audio.device)
+        return self.resample_kernel[key_str](audio)
+
     def update_settings(self, key: str, val: int | float | str):
         logger.info(f"[Voice Changer][RVC]: update_settings {key}:{val}")
         if key in self.settings.intData:
@@ -83,12 +150,26 @@ class RVCr2(VoiceChangerModel):
             if key == "gpu":
                 self.deviceManager.setForceTensor(False)
                 self.initialize()
+            if key == "incrementalEmbed" and self.pipeline is not None:
+                self.pipeline.setIncrementalEmbedding(self.settings.incrementalEmbed == 1, self.settings.incrementalEmbedMargin)
+            if key == "incrementalPitch" and self.pipeline is not None:
+                self.pipeline.setIncrementalPitch(self.settings.incrementalPitch == 1, self.settings.incrementalPitchMargin)
+            if key == "concurrentExtract" and self.pipeline is not None:
+                self.pipeline.setConcurrentExtract(self.settings.concurrentExtract == 1)
+            if key == "microBatch" and self.pipeline is not None:
+                self.pipeline.setMicroBatch(self.settings.microBatch == 1, self.settings.microBatchWait)
         elif key in self.settings.floatData:
             setattr(self.settings, key, float(val))
+            if key == "incrementalEmbedMargin" and self.pipeline is not None:
+                self.pipeline.setIncrementalEmbedding(self.settings.incrementalEmbed == 1, self.settings.incrementalEmbedMargin)
+            if key == "incrementalPitchMargin" and self.pipeline is not None:
+                self.pipeline.setIncrementalPitch(self.settings.incrementalPitch == 1, self.settings.incrementalPitchMargin)
+            if key == "microBatchWait" and self.pipeline is not None:
+                self.pipeline.setMicroBatch(self.settings.microBatch == 1, self.settings.microBatchWait)
         elif key in self.settings.strData:
             setattr(self.settings, key, str(val))
             if key == "f0Detector" and self.pipeline is not None:
-                pitchExtractor = PitchExtractorManager.getPitchExtractor(self.settings.f0Detector, self.settings.gpu)
+                pitchExtractor = PitchExtractorManager.acquirePitchExtractor(self.settings.f0Detector, self.settings.gpu)
                 self.pipeline.setPitchExtractor(pitchExtractor)
         else:
             return False
@@ -116,25 +197,10 @@ class RVCr2(VoiceChangerModel):
         # 16k で入ってくる。
         inputSize = newData.shape[0]
         newData = newData.astype(np.float32) / 32768.0
-        newFeatureLength = inputSize // 160  # hopsize:=160
-
-        if self.audio_buffer is not None:
-            # 過去のデータに連結
-            self.audio_buffer = np.concatenate([self.audio_buffer, newData], 0)
-            if self.slotInfo.f0:
-                self.pitchf_buffer = np.concatenate([self.pitchf_buffer, np.zeros(newFeatureLength)], 0)
-            self.feature_buffer = np.concatenate(
-                [
-                    self.feature_buffer,
-                    np.zeros([newFeatureLength, self.slotInfo.embChannels]),
-                ],
-                0,
-            )
-        else:
-            self.audio_buffer = newData
-            if self.slotInfo.f0:
-                self.pitchf_buffer = np.zeros(newFeatureLength)
-            self.feature_buffer = np.zeros([newFeatureLength, self.slotInfo.embChannels])
+        # pitchf / feature のフレームはストリームの絶対位置(160サンプル単位)にそろえる。(端数が積み重なってずれないように)
+        prevFrameEnd = (self.streamPosition + 80) // 160
+        self.streamPosition += inputSize
+        newFeatureLength = (self.streamPosition + 80) // 160 - prevFrameEnd  # hopsize:=160
 
         convertSize = inputSize + crossfadeSize + solaSearchFrame + extra_frame
 
@@ -142,58 +208,65 @@ class RVCr2(VoiceChangerModel):
             convertSize = convertSize + (160 - (convertSize % 160))
         outSize = int(((convertSize - extra_frame) / 16000) * self.slotInfo.samplingRate)
 
-        # バッファがたまっていない場合はzeroで補う
-        if self.audio_buffer.shape[0] < convertSize:
-            self.audio_buffer = np.concatenate([np.zeros([convertSize]), self.audio_buffer])
+        # バッファはconvertSizeで確保(たまっていない部分はzero)
+        featureSize = convertSize // 160
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
             if self.slotInfo.f0:
-                self.pitchf_buffer = np.concatenate([np.zeros([convertSize // 160]), self.pitchf_buffer])
-            self.feature_buffer = np.concatenate(
-                [
-                    np.zeros([convertSize // 160, self.slotInfo.embChannels]),
-                    self.feature_buffer,
-                ]
-            )
+                self.pitchf_buffer = RingBuffer(featureSize, dtype=np.float64)
+            self.feature_buffer = RingBuffer(featureSize, (self.slotInfo.embChannels,), dtype=np.float64)
+        else:
+            self.audio_buffer.resize(convertSize)
+            if self.slotInfo.f0:
+                self.pitchf_buffer.resize(featureSize)
+            self.feature_buffer.resize(featureSize)
 
-        # 不要部分をトリミング
-        convertOffset = -1 * convertSize
-        featureOffset = convertOffset // 160
-        self.audio_buffer = self.audio_buffer[convertOffset:]  # 変換対象の部分だけ抽出
+        # 過去のデータに連結
+        self.audio_buffer.append(newData)
         if self.slotInfo.f0:
-            self.pitchf_buffer = self.pitchf_buffer[featureOffset:]
-        self.feature_buffer = self.feature_buffer[featureOffset:]
+            self.pitchf_buffer.append_zeros(newFeatureLength)
+        self.feature_buffer.append_zeros(newFeatureLength)
+
+        audio = self.audio_buffer.view()  # 変換対象の部分(コピー無し)
 
         # 出力部分だけ切り出して音量を確認。(TODO:段階的消音にする)
         cropOffset = -1 * (inputSize + crossfadeSize)
         cropEnd = -1 * (crossfadeSize)
-        crop = self.audio_buffer[cropOffset:cropEnd]
+        crop = audio[cropOffset:cropEnd]
         vol = np.sqrt(np.square(crop).mean())
         vol = max(vol, self.prevVol * 0.0)
         self.prevVol = vol
 
         return (
-            self.audio_buffer,
-            self.pitchf_buffer,
-            self.feature_buffer,
+            audio,
+            self.pitchf_buffer.view() if self.slotInfo.f0 else None,
+            self.feature_buffer.view(),
             convertSize,
             vol,
             outSize,
         )
 
+    def skipInference(self, receivedData: AudioInOut):
+        # VoiceChangerV2 で無音と判定されたチャンク。リサンプルせずにバッファとストリーム位置だけ進める。
+        inputSize = self.inputResampler.skip(receivedData.shape[0])
+        prevFrameEnd = (self.streamPosition + 80) // 160
+        self.streamPosition += inputSize
+        newFeatureLength = (self.streamPosition + 80) // 160 - prevFrameEnd
+        if self.audio_buffer is None:
+            return
+        self.audio_buffer.append_zeros(inputSize)
+        if self.slotInfo.f0:
+            self.pitchf_buffer.append_zeros(newFeatureLength)
+        self.feature_buffer.append_zeros(newFeatureLength)
+
     def inference(self, receivedData: AudioInOut, crossfade_frame: int, sola_search_frame: int):
         if self.pipeline is None:
             logger.info("[Voice Changer] Pipeline is not initialized.")
             raise PipelineNotInitializedException()
 
         # 処理は16Kで実施(Pitch, embed, (infer))
-        receivedData = cast(
-            AudioInOut,
-            resampy.resample(
-                receivedData,
-                self.inputSampleRate,
-                16000,
-                filter="kaiser_fast",
-            ),
-        )
+        with tracer.span("resampleIn"):
+            receivedData = cast(AudioInOut, self.inputResampler.process(receivedData))
         crossfade_frame = int((crossfade_frame / self.inputSampleRate) * 16000)
         sola_search_frame = int((sola_search_frame / self.inputSampleRate) * 16000)
         extra_frame = int((self.settings.extraConvertSize / self.inputSampleRate) * 16000)
@@ -204,13 +277,9 @@ class RVCr2(VoiceChangerModel):
         audio = data[0]
         pitchf = data[1]
         feature = data[2]
-        convertSize = data[3]
         vol = data[4]
         outSize = data[5]
 
-        if vol < self.settings.silentThreshold:
-            return np.zeros(convertSize).astype(np.int16) * np.sqrt(vol)
-
         device = self.pipeline.device
 
         audio = torch.from_numpy(audio).to(device=device, dtype=torch.float32)
@@ -225,7 +294,7 @@ class RVCr2(VoiceChangerModel):
         useFinalProj = self.slotInfo.useFinalProj
 
         try:
-            audio_out, self.pitchf_buffer, self.feature_buffer = self.pipeline.exec(
+            audio_out, pitchf_out, feature_out = self.pipeline.exec(
                 sid,
                 audio,
                 pitchf,
@@ -240,19 +309,23 @@ class RVCr2(VoiceChangerModel):
                 repeat,
                 protect,
                 outSize,
+                self.streamPosition,
             )
+            if pitchf_out is not None:
+                self.pitchf_buffer.overwrite_tail(pitchf_out.numpy())
+            self.feature_buffer.overwrite_tail(feature_out.numpy())
+            if self.tensorOutput:
+                # デバイス上でリサンプルしてそのまま返す(CPUへのコピーはVoiceChangerV2で一回だけ)
+                result = audio_out[-outSize:].detach().to(torch.float32) * float(np.sqrt(vol))
+                with tracer.span("resampleOut"):
+                    return self._resample_on_device(result, self.slotInfo.samplingRate, self.outputSampleRate)
+
             # result = audio_out.detach().cpu().numpy() * np.sqrt(vol)
             result = audio_out[-outSize:].detach().cpu().numpy() * np.sqrt(vol)
 
-            result = cast(
-                AudioInOut,
-                resampy.resample(
-                    result,
-                    self.slotInfo.samplingRate,
-                    self.outputSampleRate,
-                    filter="kaiser_fast",
-                ),
-            )
+            # 出力はチャンク毎にウィンドウが重なっているので状態を持たない変換
+            with tracer.span("resampleOut"):
+                result = cast(AudioInOut, self.outputResampler.resample(result))
 
             return result
         except DeviceCannotSupportHalfPrecisionException as e:  # NOQA
@@ -264,6 +337,8 @@ class RVCr2(VoiceChangerModel):
         return
 
     def __del__(self):
+        # キャッシュに残す。(cloneStream したものの pipeline はキャッシュに無いので無視される)
+        PipelineCache.get_instance().release(self.pipeline)
         del self.pipeline
 
         # print("---------- REMOVING ---------------")
@@ -289,10 +364,7 @@ class RVCr2(VoiceChangerModel):
             logger.warn("[Voice Changer] export2onnx, No pyTorch filepath.")
             return {"status": "ng", "path": ""}
 
-        if self.pipeline is not None:
-            del self.pipeline
-            self.pipeline = None
-
+        # initialize が今の pipeline をキャッシュに返してから取り直す
         torch.cuda.empty_cache()
         self.initialize()
 
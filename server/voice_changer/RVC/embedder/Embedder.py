@@ -8,6 +8,8 @@ from voice_changer.RVC.embedder.EmbedderProtocol import EmbedderProtocol
 
 
 class Embedder(EmbedderProtocol):
+    supportsBatch: bool = False  # extractFeatures にバッチ(B > 1)を渡せるか
+
     def __init__(self):
         self.embedderType: EmbedderType = "hubert_base"
         self.file: str
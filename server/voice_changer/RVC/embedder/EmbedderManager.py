@@ -1,3 +1,5 @@
+import threading
+
 from torch import device
 
 from const import EmbedderType
@@ -13,6 +15,15 @@ from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
 class EmbedderManager:
     currentEmbedder: Embedder | None = None
     params: VoiceChangerParams
+    # 読み込み済みのもの。パイプライン間で共有する。(embedderType, file, device, isHalf) -> [embedder, 参照数]
+    sharedEmbedders: dict[tuple[str, str, str, bool], list] = {}
+    # releaseEmbedder は Pipeline.__del__ から(参照を手放したスレッドで)呼ばれるので、参照数は lock を取って更新する。
+    # (__del__ は lock を取っている最中の同じスレッドでも呼ばれうるので RLock)
+    # 読み込みは loadLock で順番に行い、lock は持たない(読み込み中も取得済みのものの取得、release、getEmbedderManagerInfo を待たせない)
+    lock = threading.RLock()
+    loadLock = threading.Lock()
+    hits = 0
+    misses = 0
 
     @classmethod
     def initialize(cls, params: VoiceChangerParams):
@@ -20,19 +31,69 @@ class EmbedderManager:
 
     @classmethod
     def getEmbedder(cls, embederType: EmbedderType, isHalf: bool, dev: device) -> Embedder:
-        if cls.currentEmbedder is None:
-            print("[Voice Changer] generate new embedder. (no embedder)")
-            cls.currentEmbedder = cls.loadEmbedder(embederType, isHalf, dev)
-        elif cls.currentEmbedder.matchCondition(embederType) is False:
-            print("[Voice Changer] generate new embedder. (not match)")
-            cls.currentEmbedder = cls.loadEmbedder(embederType, isHalf, dev)
-        else:
-            print("[Voice Changer] generate new embedder. (anyway)")
-            cls.currentEmbedder = cls.loadEmbedder(embederType, isHalf, dev)
+        # 同じ条件のものは一つだけ読み込んで共有する。使い終わったら releaseEmbedder を呼ぶ
+        key = (embederType, cls.getEmbedderFile(embederType), str(dev), isHalf)
+        embedder = cls._reuseEmbedder(key)
+        if embedder is not None:
+            return embedder
+        with cls.loadLock:
+            embedder = cls._reuseEmbedder(key)  # 待っている間に他のスレッドが読み込んだ
+            if embedder is not None:
+                return embedder
+
+            print("[Voice Changer] generate new embedder.", key)
+            embedder = cls.loadEmbedder(embederType, isHalf, dev)
+            with cls.lock:
+                cls.misses += 1
+                cls.sharedEmbedders[key] = [embedder, 1]
+                cls.currentEmbedder = embedder
+            return embedder
+
+    @classmethod
+    def _reuseEmbedder(cls, key: tuple[str, str, str, bool]) -> Embedder | None:
+        with cls.lock:
+            shared = cls.sharedEmbedders.get(key)
+            if shared is None:
+                return None
+            print("[Voice Changer] reuse embedder.", key)
+            cls.hits += 1
+            shared[1] += 1
+            cls.currentEmbedder = shared[0]
+            return shared[0]
+
+    @classmethod
+    def releaseEmbedder(cls, embedder: Embedder | None):
+        # 参照が無くなったら手放す。getEmbedder で取得したもの以外は無視する
+        with cls.lock:
+            for key, shared in list(cls.sharedEmbedders.items()):
+                if shared[0] is embedder:
+                    shared[1] -= 1
+                    if shared[1] <= 0:
+                        print("[Voice Changer] release embedder.", key)
+                        del cls.sharedEmbedders[key]
+                        if cls.currentEmbedder is embedder:
+                            cls.currentEmbedder = None
+                    return
+
+    @classmethod
+    def getEmbedderFile(cls, embederType: EmbedderType) -> str:
+        # loadEmbedder が最初に読み込もうとするファイル(キャッシュのキー)
+        if embederType in ["hubert_base", "contentvec"] and cls.params.content_vec_500_onnx_on is True:
+            return cls.params.content_vec_500_onnx
+        elif embederType == "hubert-base-japanese":
+            return cls.params.hubert_base_jp
+        elif embederType == "whisper":
+            return cls.params.whisper_tiny
+        return cls.params.hubert_base
 
-            # cls.currentEmbedder.setDevice(dev)
-            # cls.currentEmbedder.setHalf(isHalf)
-        return cls.currentEmbedder
+    @classmethod
+    def getEmbedderManagerInfo(cls):
+        with cls.lock:
+            return {
+                "embedders": [{"embedderType": key[0], "file": key[1], "device": key[2], "isHalf": key[3], "refs": shared[1]} for key, shared in cls.sharedEmbedders.items()],
+                "hits": cls.hits,
+                "misses": cls.misses,
+            }
 
     @classmethod
     def loadEmbedder(cls, embederType: EmbedderType, isHalf: bool, dev: device) -> Embedder:
@@ -5,6 +5,8 @@ from fairseq import checkpoint_utils
 
 
 class FairseqHubert(Embedder):
+    supportsBatch = True
+
     def loadModel(self, file: str, dev: device, isHalf: bool = True) -> Embedder:
         super().setProps("hubert_base", file, dev, isHalf)
 
@@ -43,3 +45,25 @@ class FairseqHubert(Embedder):
             else:
                 feats = logits[0]
         return feats
+
+    def extractFrontEnd(self, feats: torch.Tensor) -> torch.Tensor:
+        # CNN + layer_norm + post_extract_proj (フレーム毎の処理なのでキャッシュできる)
+        with torch.no_grad():
+            features = self.model.forward_features(feats.to(self.dev))
+            features = features.transpose(1, 2)
+            features = self.model.layer_norm(features)
+            if self.model.post_extract_proj is not None:
+                features = self.model.post_extract_proj(features)
+        return features
+
+    def extractFeaturesFromFrontEnd(
+        self, features: torch.Tensor, embOutputLayer=9, useFinalProj=True
+    ) -> torch.Tensor:
+        # extractFrontEnd の出力から transformer 部分だけを実行する。(extract_features の後半と同じ)
+        with torch.no_grad():
+            logits, _ = self.model.encoder(features, padding_mask=None, layer=embOutputLayer - 1)
+            if useFinalProj:
+                feats = self.model.final_proj(logits)
+            else:
+                feats = logits
+        return feats
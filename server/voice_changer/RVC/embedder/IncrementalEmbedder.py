@@ -0,0 +1,135 @@
+"""
+■ IncrementalEmbedder
+- 新しく入ってきた音声だけを embedding する。(HuBERT / ContentVec)
+・毎チャンク convertSize 全体(extraConvertSize を含む)を embedding し直すのをやめる。
+・フレームはストリームの絶対位置(320サンプル単位)で管理する。窓の先頭とのずれは最大で半フレーム(10ms)。
+・CNN(front-end)の出力はフレーム単位でキャッシュし、新しいフレームだけ CNN にかける。
+・transformer は 新しいフレーム + 前方のマージン(margin 秒)分のキャッシュ済み front-end 出力 に対してだけ実行し、
+  新しいフレームの出力だけを採用する。それより前のフレームはキャッシュ済みの出力をそのまま使う。
+・ストリーム末尾の不完全なフレームはゼロ埋めで暫定的に計算し、キャッシュしない。(次のチャンクで計算し直す)
+・CNN の一層目の GroupNorm と transformer の self-attention は窓全体に依存するので、窓全体で計算した結果とは一致しない(近似)。
+"""
+
+import torch
+
+from voice_changer.RVC.embedder.Embedder import Embedder
+
+HOP = 320  # CNN のストライド(16kHz で 20ms)
+RECEPTIVE = 400  # CNN の受容野
+
+
+class IncrementalEmbedder:
+    def __init__(self, margin: float = 0.5, sr: int = 16000):
+        self.sr = sr
+        self.setMargin(margin)
+        self.reset()
+
+    def setMargin(self, margin: float):
+        self.margin = margin
+        self.marginFrames = max(0, int(margin * self.sr) // HOP)
+
+    def reset(self):
+        self.key: tuple | None = None
+        self.position = 0  # 最後に処理したストリームの絶対位置(サンプル)
+
+        # 確定済みフレームのキャッシュ。[start, start + len) の絶対フレーム番号に対応
+        self.front: torch.Tensor | None = None  # [T, C] CNN + post_extract_proj の出力
+        self.frontStart = 0
+        self.out: torch.Tensor | None = None  # [T, D] embedder の出力
+        self.outStart = 0
+
+        self.fullFrames = 0
+        self.cnnFrames = 0
+        self.transformerFrames = 0
+
+    def getIncrementalEmbedderInfo(self):
+        return {
+            "margin": self.margin,
+            "fullFrames": self.fullFrames,  # 窓全体で計算した場合のフレーム数
+            "cnnFrames": self.cnnFrames,  # 前回 CNN にかけたフレーム数
+            "transformerFrames": self.transformerFrames,  # 前回 transformer にかけたフレーム数
+        }
+
+    @staticmethod
+    def isSupported(embedder: Embedder):
+        return hasattr(embedder, "extractFrontEnd") and hasattr(embedder, "extractFeaturesFromFrontEnd")
+
+    def _frames(self, cache: torch.Tensor | None, start: int, begin: int, end: int):
+        # キャッシュから [begin, end) を取り出す。無ければ None
+        if cache is None or begin < start or end > start + cache.shape[0]:
+            return None
+        return cache[begin - start : end - start]
+
+    def _audioSegment(self, audio: torch.Tensor, windowStart: int, begin: int, end: int):
+        # 絶対サンプル [begin, end) を切り出す。窓の外はゼロ埋め
+        length = audio.shape[0]
+        segment = audio[max(0, begin - windowStart) : max(0, min(length, end - windowStart))]
+        left = max(0, windowStart - begin)
+        right = (end - begin) - left - segment.shape[0]
+        if left > 0 or right > 0:
+            segment = torch.nn.functional.pad(segment, (left, right))
+        return segment
+
+    def extract(self, embedder: Embedder, feats: torch.Tensor, position: int, embOutputLayer=9, useFinalProj=True):
+        # feats: [1, N] 窓の音声(16kHz)。position: 窓の末尾のストリーム上の絶対位置(サンプル)
+        audio = feats[0]
+        length = audio.shape[0]
+        windowStart = position - length
+
+        key = (id(embedder), embOutputLayer, useFinalProj, str(audio.device))
+        if key != self.key or position < self.position:
+            self.reset()
+            self.key = key
+        self.position = position
+
+        # 窓全体で計算した場合と同じフレーム数を、絶対位置のグリッド上で窓の先頭に一番近いところから取る
+        frameNum = max(0, (length - RECEPTIVE) // HOP + 1)
+        if frameNum == 0:
+            return embedder.extractFeatures(feats, embOutputLayer, useFinalProj)
+        self.fullFrames = frameNum
+        first = (windowStart + HOP // 2) // HOP
+        last = first + frameNum  # exclusive
+        complete = (position - RECEPTIVE) // HOP + 1  # これより前のフレームは受容野が全部そろっている(確定)
+        complete = max(first, min(last, complete))
+
+        # 出力のキャッシュが使える範囲を決める
+        computeFrom = first
+        if self.out is not None and self.outStart <= first < self.outStart + self.out.shape[0]:
+            computeFrom = min(self.outStart + self.out.shape[0], last)
+
+        # transformer にかける範囲 = 新しいフレーム + マージン
+        contextFrom = max(first, computeFrom - self.marginFrames)
+
+        # CNN にかける範囲 (キャッシュ済みの front-end 出力は再利用)
+        cnnFrom = contextFrom
+        if self.front is not None and self.frontStart <= contextFrom < self.frontStart + self.front.shape[0]:
+            cnnFrom = min(self.frontStart + self.front.shape[0], last)
+
+        self.cnnFrames = 0
+        self.transformerFrames = 0
+        cachedOut = self._frames(self.out, self.outStart, first, computeFrom)
+        if computeFrom < last:
+            front = self._frames(self.front, self.frontStart, contextFrom, cnnFrom)
+            if cnnFrom < last:
+                segment = self._audioSegment(audio, windowStart, cnnFrom * HOP, (last - 1) * HOP + RECEPTIVE)
+                newFront = embedder.extractFrontEnd(segment.unsqueeze(0))[0][: last - cnnFrom]
+                front = newFront if front is None or front.shape[0] == 0 else torch.cat([front, newFront.to(front.dtype)])
+                self.cnnFrames = newFront.shape[0]
+
+            out = embedder.extractFeaturesFromFrontEnd(front.unsqueeze(0), embOutputLayer, useFinalProj)[0]
+            self.transformerFrames = front.shape[0]
+            newOut = out[computeFrom - contextFrom :]
+            result = newOut if cachedOut is None or cachedOut.shape[0] == 0 else torch.cat([cachedOut, newOut.to(cachedOut.dtype)])
+
+            # 確定したフレームの front-end 出力のうち、次回のマージンに必要な分だけキャッシュする
+            keepFrom = max(contextFrom, complete - self.marginFrames)
+            self.front = front[keepFrom - contextFrom : complete - contextFrom].detach()
+            self.frontStart = keepFrom
+        else:
+            result = cachedOut
+
+        # 確定したフレームの出力をキャッシュする
+        self.out = result[: complete - first].detach()
+        self.outStart = first
+
+        return result.unsqueeze(0)
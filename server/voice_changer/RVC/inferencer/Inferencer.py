@@ -10,6 +10,7 @@ class Inferencer(Protocol):
     file: str
     isHalf: bool = True
     gpu: int = 0
+    supportsBatch: bool = False  # inferBatch を一回の推論で実行できるか
 
     model: onnxruntime.InferenceSession | Any | None = None
 
@@ -26,6 +27,28 @@ class Inferencer(Protocol):
     ) -> torch.Tensor:
         ...
 
+    def inferBatch(
+        self,
+        feats: torch.Tensor,
+        pitch_length: torch.Tensor,
+        pitch: torch.Tensor | None,
+        pitchf: torch.Tensor | None,
+        sid: torch.Tensor,
+        convert_length: int | None,
+    ) -> list[torch.Tensor]:
+        # バッチ(B チャンク)の推論。一回で実行できない inferencer は一つずつ実行する
+        return [
+            self.infer(
+                feats[i : i + 1],
+                pitch_length[i : i + 1],
+                pitch[i : i + 1] if pitch is not None else None,
+                pitchf[i : i + 1] if pitchf is not None else None,
+                sid[i : i + 1],
+                convert_length,
+            )
+            for i in range(feats.shape[0])
+        ]
+
     def setProps(
         self,
         inferencerType: EnumInferenceTypes,
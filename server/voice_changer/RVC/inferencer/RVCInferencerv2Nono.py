@@ -7,6 +7,8 @@ from .rvc_models.infer_pack.models import SynthesizerTrnMs768NSFsid_nono
 
 
 class RVCInferencerv2Nono(Inferencer):
+    supportsBatch = True
+
     def loadModel(self, file: str, gpu: int):
         self.setProps(EnumInferenceTypes.pyTorchRVCv2Nono, file, True, gpu)
 
@@ -38,4 +40,17 @@ class RVCInferencerv2Nono(Inferencer):
         res = self.model.infer(feats, pitch_length, sid, convert_length=convert_length)
         res = res[0][0, 0].to(dtype=torch.float32)
         res = torch.clip(res, -1.0, 1.0)
-        return res
\ No newline at end of file
+        return res
+
+    def inferBatch(
+        self,
+        feats: torch.Tensor,
+        pitch_length: torch.Tensor,
+        pitch: torch.Tensor | None,
+        pitchf: torch.Tensor | None,
+        sid: torch.Tensor,
+        convert_length: int | None,
+    ) -> list[torch.Tensor]:
+        res = self.model.infer(feats, pitch_length, sid, convert_length=convert_length)
+        res = torch.clip(res[0][:, 0].to(dtype=torch.float32), -1.0, 1.0)
+        return list(res)
@@ -0,0 +1,118 @@
+"""
+■ MicroBatcher
+- 複数セッションのチャンクをまとめて一回のバッチで実行する。(embedder / inferencer 用)
+・同じ key(入力の形状や設定が同じもの)の要求を集めて、torch.cat でまとめて実行し、結果を要求元に分配する。
+  形状が違うものはまとめない。(HuBERT の CNN 一層目の GroupNorm などがパディングの影響を受けるため)
+・専用のスレッドは持たない。最初に来た要求のスレッド(leader)が、他のセッションの要求を maxWait 秒まで待ってから実行する。
+  後から来た要求のスレッドは leader の実行が終わるまで待つ。
+・leader は パイプラインを実行中のストリーム数(activeStreams)分の要求がそろった時点で待つのをやめる。
+  ストリームが一つだけのときは全く待たないので、単一ストリームの遅延は増えない。
+・一回のバッチは maxBatch 件まで。残った要求は先頭の要求のスレッドを次の leader にして実行させる。
+"""
+
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+import torch
+
+
+class MicroBatchRequest:
+    def __init__(self, args: tuple[Any, ...]):
+        self.args = args
+        self.result: Any = None
+        self.error: Exception | None = None
+        self.leader = False
+        self.done = threading.Event()  # 結果が出たとき、または leader を引き継いだときにセットされる
+
+
+class MicroBatcher:
+    def __init__(self, device: torch.device, maxWait: float = 0.003, maxBatch: int = 8):
+        self.device = device
+        self.maxWait = maxWait
+        self.maxBatch = maxBatch
+        self.cond = threading.Condition()
+        self.pending: dict[Hashable, list[MicroBatchRequest]] = {}
+        self.activeStreams = 0
+
+        self.batches = 0
+        self.items = 0
+        self.largestBatch = 0
+
+    def getMicroBatcherInfo(self):
+        return {
+            "maxWait": self.maxWait,
+            "maxBatch": self.maxBatch,
+            "activeStreams": self.activeStreams,
+            "batches": self.batches,
+            "meanBatchSize": self.items / self.batches if self.batches > 0 else 0,
+            "largestBatch": self.largestBatch,
+        }
+
+    def enter(self):
+        # パイプラインの実行開始時に呼ぶ。(leader が何件待てばよいかの目安)
+        with self.cond:
+            self.activeStreams += 1
+
+    def leave(self):
+        with self.cond:
+            self.activeStreams -= 1
+            self.cond.notify_all()  # 待っている leader がいれば、そろったかどうかを判断し直す
+
+    def submit(self, key: Hashable, args: tuple[Any, ...], batchFn: Callable[[list[tuple[Any, ...]]], list[Any]]):
+        # batchFn は要求の args のリストを受け取り、要求と同じ順番で結果のリストを返す
+        request = MicroBatchRequest(args)
+        with self.cond:
+            queue = self.pending.setdefault(key, [])
+            queue.append(request)
+            request.leader = len(queue) == 1
+            if request.leader is False:
+                self.cond.notify_all()
+
+        if request.leader is False:
+            request.done.wait()
+        if request.leader:
+            self._lead(key, batchFn)
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _lead(self, key: Hashable, batchFn: Callable[[list[tuple[Any, ...]]], list[Any]]):
+        with self.cond:
+            deadline = time.perf_counter() + self.maxWait
+            while True:
+                waiting = len(self.pending[key])
+                if waiting >= self.maxBatch or waiting >= self.activeStreams:
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            queue = self.pending[key]
+            batch = queue[: self.maxBatch]
+            rest = queue[self.maxBatch :]
+            if len(rest) > 0:
+                # 入りきらなかった要求は、先頭の要求のスレッドを次の leader にする
+                self.pending[key] = rest
+                rest[0].leader = True
+                rest[0].done.set()
+            else:
+                del self.pending[key]
+
+        try:
+            results = batchFn([r.args for r in batch])
+            # 他のスレッドが結果を使う前に、このスレッドのストリームでの計算を終わらせておく
+            if self.device.type == "cuda":
+                torch.cuda.current_stream(self.device).synchronize()
+            for r, result in zip(batch, results):
+                r.result = result
+        except Exception as e:
+            for r in batch:
+                r.error = e
+        finally:
+            self.batches += 1
+            self.items += len(batch)
+            self.largestBatch = max(self.largestBatch, len(batch))
+            for r in batch:
+                r.done.set()
@@ -1,5 +1,7 @@
 import numpy as np
 from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+import copy
 import math
 import torch
 import torch.nn.functional as F
@@ -13,14 +15,19 @@ from Exceptions import (
 from mods.log_control import VoiceChangaerLogger
 
 from voice_changer.RVC.embedder.Embedder import Embedder
+from voice_changer.RVC.embedder.EmbedderManager import EmbedderManager
+from voice_changer.RVC.embedder.IncrementalEmbedder import IncrementalEmbedder
 from voice_changer.RVC.inferencer.Inferencer import Inferencer
+from voice_changer.RVC.pipeline.MicroBatcher import MicroBatcher
 from voice_changer.RVC.inferencer.OnnxRVCInferencer import OnnxRVCInferencer
 from voice_changer.RVC.inferencer.OnnxRVCInferencerNono import OnnxRVCInferencerNono
 
 from voice_changer.RVC.pitchExtractor.PitchExtractor import PitchExtractor
-from voice_changer.utils.Timer import Timer2
+from voice_changer.RVC.pitchExtractor.PitchExtractorManager import PitchExtractorManager
+from voice_changer.utils.Tracer import Tracer
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 class Pipeline(object):
@@ -65,18 +72,127 @@ class Pipeline(object):
         self.sr = 16000
         self.window = 160
 
+        self.incrementalEmbedder: IncrementalEmbedder | None = None
+
+        # incremental pitch extraction (Noneのときは窓全体でピッチ検出)
+        self.incrementalPitchContext: int | None = None  # 新しいフレームの前に付けるコンテキスト(フレーム)
+        self.pitchFrameEnd = 0  # pitchf の最後のフレームの終わりのストリーム上の位置(フレーム)
+        self.pitchStreamKey: tuple | None = None
+
+        # ピッチ検出とembeddingの並行実行
+        self.extractWorker: ThreadPoolExecutor | None = None
+        self.pitchCudaStream: torch.cuda.Stream | None = None
+        self.featureCudaStream: torch.cuda.Stream | None = None
+        self.stageTimes: dict[str, float] = {}  # 直近のチャンクの各ステージの処理時間(ms)
+
+        # 複数セッションの embedding / 推論をまとめて実行する(cloneStream したパイプラインで共有する)
+        self.microBatcher: MicroBatcher | None = None
+        self.isClone = False
+
     def getPipelineInfo(self):
         inferencerInfo = self.inferencer.getInferencerInfo() if self.inferencer else {}
         embedderInfo = self.embedder.getEmbedderInfo()
         pitchExtractorInfo = self.pitchExtractor.getPitchExtractorInfo()
-        return {"inferencer": inferencerInfo, "embedder": embedderInfo, "pitchExtractor": pitchExtractorInfo, "isHalf": self.isHalf}
+        incrementalEmbedderInfo = self.incrementalEmbedder.getIncrementalEmbedderInfo() if self.incrementalEmbedder else {}
+        return {
+            "inferencer": inferencerInfo,
+            "embedder": embedderInfo,
+            "pitchExtractor": pitchExtractorInfo,
+            "incrementalEmbedder": incrementalEmbedderInfo,
+            "concurrentExtract": self.extractWorker is not None,
+            "microBatch": self.microBatcher.getMicroBatcherInfo() if self.microBatcher is not None else {},
+            "stageTimes": self.stageTimes,
+            "isHalf": self.isHalf,
+        }
 
     def setPitchExtractor(self, pitchExtractor: PitchExtractor):
+        # PitchExtractorManager.acquirePitchExtractor で取得したものを渡す。元のものは release する
+        previous = self.pitchExtractor
         self.pitchExtractor = pitchExtractor
-
-    def extractPitch(self, audio_pad, if_f0, pitchf, f0_up_key, silence_front):
+        if self.isClone is False:
+            PitchExtractorManager.releasePitchExtractor(previous)
+        if self.extractWorker is not None:
+            self._setupCudaStreams()
+
+    def setConcurrentExtract(self, enable: bool):
+        # ピッチ検出をワーカースレッドで実行し、その間にembeddingを実行する。
+        # 両方GPUで実行する場合はそれぞれ別のCUDA streamに載せる。
+        # cloneStream したものは自分のワーカーを持つので、ここで止めるのはこのパイプラインのものだけ。
+        if enable and self.extractWorker is None:
+            self.extractWorker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rvc-pitch")
+        elif enable is False and self.extractWorker is not None:
+            self.extractWorker.shutdown(wait=True)
+            self.extractWorker = None
+        self._setupCudaStreams()
+
+    def _setupCudaStreams(self):
+        self.pitchCudaStream = None
+        self.featureCudaStream = None
+        if self.extractWorker is None or self.device.type != "cuda":
+            return
+        self.featureCudaStream = torch.cuda.Stream(device=self.device)
+        pitchDevice = getattr(self.pitchExtractor, "device", None)
+        if isinstance(pitchDevice, torch.device) and pitchDevice.type == "cuda":
+            self.pitchCudaStream = torch.cuda.Stream(device=pitchDevice)
+
+    def setMicroBatch(self, enable: bool, maxWait: float):
+        # cloneStream したパイプライン同士で、形状の同じ embedding / 推論の要求をまとめる。
+        if enable is False:
+            self.microBatcher = None
+        elif self.microBatcher is None:
+            self.microBatcher = MicroBatcher(self.device, maxWait)
+        else:
+            self.microBatcher.maxWait = maxWait
+
+    def setIncrementalPitch(self, enable: bool, margin: float):
+        # 新しいフレームの f0 だけを計算し、それより前は pitchf の履歴を使う。
+        self.incrementalPitchContext = int(margin * self.sr) // self.window if enable else None
+        self.pitchStreamKey = None
+
+    def setIncrementalEmbedding(self, enable: bool, margin: float):
+        # 新しく入ってきた音声だけを embedding する。(対応していない embedder では窓全体で実行)
+        if enable is False or IncrementalEmbedder.isSupported(self.embedder) is False:
+            self.incrementalEmbedder = None
+        elif self.incrementalEmbedder is None:
+            self.incrementalEmbedder = IncrementalEmbedder(margin, self.sr)
+        else:
+            self.incrementalEmbedder.setMargin(margin)
+
+    def cloneStream(self):
+        # 重み(embedder, inferencer, pitchExtractor, index)は共有する。ストリーミング状態は setStreamState で作り直す
+        clone = copy.copy(self)
+        clone.stageTimes = {}
+        clone.isClone = True
+        if self.extractWorker is not None:
+            # ピッチ検出のワーカーと CUDA stream はコピー毎に持つ(他のセッションの処理を待たないように)
+            clone.extractWorker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rvc-pitch")
+            clone._setupCudaStreams()
+        return clone
+
+    def getStreamState(self):
+        return {
+            "incrementalEmbedder": self.incrementalEmbedder,
+            "pitchFrameEnd": self.pitchFrameEnd,
+            "pitchStreamKey": self.pitchStreamKey,
+        }
+
+    def setStreamState(self, state: dict | None):
+        # incremental embedding が有効な場合だけキャッシュを入れ替える。(設定は現在の値を使う)
+        if self.incrementalEmbedder is not None:
+            margin = self.incrementalEmbedder.margin
+            incrementalEmbedder = state["incrementalEmbedder"] if state is not None else None
+            self.incrementalEmbedder = incrementalEmbedder if incrementalEmbedder is not None else IncrementalEmbedder(margin, self.sr)
+            self.incrementalEmbedder.setMargin(margin)
+        self.pitchFrameEnd = state["pitchFrameEnd"] if state is not None else 0
+        self.pitchStreamKey = state["pitchStreamKey"] if state is not None else None
+
+    def extractPitch(self, audio_pad, if_f0, pitchf, f0_up_key, silence_front, stream_position=None):
         try:
-            if if_f0 == 1:
+            if if_f0 == 1 and self.incrementalPitchContext is not None and stream_position is not None:
+                pitch, pitchf = self.extractPitchStream(audio_pad, pitchf, f0_up_key, stream_position)
+                pitch = torch.tensor(pitch, device=self.device).unsqueeze(0).long()
+                pitchf = torch.tensor(pitchf, device=self.device, dtype=torch.float).unsqueeze(0)
+            elif if_f0 == 1:
                 pitch, pitchf = self.pitchExtractor.extract(
                     audio_pad,
                     pitchf,
@@ -99,10 +215,86 @@ class Pipeline(object):
             raise NotEnoughDataExtimateF0()
         return pitch, pitchf
 
-    def extractFeatures(self, feats, embOutputLayer, useFinalProj):
+    def extractPitchStream(self, audio, pitchf, f0_up_key, stream_position):
+        # pitchf の各フレームはストリームの絶対位置(window単位)にそろっている。(RVCr2.generate_input)
+        frameEnd = (stream_position + self.window // 2) // self.window
+        key = (f0_up_key, id(self.pitchExtractor))
+        if self.pitchStreamKey != key or frameEnd < self.pitchFrameEnd:
+            # 移調やピッチ検出器が変わったときは履歴が使えないので全体を計算し直す
+            newFrames = pitchf.shape[0]
+        else:
+            # 前回の末尾のフレームは右側のコンテキストが無かったので計算し直す
+            newFrames = min(pitchf.shape[0], frameEnd - self.pitchFrameEnd + 2)
+        self.pitchStreamKey = key
+        self.pitchFrameEnd = frameEnd
+
+        # 音声の末尾を pitchf の最後のフレームの終わりにそろえる
+        tail = frameEnd * self.window - stream_position
+        if tail > 0:
+            audio = F.pad(audio, (0, tail))
+        elif tail < 0:
+            audio = audio[:tail]
+        return self.pitchExtractor.extractStream(audio, pitchf, f0_up_key, self.sr, self.window, newFrames, self.incrementalPitchContext)
+
+    def _extractPitchTimed(self, audio_pad, if_f0, pitchf, f0_up_key, silence_front, stream_position):
+        with tracer.span("pitch") as t:
+            if self.pitchCudaStream is not None:
+                with torch.cuda.stream(self.pitchCudaStream):
+                    pitch, pitchf = self.extractPitch(audio_pad, if_f0, pitchf, f0_up_key, silence_front, stream_position)
+                self.pitchCudaStream.synchronize()
+            else:
+                pitch, pitchf = self.extractPitch(audio_pad, if_f0, pitchf, f0_up_key, silence_front, stream_position)
+        self.stageTimes["pitch"] = t.msecs
+        return pitch, pitchf
+
+    def _extractFeaturesTimed(self, feats, embOutputLayer, useFinalProj, stream_position):
+        with tracer.span("embed") as t:
+            if self.featureCudaStream is not None:
+                with torch.cuda.stream(self.featureCudaStream):
+                    feats = self.extractFeatures(feats, embOutputLayer, useFinalProj, stream_position)
+                self.featureCudaStream.synchronize()
+            else:
+                feats = self.extractFeatures(feats, embOutputLayer, useFinalProj, stream_position)
+        self.stageTimes["feature"] = t.msecs
+        return feats
+
+    def extractPitchAndFeatures(self, audio_pad, if_f0, pitchf, f0_up_key, silence_front, feats, embOutputLayer, useFinalProj, stream_position):
+        with tracer.span("rvc.extract") as t:
+            if self.extractWorker is None:
+                pitch, pitchf = self._extractPitchTimed(audio_pad, if_f0, pitchf, f0_up_key, silence_front, stream_position)
+                feats = self._extractFeaturesTimed(feats, embOutputLayer, useFinalProj, stream_position)
+            else:
+                # 入力の準備(F.padなど)が終わってから各streamで読み始める
+                mainStream = torch.cuda.current_stream(self.device) if self.featureCudaStream is not None else None
+                if mainStream is not None:
+                    self.featureCudaStream.wait_stream(mainStream)
+                    feats.record_stream(self.featureCudaStream)
+                    if self.pitchCudaStream is not None:
+                        self.pitchCudaStream.wait_stream(mainStream)
+                        audio_pad.record_stream(self.pitchCudaStream)
+
+                pitchFuture = self.extractWorker.submit(self._extractPitchTimed, audio_pad, if_f0, pitchf, f0_up_key, silence_front, stream_position)
+                feats = self._extractFeaturesTimed(feats, embOutputLayer, useFinalProj, stream_position)
+                pitch, pitchf = pitchFuture.result()  # index検索と推論の前に合流
+
+                if mainStream is not None:
+                    # 別streamで確保した出力をこの後メインのstreamで使う
+                    for tensor in [feats, pitch, pitchf]:
+                        if isinstance(tensor, torch.Tensor) and tensor.device.type == "cuda":
+                            tensor.record_stream(mainStream)
+        self.stageTimes["extract"] = t.msecs  # 並行実行時は pitch + feature より短くなる
+        return pitch, pitchf, feats
+
+    def extractFeatures(self, feats, embOutputLayer, useFinalProj, stream_position=None):
         with autocast(enabled=self.isHalf):
             try:
-                feats = self.embedder.extractFeatures(feats, embOutputLayer, useFinalProj)
+                if self.incrementalEmbedder is not None and stream_position is not None:
+                    feats = self.incrementalEmbedder.extract(self.embedder, feats, stream_position, embOutputLayer, useFinalProj)
+                elif self.microBatcher is not None and self.embedder.supportsBatch:
+                    key = ("embed", tuple(feats.shape), str(feats.device), embOutputLayer, useFinalProj)
+                    feats = self.microBatcher.submit(key, (feats, embOutputLayer, useFinalProj), self._extractFeaturesBatch)
+                else:
+                    feats = self.embedder.extractFeatures(feats, embOutputLayer, useFinalProj)
                 if torch.isnan(feats).all():
                     raise DeviceCannotSupportHalfPrecisionException()
                 return feats
@@ -113,12 +305,30 @@ class Pipeline(object):
                     raise DeviceChangingException()
                 else:
                     raise e
-                
+
+    def _extractFeaturesBatch(self, argsList):
+        # argsList の embOutputLayer, useFinalProj は key で揃っている
+        _, embOutputLayer, useFinalProj = argsList[0]
+        with autocast(enabled=self.isHalf):
+            out = self.embedder.extractFeatures(torch.cat([args[0] for args in argsList], dim=0), embOutputLayer, useFinalProj)
+        return [out[i : i + 1] for i in range(len(argsList))]
+
+    def _inferBatch(self, argsList):
+        feats, p_len, pitch, pitchf, sid, out_size = argsList[0]
+        cat = lambda i: torch.cat([args[i] for args in argsList], dim=0)  # NOQA
+        with torch.no_grad():
+            with autocast(enabled=self.isHalf):
+                return self.inferencer.inferBatch(cat(0), cat(1), cat(2) if pitch is not None else None, cat(3) if pitchf is not None else None, cat(4), out_size)
+
     def infer(self, feats, p_len, pitch, pitchf, sid, out_size):
         try:
             with torch.no_grad():
                 with autocast(enabled=self.isHalf):
-                    audio1 = self.inferencer.infer(feats,  p_len, pitch, pitchf, sid, out_size)                    
+                    if self.microBatcher is not None and self.inferencer.supportsBatch:
+                        key = ("infer", tuple(feats.shape), pitch is None, out_size)
+                        audio1 = self.microBatcher.submit(key, (feats, p_len, pitch, pitchf, sid, out_size), self._inferBatch)
+                    else:
+                        audio1 = self.inferencer.infer(feats, p_len, pitch, pitchf, sid, out_size)
                     audio1 = (audio1 * 32767.5).data.to(dtype=torch.int16)
             return audio1
         except RuntimeError as e:
@@ -128,7 +338,18 @@ class Pipeline(object):
             else:
                 raise e
 
-    def exec(
+    def exec(self, *args, **kwargs):
+        if self.microBatcher is None:
+            return self._exec(*args, **kwargs)
+        # 実行中のストリーム数を MicroBatcher に知らせる(そろったら待たずに実行するため)
+        microBatcher = self.microBatcher
+        microBatcher.enter()
+        try:
+            return self._exec(*args, **kwargs)
+        finally:
+            microBatcher.leave()
+
+    def _exec(
         self,
         sid,
         audio,  # torch.tensor [n]
@@ -143,11 +364,12 @@ class Pipeline(object):
         repeat,
         protect=0.5,
         out_size=None,
+        stream_position=None,  # 窓の末尾のストリーム上の絶対位置(サンプル)。incremental embedding / pitch 用
     ):
         # print(f"pipeline exec input, audio:{audio.shape}, pitchf:{pitchf.shape}, feature:{feature.shape}")
         # print(f"pipeline exec input, silence_front:{silence_front}, out_size:{out_size}")
 
-        with Timer2("Pipeline-Exec", False) as t:  # NOQA
+        with tracer.span("rvc.exec") as t:
             # 16000のサンプリングレートで入ってきている。以降この世界は16000で処理。
             search_index = self.index is not None and self.big_npy is not None and index_rate != 0
             # self.t_pad = self.sr * repeat  # 1秒
@@ -166,6 +388,7 @@ class Pipeline(object):
             silence_front = silence_front if repeat == 0 else 0
             pitchf = pitchf if repeat == 0 else np.zeros(p_len)
             out_size = out_size if repeat == 0 else None
+            stream_position = stream_position if repeat == 0 else None  # reflect paddingしたときは窓全体で実行
 
             # tensor型調整
             feats = audio_pad
@@ -174,40 +397,37 @@ class Pipeline(object):
             assert feats.dim() == 1, feats.dim()
             feats = feats.view(1, -1)
 
-            t.record("pre-process")
-            # ピッチ検出
-            pitch, pitchf = self.extractPitch(audio_pad, if_f0, pitchf, f0_up_key, silence_front)
-            t.record("extract-pitch")
-
-            # embedding
-            feats = self.extractFeatures(feats, embOutputLayer, useFinalProj)
-            t.record("extract-feats")
+            t.lap("pre")
+            # ピッチ検出, embedding (concurrentExtract時は並行して実行)
+            pitch, pitchf, feats = self.extractPitchAndFeatures(audio_pad, if_f0, pitchf, f0_up_key, silence_front, feats, embOutputLayer, useFinalProj, stream_position)
+            t.lap("extract")
 
             # Index - feature抽出
             # if self.index is not None and self.feature is not None and index_rate != 0:
             if search_index:
-                npy = feats[0].cpu().numpy()
-                # apply silent front for indexsearch
-                npyOffset = math.floor(silence_front * 16000) // 360
-                npy = npy[npyOffset:]
-
-                if self.isHalf is True:
-                    npy = npy.astype("float32")
-
-                # TODO: kは調整できるようにする
-                k = 1
-                if k == 1:
-                    _, ix = self.index.search(npy, 1)
-                    npy = self.big_npy[ix.squeeze()]
-                else:
-                    score, ix = self.index.search(npy, k=8)
-                    weight = np.square(1 / score)
-                    weight /= weight.sum(axis=1, keepdims=True)
-                    npy = np.sum(self.big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
-
-                # recover silient font
-                npy = np.concatenate([np.zeros([npyOffset, npy.shape[1]], dtype=np.float32), feature[:npyOffset:2].astype("float32"), npy])[-feats.shape[1]:]
-                feats = torch.from_numpy(npy).unsqueeze(0).to(self.device) * index_rate + (1 - index_rate) * feats
+                with tracer.span("indexSearch"):
+                    npy = feats[0].cpu().numpy()
+                    # apply silent front for indexsearch
+                    npyOffset = math.floor(silence_front * 16000) // 360
+                    npy = npy[npyOffset:]
+
+                    if self.isHalf is True:
+                        npy = npy.astype("float32")
+
+                    # TODO: kは調整できるようにする
+                    k = 1
+                    if k == 1:
+                        _, ix = self.index.search(npy, 1)
+                        npy = self.big_npy[ix.squeeze()]
+                    else:
+                        score, ix = self.index.search(npy, k=8)
+                        weight = np.square(1 / score)
+                        weight /= weight.sum(axis=1, keepdims=True)
+                        npy = np.sum(self.big_npy[ix] * np.expand_dims(weight, axis=2), axis=1)
+
+                    # recover silient font
+                    npy = np.concatenate([np.zeros([npyOffset, npy.shape[1]], dtype=np.float32), feature[:npyOffset:2].astype("float32"), npy])[-feats.shape[1]:]
+                    feats = torch.from_numpy(npy).unsqueeze(0).to(self.device) * index_rate + (1 - index_rate) * feats
             feats = F.interpolate(feats.permute(0, 2, 1), scale_factor=2).permute(0, 2, 1)
             if protect < 0.5 and search_index:
                 feats0 = feats.clone()
@@ -249,10 +469,12 @@ class Pipeline(object):
                 pitchf = pitchf[:, -feats_len:]
             p_len = torch.tensor([feats_len], device=self.device).long()
 
-            t.record("mid-precess")
+            t.lap("mid")
             # 推論実行
             audio1 = self.infer(feats, p_len, pitch, pitchf, sid, out_size)
-            t.record("infer")
+            inferNs = t.lap("infer")
+            tracer.record("synth", inferNs)
+            self.stageTimes["infer"] = inferNs / 1_000_000
 
             feats_buffer = feats.squeeze(0).detach().cpu()
             if pitchf is not None:
@@ -271,12 +493,17 @@ class Pipeline(object):
                 audio1 = audio1[offset:end]
 
             del sid
-            t.record("post-process")
+            t.lap("post")
             # torch.cuda.empty_cache()
         # print("EXEC AVERAGE:", t.avrSecs)
         return audio1, pitchf_buffer, feats_buffer
 
     def __del__(self):
+        if self.extractWorker is not None:  # ワーカーはコピー毎に持っている
+            self.extractWorker.shutdown(wait=False)
+        if self.isClone is False:
+            EmbedderManager.releaseEmbedder(self.embedder)
+            PitchExtractorManager.releasePitchExtractor(self.pitchExtractor)
         del self.embedder
         del self.inferencer
         del self.pitchExtractor
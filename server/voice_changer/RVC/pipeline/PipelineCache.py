@@ -0,0 +1,174 @@
+"""
+■ PipelineCache
+- 初期化済みの RVC の Pipeline を保持して、モデルスロットを切り替えたときに読み込み直さないようにする(LRU)
+・キーは (スロット, モデルファイル, indexファイル, デバイス, half)。ピッチ検出器は Pipeline.setPitchExtractor で差し替えるのでキーに含めない。
+・使用中(acquire して release していない)の Pipeline は追い出さない。
+・ディスクからの読み込み(createPipeline)は lock の外で行う。(読み込み中も getPipelineCacheInfo(/info, /metrics)を待たせない)
+  同じキーを読み込み中の場合は、読み込みが終わるのを待ってから取り直す。
+・サイズはモデルファイル、index ファイル、embedder のファイルの大きさ(概算)。合計が budget を超えたら、使われていないものを古い順に捨てる。
+  embedder は EmbedderManager が共有しているので、同じものを複数のパイプラインが使っている場合は一回だけ数える。
+  ピッチ検出器は PitchExtractorManager が参照数を数えて共有しているのでサイズに含めない。
+・スロットのファイルを入れ替えるとき(アップロード、サンプルのダウンロード)は invalidateSlot を呼ぶ。
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import os
+import threading
+
+from data.ModelSlot import RVCModelSlot
+from mods.log_control import VoiceChangaerLogger
+from voice_changer.RVC.deviceManager.DeviceManager import DeviceManager
+from voice_changer.RVC.pipeline.Pipeline import Pipeline
+from voice_changer.RVC.pipeline.PipelineGenerator import createPipeline
+from voice_changer.RVC.pitchExtractor.PitchExtractorManager import PitchExtractorManager
+from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
+
+logger = VoiceChangaerLogger.get_instance().getLogger()
+
+
+@dataclass
+class PipelineCacheEntry:
+    pipeline: Pipeline
+    size: int  # モデルと index
+    embedderSize: int
+    users: int = 0
+
+
+class PipelineCache:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, budget: int = 1024 * 1024 * 1024):
+        self.budget = budget  # byte
+        self.entries: OrderedDict[tuple, PipelineCacheEntry] = OrderedDict()  # 後ろほど最近使ったもの
+        self.lock = threading.Lock()
+        self.loading: dict[tuple, threading.Event] = {}  # 読み込み中のキー
+        self.staleLoads: set[tuple] = set()  # 読み込み中に invalidateSlot されたキー(読み込んだものはキャッシュに入れない)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def setBudget(self, budget: int):
+        with self.lock:
+            self.budget = max(0, budget)
+            self._evict()
+
+    def acquire(self, params: VoiceChangerParams, slotInfo: RVCModelSlot, gpu: int, f0Detector: str) -> Pipeline:
+        # 読み込みに失敗した場合は createPipeline の PipelineCreateException がそのまま上がる
+        key = self._key(slotInfo, gpu)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                    entry.users += 1
+                    pipeline = entry.pipeline
+                    break
+                loading = self.loading.get(key)
+                if loading is None:
+                    # このスレッドが読み込む
+                    self.misses += 1
+                    loading = threading.Event()
+                    self.loading[key] = loading
+                    pipeline = None
+                    break
+            loading.wait()  # 他のスレッドが同じものを読み込み中。終わったら取り直す(失敗していたらこのスレッドが読み込む)
+
+        if pipeline is not None:
+            pipeline.setStreamState(None)  # 前回使ったときのストリーミングの状態は捨てる
+            if getattr(pipeline.pitchExtractor, "pitchExtractorType", f0Detector) != f0Detector:
+                pipeline.setPitchExtractor(PitchExtractorManager.acquirePitchExtractor(f0Detector, gpu))
+            logger.info(f"[Voice Changer] pipeline cache hit: slot {slotInfo.slotIndex}")
+            return pipeline
+
+        try:
+            pipeline = createPipeline(params, slotInfo, gpu, f0Detector)
+            embedderFile = getattr(pipeline.embedder, "file", "")
+            embedderSize = os.path.getsize(embedderFile) if embedderFile != "" and os.path.isfile(embedderFile) else 0
+            size = self._estimateSize(params, slotInfo)
+        except Exception:
+            with self.lock:
+                self.loading.pop(key, None)
+                self.staleLoads.discard(key)
+            loading.set()
+            raise
+
+        with self.lock:
+            self.loading.pop(key, None)
+            if key in self.staleLoads:
+                # 読み込み中にスロットのファイルが入れ替わった。キャッシュには入れず、次の acquire で読み込み直す
+                self.staleLoads.discard(key)
+            else:
+                self.entries[key] = PipelineCacheEntry(pipeline, size, embedderSize, users=1)
+                self._evict()
+        loading.set()
+        return pipeline
+
+    def release(self, pipeline: Pipeline | None):
+        # pipeline を使い終わった(RVCr2 の破棄、デバイスの変更)。キャッシュに無いもの(cloneStream したもの)は無視する
+        if pipeline is None:
+            return
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.pipeline is pipeline:
+                    entry.users = max(0, entry.users - 1)
+                    break
+            self._evict()
+
+    def invalidateSlot(self, slotIndex: int):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == slotIndex]:
+                del self.entries[key]  # 使用中のものも外す(使い終わったら release は無視される)
+            self.staleLoads.update([key for key in self.loading if key[0] == slotIndex])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _key(self, slotInfo: RVCModelSlot, gpu: int):
+        deviceManager = DeviceManager.get_instance()
+        dev = deviceManager.getDevice(gpu)
+        half = deviceManager.halfPrecisionAvailable(gpu)
+        return (slotInfo.slotIndex, slotInfo.modelFile, slotInfo.indexFile, str(dev), half)
+
+    def _estimateSize(self, params: VoiceChangerParams, slotInfo: RVCModelSlot):
+        size = 0
+        for file in [slotInfo.modelFile, slotInfo.indexFile]:
+            path = os.path.join(params.model_dir, str(slotInfo.slotIndex), os.path.basename(file))
+            if file != "" and os.path.isfile(path):
+                size += os.path.getsize(path)
+        return size
+
+    def _totalSize(self):
+        # lock を取った状態で呼ぶ
+        embedders = {id(entry.pipeline.embedder): entry.embedderSize for entry in self.entries.values()}
+        return sum([entry.size for entry in self.entries.values()]) + sum(embedders.values())
+
+    def _evict(self):
+        # lock を取った状態で呼ぶ
+        for key in list(self.entries.keys()):
+            if self._totalSize() <= self.budget:
+                break
+            if self.entries[key].users > 0:
+                continue
+            del self.entries[key]
+            self.evictions += 1
+            logger.info(f"[Voice Changer] pipeline cache evicted: slot {key[0]}")
+
+    def getPipelineCacheInfo(self):
+        with self.lock:
+            return {
+                "budget": self.budget,
+                "size": self._totalSize(),
+                "entries": [{"slot": key[0], "device": key[3], "half": key[4], "size": entry.size, "embedderSize": entry.embedderSize, "users": entry.users} for key, entry in self.entries.items()],
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -38,8 +38,8 @@ def createPipeline(params: VoiceChangerParams, modelSlot: RVCModelSlot, gpu: int
         traceback.print_exc()
         raise PipelineCreateException("[Voice Changer] exception! loading embedder")
 
-    # pitchExtractor
-    pitchExtractor = PitchExtractorManager.getPitchExtractor(f0Detector, gpu)
+    # pitchExtractor (Pipeline が破棄されるときに release する)
+    pitchExtractor = PitchExtractorManager.acquirePitchExtractor(f0Detector, gpu)
 
     # index, feature
     indexPath = os.path.join(params.model_dir, str(modelSlot.slotIndex), os.path.basename(modelSlot.indexFile))
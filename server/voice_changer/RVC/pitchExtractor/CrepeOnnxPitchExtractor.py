@@ -20,18 +20,7 @@ class CrepeOnnxPitchExtractor(PitchExtractor):
             file, providers=onnxProviders, provider_options=onnxProviderOptions
         )
 
-    def extract(self, audio, pitchf, f0_up_key, sr, window, silence_front=0):
-        start_frame = int(silence_front * sr / window)
-        real_silence_front = start_frame * window / sr
-
-        silence_front_offset = int(np.round(real_silence_front * sr))
-        audio = audio[silence_front_offset:]
-
-        f0_min = 50
-        f0_max = 1100
-        f0_mel_min = 1127 * np.log(1 + f0_min / 700)
-        f0_mel_max = 1127 * np.log(1 + f0_max / 700)
-
+    def extractF0(self, audio, sr, window):
         precision = 10.0
 
         audio_num = audio.cpu()
@@ -40,8 +29,8 @@ class CrepeOnnxPitchExtractor(PitchExtractor):
             audio_num,
             sr,
             precision=precision,
-            fmin=f0_min,
-            fmax=f0_max,
+            fmin=self.f0_min,
+            fmax=self.f0_max,
             batch_size=256,
             return_periodicity=True,
             decoder=onnxcrepe.decode.weighted_argmax,
@@ -51,15 +40,28 @@ class CrepeOnnxPitchExtractor(PitchExtractor):
         pd = onnxcrepe.filter.median(onnx_pd, 3)
 
         f0[pd < 0.1] = 0
-        f0 = f0.squeeze()
+        return f0.squeeze()
 
-        f0 *= pow(2, f0_up_key / 12)
-        pitchf[-f0.shape[0]:] = f0[:pitchf.shape[0]]
-        f0bak = pitchf.copy()
-        f0_mel = 1127.0 * np.log(1.0 + f0bak / 700.0)
+    def coarse(self, pitchf):
+        f0_mel_min = 1127 * np.log(1 + self.f0_min / 700)
+        f0_mel_max = 1127 * np.log(1 + self.f0_max / 700)
+        f0_mel = 1127.0 * np.log(1.0 + pitchf / 700.0)
         f0_mel = np.clip(
             (f0_mel - f0_mel_min) * 254.0 / (f0_mel_max - f0_mel_min) + 1.0, 1.0, 255.0
         )
-        pitch_coarse = f0_mel.astype(int)
+        return f0_mel.astype(int)
+
+    def extract(self, audio, pitchf, f0_up_key, sr, window, silence_front=0):
+        start_frame = int(silence_front * sr / window)
+        real_silence_front = start_frame * window / sr
+
+        silence_front_offset = int(np.round(real_silence_front * sr))
+        audio = audio[silence_front_offset:]
+
+        f0 = self.extractF0(audio, sr, window)
+
+        f0 *= pow(2, f0_up_key / 12)
+        pitchf[-f0.shape[0]:] = f0[:pitchf.shape[0]]
+        pitch_coarse = self.coarse(pitchf.copy())
 
         return pitch_coarse, pitchf
@@ -12,6 +12,19 @@ class HarvestPitchExtractor(PitchExtractor):
         super().__init__()
         self.pitchExtractorType: PitchExtractorType = "harvest"
 
+    def extractF0(self, audio, sr, window):
+        if isinstance(audio, np.ndarray) is False:
+            audio = audio.detach().cpu().numpy()
+        f0, t = pyworld.harvest(
+            audio.astype(np.double),
+            fs=sr,
+            f0_ceil=self.f0_max,
+            frame_period=10,
+        )
+        f0 = pyworld.stonemask(audio.astype(np.double), f0, t, sr)
+        f0 = signal.medfilt(f0, 3)
+        return f0
+
     def extract(self, audio, pitchf, f0_up_key, sr, window, silence_front=0):
         audio = audio.detach().cpu().numpy()
         n_frames = int(len(audio) // window) + 1  # NOQA
@@ -21,29 +34,10 @@ class HarvestPitchExtractor(PitchExtractor):
         silence_front_offset = int(np.round(real_silence_front * sr))
         audio = audio[silence_front_offset:]
 
-        f0_min = 50
-        f0_max = 1100
-        f0_mel_min = 1127 * np.log(1 + f0_min / 700)
-        f0_mel_max = 1127 * np.log(1 + f0_max / 700)
-
-        f0, t = pyworld.harvest(
-            audio.astype(np.double),
-            fs=sr,
-            f0_ceil=f0_max,
-            frame_period=10,
-        )
-        f0 = pyworld.stonemask(audio.astype(np.double), f0, t, sr)
-        f0 = signal.medfilt(f0, 3)
+        f0 = self.extractF0(audio, sr, window)
 
         f0 *= pow(2, f0_up_key / 12)
         pitchf[-f0.shape[0]:] = f0[:pitchf.shape[0]]
-        f0bak = pitchf.copy()
-        f0_mel = 1127 * np.log(1 + f0bak / 700)
-        f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - f0_mel_min) * 254 / (
-            f0_mel_max - f0_mel_min
-        ) + 1
-        f0_mel[f0_mel <= 1] = 1
-        f0_mel[f0_mel > 255] = 255
-        pitch_coarse = np.rint(f0_mel).astype(int)
+        pitch_coarse = self.coarse(pitchf.copy())
 
         return pitch_coarse, pitchf
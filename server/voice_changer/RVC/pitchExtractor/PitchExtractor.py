@@ -1,11 +1,42 @@
 from typing import Protocol
 
+import numpy as np
+
 
 class PitchExtractor(Protocol):
+    f0_min = 50
+    f0_max = 1100
+
+    def extract(self, audio, pitchf, f0_up_key, sr, window, silence_front=0):
+        ...
 
-    def extract(self, audio, f0_up_key, sr, window, silence_front=0):
+    def extractF0(self, audio, sr, window) -> np.ndarray:
+        # audio 全体の f0 (Hz, 移調なし)。audio の先頭から window 毎のフレーム
         ...
 
+    def coarse(self, pitchf) -> np.ndarray:
+        f0_mel_min = 1127 * np.log(1 + self.f0_min / 700)
+        f0_mel_max = 1127 * np.log(1 + self.f0_max / 700)
+        f0_mel = 1127 * np.log(1 + pitchf / 700)
+        f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - f0_mel_min) * 254 / (f0_mel_max - f0_mel_min) + 1
+        f0_mel[f0_mel <= 1] = 1
+        f0_mel[f0_mel > 255] = 255
+        return np.rint(f0_mel).astype(int)
+
+    def extractStream(self, audio, pitchf, f0_up_key, sr, window, newFrames, contextFrames):
+        # ストリーミング用。pitchf には前回までの f0 (移調済み) が入っている。
+        # audio の末尾 (newFrames + contextFrames) フレーム分だけ f0 を計算し、pitchf の末尾 newFrames 分を差し替える。
+        # audio の末尾は pitchf の最後のフレームの終わりにそろえて渡すこと。
+        segmentFrames = min(newFrames + contextFrames, len(audio) // window)
+        segment = audio[len(audio) - segmentFrames * window :]
+        f0 = self.extractF0(segment, sr, window)[:segmentFrames]
+
+        f0 = f0 * pow(2, f0_up_key / 12)
+        n = min(newFrames, f0.shape[0], pitchf.shape[0])
+        if n > 0:
+            pitchf[-n:] = f0[f0.shape[0] - n :]
+        return self.coarse(pitchf), pitchf
+
     def getPitchExtractorInfo(self):
         return {
             "pitchExtractorType": self.pitchExtractorType,
@@ -1,3 +1,4 @@
+import threading
 from typing import Protocol
 from const import PitchExtractorType
 from voice_changer.RVC.pitchExtractor.CrepeOnnxPitchExtractor import CrepeOnnxPitchExtractor
@@ -14,6 +15,12 @@ from voice_changer.RVC.pitchExtractor.FcpePitchExtractor import FcpePitchExtract
 class PitchExtractorManager(Protocol):
     currentPitchExtractor: PitchExtractor | None = None
     params: VoiceChangerParams
+    # パイプライン間で共有しているもの。(pitchExtractorType, gpu) -> [pitchExtractor, 参照数]
+    sharedPitchExtractors: dict[tuple[str, int], list] = {}
+    # releasePitchExtractor は Pipeline.__del__ から(参照を手放したスレッドで)呼ばれるので、参照数は lock を取って更新する。
+    # (EmbedderManager と同じ。読み込みは loadLock で順番に行い、lock は持たない)
+    lock = threading.RLock()
+    loadLock = threading.Lock()
 
     @classmethod
     def initialize(cls, params: VoiceChangerParams):
@@ -26,6 +33,47 @@ class PitchExtractorManager(Protocol):
         cls.currentPitchExtractor = cls.loadPitchExtractor(pitchExtractorType,  gpu)
         return cls.currentPitchExtractor
 
+    @classmethod
+    def acquirePitchExtractor(
+        cls, pitchExtractorType: PitchExtractorType, gpu: int
+    ) -> PitchExtractor:
+        # 同じ種類とデバイスのものは一つだけ読み込んで共有する。使い終わったら releasePitchExtractor を呼ぶ
+        key = (pitchExtractorType, gpu)
+        pitchExtractor = cls._reusePitchExtractor(key)
+        if pitchExtractor is not None:
+            return pitchExtractor
+        with cls.loadLock:
+            pitchExtractor = cls._reusePitchExtractor(key)  # 待っている間に他のスレッドが読み込んだ
+            if pitchExtractor is not None:
+                return pitchExtractor
+
+            pitchExtractor = cls.loadPitchExtractor(pitchExtractorType, gpu)
+            with cls.lock:
+                cls.sharedPitchExtractors[key] = [pitchExtractor, 1]
+                cls.currentPitchExtractor = pitchExtractor
+            return pitchExtractor
+
+    @classmethod
+    def _reusePitchExtractor(cls, key: tuple[str, int]) -> PitchExtractor | None:
+        with cls.lock:
+            shared = cls.sharedPitchExtractors.get(key)
+            if shared is None:
+                return None
+            shared[1] += 1
+            cls.currentPitchExtractor = shared[0]
+            return shared[0]
+
+    @classmethod
+    def releasePitchExtractor(cls, pitchExtractor: PitchExtractor | None):
+        # 参照が無くなったら手放す。acquirePitchExtractor で取得したもの以外は無視する
+        with cls.lock:
+            for key, shared in list(cls.sharedPitchExtractors.items()):
+                if shared[0] is pitchExtractor:
+                    shared[1] -= 1
+                    if shared[1] <= 0:
+                        del cls.sharedPitchExtractors[key]
+                    return
+
     @classmethod
     def loadPitchExtractor(
         cls, pitchExtractorType: PitchExtractorType, gpu: int
@@ -1,7 +1,7 @@
 import numpy as np
 from const import PitchExtractorType
-from voice_changer.DiffusionSVC.pitchExtractor.PitchExtractor import PitchExtractor
 from voice_changer.RVC.deviceManager.DeviceManager import DeviceManager
+from voice_changer.RVC.pitchExtractor.PitchExtractor import PitchExtractor
 import onnxruntime
 
 
@@ -27,6 +27,18 @@ class RMVPEOnnxPitchExtractor(PitchExtractor):
         so.log_severity_level = 3
         self.onnx_session = onnxruntime.InferenceSession(self.file, sess_options=so, providers=onnxProviders, provider_options=onnxProviderOptions)
 
+    def extractF0(self, audio, sr, window):
+        if isinstance(audio, np.ndarray) is False:
+            audio = audio.cpu().numpy()
+        output = self.onnx_session.run(
+            ["pitchf"],
+            {
+                "waveform": np.expand_dims(audio, axis=0).astype(np.float32),
+                "threshold": np.array([0.3]).astype(np.float32),
+            },
+        )
+        return output[0].squeeze()
+
     def extract(self, audio, pitchf, f0_up_key, sr, window, silence_front=0):
         try:
             # データ変換
@@ -49,26 +61,13 @@ class RMVPEOnnxPitchExtractor(PitchExtractor):
             minimumFrames = 0.01 * sr
             targetFrameLength = max(minimumFrames, targetFrameLength)
             audio = audio[-targetFrameLength:]
-            audio = np.expand_dims(audio, axis=0)
-
-            output = self.onnx_session.run(
-                ["pitchf"],
-                {
-                    "waveform": audio.astype(np.float32),
-                    "threshold": np.array([0.3]).astype(np.float32),
-                },
-            )
 
-            f0 = output[0].squeeze()
+            f0 = self.extractF0(audio, sr, window)
 
             f0 *= pow(2, f0_up_key / 12)
             pitchf[-f0.shape[0]:] = f0[: pitchf.shape[0]]
 
-            f0_mel = 1127.0 * np.log(1.0 + pitchf / 700.0)
-            f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - self.f0_mel_min) * 254 / (self.f0_mel_max - self.f0_mel_min) + 1
-            f0_mel[f0_mel <= 1] = 1
-            f0_mel[f0_mel > 255] = 255
-            f0_coarse = np.rint(f0_mel).astype(int)
+            f0_coarse = self.coarse(pitchf)
 
         except Exception as e:
             raise RuntimeError(f"Exeption in {self.__class__.__name__}", e)
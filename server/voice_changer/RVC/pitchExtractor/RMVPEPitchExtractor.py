@@ -1,8 +1,8 @@
 import numpy as np
 from const import PitchExtractorType
-from voice_changer.DiffusionSVC.pitchExtractor.PitchExtractor import PitchExtractor
 from voice_changer.DiffusionSVC.pitchExtractor.rmvpe.rmvpe import RMVPE
 from voice_changer.RVC.deviceManager.DeviceManager import DeviceManager
+from voice_changer.RVC.pitchExtractor.PitchExtractor import PitchExtractor
 
 
 class RMVPEPitchExtractor(PitchExtractor):
@@ -20,6 +20,9 @@ class RMVPEPitchExtractor(PitchExtractor):
         self.device = DeviceManager.get_instance().getDevice(gpu)
         self.rmvpe = RMVPE(model_path=file, is_half=False, device=self.device)
 
+    def extractF0(self, audio, sr, window):
+        return self.rmvpe.infer_from_audio_t(audio, thred=0.03)
+
     def extract(self, audio, pitchf, f0_up_key, sr, window, silence_front=0):
         hop_size = 160  # RMVPE固定
 
@@ -28,18 +31,12 @@ class RMVPEPitchExtractor(PitchExtractor):
         real_silence_front = start_frame * hop_size / 16000  # 秒
         audio = audio[int(np.round(real_silence_front * 16000)):]
 
-        f0 = self.rmvpe.infer_from_audio_t(audio, thred=0.03)
+        f0 = self.extractF0(audio, sr, window)
 
         f0 = f0 * 2 ** (float(f0_up_key) / 12)
         pitchf[-f0.shape[0]:] = f0[:pitchf.shape[0]]
         f0 = pitchf
 
         f0bak = f0.copy()
-        f0_mel = 1127 * np.log(1 + f0 / 700)
-        f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - self.f0_mel_min) * 254 / (
-            self.f0_mel_max - self.f0_mel_min
-        ) + 1
-        f0_mel[f0_mel <= 1] = 1
-        f0_mel[f0_mel > 255] = 255
-        f0_coarse = np.rint(f0_mel).astype(int)
+        f0_coarse = self.coarse(f0)
         return f0_coarse, f0bak
@@ -0,0 +1,122 @@
+"""
+■ SessionManager
+- クライアント(socket.io の sid)毎のストリーミング状態の管理
+・モデルの重み(pipeline, embedder, inferencer など)は全セッションで共有し、チャンク間で持ち越す状態だけをセッション毎に持つ。
+  (VoiceChangerV2 の sola_buffer と VAD、各モデルのリングバッファ、入力リサンプラの履歴、incremental embedding / pitch のキャッシュ)
+・セッション毎に VoiceChanger の軽いコピー(cloneStream)を作る。重みは参照を共有し、設定とストリーミング状態だけを別に持つ。
+  セッション同士は別々のスレッドから同時に変換できる。(同じセッションのチャンクはセッションの lock で順番に処理する)
+・全体の設定変更やモデルの切り替えがあったら version を進める。コピーは次のチャンクで作り直し、ストリーミング状態は引き継ぐ。
+・セッション毎に軽い設定(SESSION_OVERRIDE_KEYS)を上書きできる。上書きはそのセッションのコピーの設定にだけ反映する。
+・sid を指定しない呼び出し(サーバーオーディオ、REST)は DEFAULT_SESSION として扱う。
+・cloneStream できない VoiceChanger(V1 など)はコピーを作らず、全セッションで一つの状態を共有する。(sharedLock で順番に処理、設定の上書きは受け付けない)
+"""
+
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Any
+
+DEFAULT_SESSION = "default"
+
+# セッション毎に上書きできる設定。settings の値を書き換えるだけで済むもの(パイプラインの作り直しやバッファの長さに影響しないもの)に限る。
+SESSION_OVERRIDE_KEYS = ["tran", "dstId", "indexRatio", "protect", "silentThreshold", "crossFadeOffsetRate", "crossFadeEndRate", "vadAttack", "vadHangover", "vadFlatness"]
+
+
+@dataclass
+class VoiceChangerSession:
+    sid: str
+    voiceChanger: Any | None = None  # このセッション用のコピー
+    base: Any | None = None  # コピー元
+    version: int = -1
+    overrides: dict[str, str | int | float] = field(default_factory=dict)
+    chunks: int = 0
+    lastAccess: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class SessionManager:
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl  # この秒数アクセスの無いセッションは破棄する(切断イベントが来なかった場合用)
+        self.sessions: dict[str, VoiceChangerSession] = {}
+        self.version = 0
+        self.lock = threading.Lock()  # sessions 用
+        self.sharedLock = threading.Lock()  # コピーを作れない VoiceChanger を共有する場合の変換用
+
+    def getSession(self, sid: str) -> VoiceChangerSession:
+        with self.lock:
+            if sid not in self.sessions:
+                self._expire()
+                self.sessions[sid] = VoiceChangerSession(sid)
+            session = self.sessions[sid]
+            session.lastAccess = time.time()
+            return session
+
+    def _expire(self):
+        now = time.time()
+        for sid in [s.sid for s in self.sessions.values() if s.sid != DEFAULT_SESSION and now - s.lastAccess > self.ttl]:
+            self.sessions.pop(sid)
+
+    def removeSession(self, sid: str):
+        with self.lock:
+            self.sessions.pop(sid, None)
+
+    def invalidate(self):
+        # 全体の設定変更、サンプリングレートの変更、モデルの切り替えの後に呼ぶ
+        self.version += 1
+
+    @staticmethod
+    def canClone(voiceChanger) -> bool:
+        return hasattr(voiceChanger, "cloneStream") and voiceChanger.canCloneStream()
+
+    def prepare(self, session: VoiceChangerSession, voiceChanger):
+        # session で変換に使う VoiceChanger を返す。session.lock を取った状態で呼ぶこと。
+        session.chunks += 1
+        if self.canClone(voiceChanger) is False:
+            return voiceChanger
+
+        if session.voiceChanger is None or session.version != self.version or session.base is not voiceChanger:
+            # モデルが同じならストリーミング状態は引き継ぐ
+            state = session.voiceChanger.getStreamState() if session.voiceChanger is not None and session.base is voiceChanger else None
+            clone = voiceChanger.cloneStream()
+            if state is not None:
+                clone.setStreamState(state)
+            self._applyOverrides(clone, session)
+            session.voiceChanger = clone
+            session.base = voiceChanger
+            session.version = self.version
+        return session.voiceChanger
+
+    def _applyOverrides(self, voiceChanger, session: VoiceChangerSession):
+        targets = [voiceChanger.settings]
+        model = getattr(voiceChanger, "voiceChanger", None)
+        if model is not None and hasattr(model, "settings"):
+            targets.append(model.settings)
+        for key, val in session.overrides.items():
+            for settings in targets:
+                if hasattr(settings, key):
+                    setattr(settings, key, type(getattr(settings, key))(val))
+
+    def setOverride(self, sid: str, key: str, val: str | int | float):
+        if key not in SESSION_OVERRIDE_KEYS:
+            return False
+        session = self.getSession(sid)
+        with session.lock:
+            session.overrides[key] = val
+            session.version = -1  # 次のチャンクでコピーを作り直して反映する
+        return True
+
+    def getSessionManagerInfo(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return {
+            "version": self.version,
+            "sessions": [
+                {
+                    "sid": session.sid,
+                    "chunks": session.chunks,
+                    "overrides": session.overrides,
+                    "idle": time.time() - session.lastAccess,
+                }
+                for session in sessions
+            ],
+        }
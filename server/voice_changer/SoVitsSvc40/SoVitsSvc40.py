@@ -3,6 +3,7 @@ import os
 from data.ModelSlot import SoVitsSvc40ModelSlot
 from voice_changer.VoiceChangerParamsManager import VoiceChangerParamsManager
 
+from voice_changer.common.RingBuffer import RingBuffer
 from voice_changer.utils.VoiceChangerModel import AudioInOut, VoiceChangerModel
 from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
 
@@ -93,7 +94,7 @@ class SoVitsSvc40(VoiceChangerModel):
             print("EXCEPTION during loading hubert/contentvec model", e)
 
         self.gpu_num = torch.cuda.device_count()
-        self.audio_buffer: AudioInOut | None = None
+        self.audio_buffer: RingBuffer | None = None
         self.prevVol = 0
         self.slotInfo = slotInfo
         self.initialize()
@@ -303,13 +304,6 @@ class SoVitsSvc40(VoiceChangerModel):
     ):
         newData = newData.astype(np.float32) / self.hps.data.max_wav_value
 
-        if self.audio_buffer is not None:
-            self.audio_buffer = np.concatenate(
-                [self.audio_buffer, newData], 0
-            )  # 過去のデータに連結
-        else:
-            self.audio_buffer = newData
-
         convertSize = (
             inputSize + crossfadeSize + solaSearchFrame + self.settings.extraConvertSize
         )
@@ -319,18 +313,22 @@ class SoVitsSvc40(VoiceChangerModel):
                 self.hps.data.hop_length - (convertSize % self.hps.data.hop_length)
             )
 
-        convertOffset = -1 * convertSize
-        self.audio_buffer = self.audio_buffer[convertOffset:]  # 変換対象の部分だけ抽出
+        if self.audio_buffer is None:
+            self.audio_buffer = RingBuffer(convertSize)
+        else:
+            self.audio_buffer.resize(convertSize)
+        self.audio_buffer.append(newData)  # 過去のデータに連結
+        audio_buffer = self.audio_buffer.filled_view()  # 変換対象の部分だけ抽出(コピー無し)
 
         cropOffset = -1 * (inputSize + crossfadeSize)
         cropEnd = -1 * (crossfadeSize)
-        crop = self.audio_buffer[cropOffset:cropEnd]
+        crop = audio_buffer[cropOffset:cropEnd]
 
         rms = np.sqrt(np.square(crop).mean(axis=0))
         vol = max(rms, self.prevVol * 0.0)
         self.prevVol = vol
 
-        c, f0, uv = self.get_unit_f0(self.audio_buffer, self.settings.tran)
+        c, f0, uv = self.get_unit_f0(audio_buffer, self.settings.tran)
         return (c, f0, uv, convertSize, vol)
 
     def _onnx_inference(self, data):
@@ -5,13 +5,13 @@ import torch
 import os
 import numpy as np
 from dataclasses import dataclass, asdict, field
-import resampy
 import onnxruntime
 from mods.log_control import VoiceChangaerLogger
 
 from voice_changer.IORecorder import IORecorder
+from voice_changer.common.StreamingResampler import StreamingResampler
 
-from voice_changer.utils.Timer import Timer2
+from voice_changer.utils.Tracer import Tracer
 from voice_changer.utils.VoiceChangerIF import VoiceChangerIF
 from voice_changer.utils.VoiceChangerModel import AudioInOut, VoiceChangerModel
 from Exceptions import (
@@ -29,6 +29,7 @@ from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
 STREAM_INPUT_FILE = os.path.join(TMP_DIR, "in.wav")
 STREAM_OUTPUT_FILE = os.path.join(TMP_DIR, "out.wav")
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 @dataclass
@@ -78,6 +79,8 @@ class VoiceChanger(VoiceChangerIF):
         self.params = params
         self.gpu_num = torch.cuda.device_count()
         self.prev_audio = np.zeros(4096)
+        self.inputResampler: StreamingResampler | None = None
+        self.outputResampler: StreamingResampler | None = None  # SOLA後の出力は連続しているので履歴を持ち越す
         self.mps_enabled: bool = getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available()
         self.onnx_device = onnxruntime.get_device()
 
@@ -191,16 +194,11 @@ class VoiceChanger(VoiceChangerIF):
 
             processing_sampling_rate = self.voiceChanger.get_processing_sampling_rate()
             # 前処理
-            with Timer2("pre-process", False) as t:
+            with tracer.span("vc.pre") as t:
                 if self.settings.inputSampleRate != processing_sampling_rate:
-                    newData = cast(
-                        AudioInOut,
-                        resampy.resample(
-                            receivedData,
-                            self.settings.inputSampleRate,
-                            processing_sampling_rate,
-                        ),
-                    )
+                    if self.inputResampler is None or self.inputResampler.isFor(self.settings.inputSampleRate, processing_sampling_rate) is False:
+                        self.inputResampler = StreamingResampler(self.settings.inputSampleRate, processing_sampling_rate)
+                    newData = cast(AudioInOut, self.inputResampler.process(receivedData))
                 else:
                     newData = receivedData
 
@@ -211,11 +209,10 @@ class VoiceChanger(VoiceChangerIF):
                 self._generate_strength(crossfade_frame)
 
                 data = self.voiceChanger.generate_input(newData, block_frame, crossfade_frame, sola_search_frame)
-                t.record("fin")
             preprocess_time = t.secs
 
             # 変換処理
-            with Timer2("main-process", False) as t:
+            with tracer.span("vc.main") as t:
                 # Inference
                 audio = self.voiceChanger.inference(data)
 
@@ -257,11 +254,10 @@ class VoiceChanger(VoiceChangerIF):
                 else:
                     self.sola_buffer = audio[-crossfade_frame:] * self.np_prev_strength
                     # self.sola_buffer = audio[- crossfade_frame:]
-                t.record("fin")
             mainprocess_time = t.secs
 
             # 後処理
-            with Timer2("post-process", False) as t:
+            with tracer.span("vc.post") as t:
                 result = result.astype(np.int16)
 
                 if self.settings.outputSampleRate != processing_sampling_rate:
@@ -270,14 +266,9 @@ class VoiceChanger(VoiceChangerIF):
                     #     self.settings.outputSampleRate,
                     #     processing_sampling_rate,
                     # )
-                    outputData = cast(
-                        AudioInOut,
-                        resampy.resample(
-                            result,
-                            processing_sampling_rate,
-                            self.settings.outputSampleRate,
-                        ).astype(np.int16),
-                    )
+                    if self.outputResampler is None or self.outputResampler.isFor(processing_sampling_rate, self.settings.outputSampleRate) is False:
+                        self.outputResampler = StreamingResampler(processing_sampling_rate, self.settings.outputSampleRate)
+                    outputData = cast(AudioInOut, self.outputResampler.process(result).astype(np.int16))
                 else:
                     outputData = result
 
@@ -295,12 +286,12 @@ class VoiceChanger(VoiceChangerIF):
                 if self.settings.recordIO == 1:
                     self.ioRecorder.writeInput(receivedData)
                     self.ioRecorder.writeOutput(outputData.tobytes())
-                t.record("fin")
 
             postprocess_time = t.secs
 
             print_convert_processing(f" [fin] Input/Output size:{receivedData.shape[0]},{outputData.shape[0]}")
             perf = [preprocess_time, mainprocess_time, postprocess_time]
+            self.settings.performance = [round((preprocess_time + mainprocess_time + postprocess_time) * 1000)] + [round(x * 1000) for x in perf]
 
             return outputData, perf
 
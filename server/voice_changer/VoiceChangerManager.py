@@ -9,13 +9,18 @@ from mods.log_control import VoiceChangaerLogger
 from voice_changer.Local.ServerDevice import ServerDevice, ServerDeviceCallbacks
 from voice_changer.ModelSlotManager import ModelSlotManager
 from voice_changer.RVC.RVCModelMerger import RVCModelMerger
+from voice_changer.SessionManager import DEFAULT_SESSION, SessionManager
 from voice_changer.VoiceChanger import VoiceChanger
 from const import STORED_SETTING_FILE, UPLOAD_DIR, StaticSlot
 from voice_changer.VoiceChangerV2 import VoiceChangerV2
+from voice_changer.utils.ConversionExecutor import ConversionExecutor
+from voice_changer.utils.LatencyController import LatencyController, LatencyKnob
 from voice_changer.utils.LoadModelParams import LoadModelParamFile, LoadModelParams
 from voice_changer.utils.ModelMerger import MergeElement, ModelMergerRequest
 from voice_changer.utils.VoiceChangerModel import AudioInOut
 from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
+from voice_changer.utils.Metrics import MetricsRegistry, processRssBytes
+from voice_changer.utils.Tracer import Tracer
 from dataclasses import dataclass, asdict, field
 import torch
 
@@ -25,6 +30,14 @@ from typing import Any
 import re
 
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
+metrics = MetricsRegistry.get_instance()
+# 変換の経路で更新するもの(作成済みのオブジェクトを使う)
+chunkCounter = metrics.counter("vc_chunks_total", "converted chunks")
+lateChunkCounter = metrics.counter("vc_late_chunks_total", "chunks converted slower than real time")
+rtfGauge = metrics.gauge("vc_realtime_factor", "processing time / chunk duration of the last chunk")
+modelLoadCounter = metrics.counter("vc_model_loads_total", "model slot loads")
+modelLoadGauge = metrics.gauge("vc_model_load_seconds", "duration of the last model slot load")
 
 
 @dataclass()
@@ -38,11 +51,52 @@ class GPUInfo:
 class VoiceChangerManagerSettings:
     modelSlotIndex: int | StaticSlot = -1
     passThrough: bool = False  # 0: off, 1: on
+
+    # 遅延の自動調整
+    adaptiveLatency: int = 0  # 0: off, 1: on
+    latencyTargetRTF: float = 0.8  # 処理時間 / チャンク長 の上限
+    latencyHysteresis: float = 0.6  # RTF が target * hysteresis を下回ったら遅延を減らす
+    latencyMinChunk: int = 32  # serverReadChunkSize の範囲 (サーバーオーディオ使用時のみ調整)
+    latencyMaxChunk: int = 1024
+    latencyMinExtra: int = 1024 * 2  # extraConvertSize の範囲
+    latencyMaxExtra: int = 1024 * 32
+    latencyMinCrossFade: int = 1024  # crossFadeOverlapSize の範囲
+    latencyMaxCrossFade: int = 4096
+
+    # 変換の実行(socket.io)
+    conversionWorkers: int = 4  # 変換用スレッドの数(同時に変換できるセッション数)
+    sessionMaxInFlight: int = 4  # セッション毎の実行待ち + 実行中の上限。超えたチャンクは変換せずに無音を返す
+
+    # トレース(GET /trace で Chrome trace の JSON を取得する。保存はしない)
+    traceRecorder: int = 0  # 0: off, 1: on
+    traceRecorderSize: int = 20000  # 保持する span の数(古いものから捨てる)
+
+    # 読み込み済みのパイプラインのキャッシュ(RVC)。スロットを切り替えたときに読み込み直さない
+    pipelineCacheMB: int = 1024  # モデル、index、embedder のファイルサイズ(概算)の合計の上限。超えたら使っていないものを古い順に捨てる
+
     # ↓mutableな物だけ列挙
     boolData: list[str] = field(default_factory=lambda: ["passThrough"])
     intData: list[str] = field(
         default_factory=lambda: [
             "modelSlotIndex",
+            "adaptiveLatency",
+            "latencyMinChunk",
+            "latencyMaxChunk",
+            "latencyMinExtra",
+            "latencyMaxExtra",
+            "latencyMinCrossFade",
+            "latencyMaxCrossFade",
+            "conversionWorkers",
+            "sessionMaxInFlight",
+            "traceRecorder",
+            "traceRecorderSize",
+            "pipelineCacheMB",
+        ]
+    )
+    floatData: list[str] = field(
+        default_factory=lambda: [
+            "latencyTargetRTF",
+            "latencyHysteresis",
         ]
     )
 
@@ -64,30 +118,43 @@ class VoiceChangerManager(ServerDeviceCallbacks):
 
     def setInputSamplingRate(self, sr: int):
         self.voiceChanger.setInputSampleRate(sr)
+        self.sessionManager.invalidate()
 
     def setOutputSamplingRate(self, sr: int):
         self.voiceChanger.setOutputSampleRate(sr)
+        self.sessionManager.invalidate()
 
     ############################
     # VoiceChangerManager
     ############################
-    def __init__(self, params: VoiceChangerParams):
+    def __init__(self, params: VoiceChangerParams, headless: bool = False):
+        # headless: オーディオデバイスのスレッドを起動せず、保存された設定も読み書きしない(ベンチマークなど)
         logger.info("[Voice Changer] VoiceChangerManager initializing...")
         self.params = params
+        self.headless = headless
         self.voiceChanger: VoiceChanger = None
         self.settings: VoiceChangerManagerSettings = VoiceChangerManagerSettings()
+        self.latencyController = LatencyController()
+        self.latencyLock = threading.Lock()
+        self.sessionManager = SessionManager()
+        self.conversionExecutor = ConversionExecutor(self.settings.conversionWorkers, self.settings.sessionMaxInFlight)
 
         self.modelSlotManager = ModelSlotManager.get_instance(self.params.model_dir)
         # スタティックな情報を収集
         self.gpus: list[GPUInfo] = self._get_gpuInfos()
 
         self.serverDevice = ServerDevice(self)
+        metrics.addCollector(self._collectMetrics)
+
+        # 設定保存用情報
+        self.stored_setting: dict[str, str | int | float] = {}
+        if headless:
+            logger.info("[Voice Changer] VoiceChangerManager initializing... done. (headless)")
+            return
 
         thread = threading.Thread(target=self.serverDevice.start, args=())
         thread.start()
 
-        # 設定保存用情報
-        self.stored_setting: dict[str, str | int | float] = {}
         if os.path.exists(STORED_SETTING_FILE):
             self.stored_setting = json.load(open(STORED_SETTING_FILE, "r", encoding="utf-8"))
         if "modelSlotIndex" in self.stored_setting:
@@ -99,10 +166,10 @@ class VoiceChangerManager(ServerDeviceCallbacks):
         logger.info("[Voice Changer] VoiceChangerManager initializing... done.")
 
     def store_setting(self, key: str, val: str | int | float):
-        saveItemForServerDevice = ["enableServerAudio", "serverAudioSampleRate", "serverInputDeviceId", "serverOutputDeviceId", "serverMonitorDeviceId", "serverReadChunkSize", "serverInputAudioGain", "serverOutputAudioGain"]
-        saveItemForVoiceChanger = ["crossFadeOffsetRate", "crossFadeEndRate", "crossFadeOverlapSize"]
-        saveItemForVoiceChangerManager = ["modelSlotIndex"]
-        saveItemForRVC = ["extraConvertSize", "gpu", "silentThreshold"]
+        saveItemForServerDevice = ["enableServerAudio", "serverAudioSampleRate", "serverInputDeviceId", "serverOutputDeviceId", "serverMonitorDeviceId", "serverReadChunkSize", "serverInputAudioGain", "serverOutputAudioGain", "serverOutputLatency"]
+        saveItemForVoiceChanger = ["crossFadeOffsetRate", "crossFadeEndRate", "crossFadeOverlapSize", "solaEngine", "vadAttack", "vadHangover", "vadFlatness"]
+        saveItemForVoiceChangerManager = ["modelSlotIndex", "adaptiveLatency", "latencyTargetRTF", "latencyHysteresis", "latencyMinChunk", "latencyMaxChunk", "latencyMinExtra", "latencyMaxExtra", "latencyMinCrossFade", "latencyMaxCrossFade", "conversionWorkers", "sessionMaxInFlight", "pipelineCacheMB"]
+        saveItemForRVC = ["extraConvertSize", "gpu", "silentThreshold", "incrementalEmbed", "incrementalEmbedMargin", "incrementalPitch", "incrementalPitchMargin", "concurrentExtract", "microBatch", "microBatchWait"]
         saveItemForAllVoiceChanger = ["f0Detector"]  # 設定されたf0DetectorがVCに存在しない値の場合はデフォルトに落ちるように実装すること
 
         saveItem = []
@@ -111,7 +178,7 @@ class VoiceChangerManager(ServerDeviceCallbacks):
         saveItem.extend(saveItemForVoiceChangerManager)
         saveItem.extend(saveItemForRVC)
         saveItem.extend(saveItemForAllVoiceChanger)
-        if key in saveItem:
+        if key in saveItem and self.headless is False:
             self.stored_setting[key] = val
             json.dump(self.stored_setting, open(STORED_SETTING_FILE, "w"))
 
@@ -132,6 +199,9 @@ class VoiceChangerManager(ServerDeviceCallbacks):
         return cls._instance
 
     def loadModel(self, params: LoadModelParams):
+        from voice_changer.RVC.pipeline.PipelineCache import PipelineCache  # 起動時にインポートしない(torch, faiss)
+
+        PipelineCache.get_instance().invalidateSlot(params.slot)  # スロットのファイルを入れ替える
         if params.isSampleMode:
             # サンプルダウンロード
             logger.info(f"[Voice Changer] sample download...., {params}")
@@ -223,6 +293,15 @@ class VoiceChangerManager(ServerDeviceCallbacks):
         data["voiceChangerParams"] = self.params
 
         data["status"] = "OK"
+        data["latencyController"] = self.latencyController.getLatencyControllerInfo()
+        data["sessionManager"] = self.sessionManager.getSessionManagerInfo()
+        data["conversionExecutor"] = self.conversionExecutor.getConversionExecutorInfo()
+        pipelineCacheInfo = self._getPipelineCacheInfo()
+        if pipelineCacheInfo is not None:
+            data["pipelineCache"] = pipelineCacheInfo
+        embedderManagerInfo = self._getEmbedderManagerInfo()
+        if embedderManagerInfo is not None:
+            data["embedderManager"] = embedderManagerInfo
 
         info = self.serverDevice.get_info()
         data.update(info)
@@ -233,12 +312,69 @@ class VoiceChangerManager(ServerDeviceCallbacks):
 
         return data
 
-    def get_performance(self):
-        if hasattr(self, "voiceChanger"):
-            info = self.voiceChanger.get_performance()
-            return info
-        else:
+    def _getPipelineCacheInfo(self):
+        # RVC を読み込んだことがない場合は None(PipelineCache のために torch や faiss をインポートしない)
+        module = sys.modules.get("voice_changer.RVC.pipeline.PipelineCache")
+        return module.PipelineCache.get_instance().getPipelineCacheInfo() if module is not None else None
+
+    def _getEmbedderManagerInfo(self):
+        module = sys.modules.get("voice_changer.RVC.embedder.EmbedderManager")
+        return module.EmbedderManager.getEmbedderManagerInfo() if module is not None else None
+
+    def _collectMetrics(self):
+        # /metrics の scrape のときだけ呼ばれる
+        executorInfo = self.conversionExecutor.getConversionExecutorInfo()
+        metrics.gauge("vc_conversion_in_flight", "chunks waiting or running in the conversion executor").set(executorInfo["inFlight"])
+        metrics.gauge("vc_conversion_peak_in_flight", "peak of vc_conversion_in_flight").set(executorInfo["peakInFlight"])
+        metrics.gauge("vc_conversion_last_wait_seconds", "queue wait of the last chunk in the conversion executor").set(executorInfo["lastWaitMs"] / 1000)
+        metrics.counter("vc_conversion_submitted_total", "chunks submitted to the conversion executor").set(executorInfo["submitted"])
+        metrics.counter("vc_dropped_chunks_total", "dropped chunks", reason="session_in_flight").set(executorInfo["dropped"])
+        metrics.gauge("vc_active_sessions", "streaming sessions").set(len(self.sessionManager.sessions))
+
+        serverDevice = self.serverDevice
+        for kind in ["inputOverrun", "outputOverrun", "outputUnderrun", "monitorOverrun", "monitorUnderrun"]:
+            metrics.counter("vc_server_audio_xruns_total", "server audio overruns / underruns", kind=kind).set(getattr(serverDevice, kind, 0))
+        if getattr(serverDevice, "inputFifo", None) is not None:
+            metrics.gauge("vc_server_audio_input_queue_samples", "samples waiting in the server audio input fifo").set(serverDevice.inputFifo.available())
+
+        metrics.removeGauges("vc_model_loaded")
+        if self.voiceChanger is not None:
+            modelType = getattr(getattr(self, "voiceChangerModel", None), "voiceChangerType", "")
+            metrics.gauge("vc_model_loaded", "loaded model slot", slot=self.settings.modelSlotIndex, type=modelType).set(1)
+
+        cacheInfo = self._getPipelineCacheInfo()
+        if cacheInfo is not None:
+            metrics.gauge("vc_pipeline_cache_bytes", "estimated size of the cached pipelines").set(cacheInfo["size"])
+            metrics.gauge("vc_pipeline_cache_entries", "cached pipelines").set(len(cacheInfo["entries"]))
+            metrics.counter("vc_pipeline_cache_hits_total", "model slot loads served from the pipeline cache").set(cacheInfo["hits"])
+            metrics.counter("vc_pipeline_cache_misses_total", "model slot loads that created a pipeline").set(cacheInfo["misses"])
+            metrics.counter("vc_pipeline_cache_evictions_total", "pipelines evicted from the pipeline cache").set(cacheInfo["evictions"])
+        embedderInfo = self._getEmbedderManagerInfo()
+        if embedderInfo is not None:
+            metrics.gauge("vc_embedders_loaded", "embedders shared by the pipelines").set(len(embedderInfo["embedders"]))
+            metrics.counter("vc_embedder_cache_hits_total", "embedder requests served by an already loaded embedder").set(embedderInfo["hits"])
+            metrics.counter("vc_embedder_cache_misses_total", "embedder requests that loaded an embedder").set(embedderInfo["misses"])
+
+        metrics.gauge("vc_process_resident_memory_bytes", "resident memory of the server process").set(processRssBytes())
+        if torch.cuda.is_available():
+            for i in range(torch.cuda.device_count()):
+                metrics.gauge("vc_cuda_memory_allocated_bytes", "torch cuda memory allocated", device=i).set(torch.cuda.memory_allocated(i))
+                metrics.gauge("vc_cuda_memory_reserved_bytes", "torch cuda memory reserved", device=i).set(torch.cuda.memory_reserved(i))
+
+    def get_metrics(self):
+        return metrics.render(tracer)
+
+    def get_trace(self):
+        return tracer.getChromeTrace()
+
+    def get_performance(self, stages: bool = False):
+        # stages: ステージ毎の統計(直近の count / mean / p50 / p95 / p99)も返す
+        if self.voiceChanger is None:
             return {"status": "ERROR", "msg": "no model loaded"}
+        info = self.voiceChanger.get_performance()
+        if stages:
+            return {"performance": info, "stages": tracer.getStageInfo()}
+        return info
 
     def generateVoiceChanger(self, val: int | StaticSlot):
         slotInfo = self.modelSlotManager.get_slot_info(val)
@@ -345,7 +481,12 @@ class VoiceChangerManager(ServerDeviceCallbacks):
                 except:
                     newVal = re.sub("^\d+", "", val)  # 先頭の数字を取り除く。
                 logger.info(f"[Voice Changer] model slot is changed {self.settings.modelSlotIndex} -> {newVal}")
-                self.generateVoiceChanger(newVal)
+                with tracer.span("modelLoad") as t:
+                    self.generateVoiceChanger(newVal)
+                modelLoadGauge.set(t.secs)
+                modelLoadCounter.inc()
+                self.sessionManager.invalidate()
+                self.latencyController.reset()
                 # キャッシュ設定の反映
                 for k, v in self.stored_setting.items():
                     if k != "modelSlotIndex":
@@ -354,23 +495,102 @@ class VoiceChangerManager(ServerDeviceCallbacks):
                 newVal = int(val)
 
             setattr(self.settings, key, newVal)
+            if key == "adaptiveLatency":
+                self.latencyController.reset()
+            if key in ["conversionWorkers", "sessionMaxInFlight"]:
+                self.conversionExecutor.setParams(self.settings.conversionWorkers, self.settings.sessionMaxInFlight)
+            if key in ["traceRecorder", "traceRecorderSize"]:
+                tracer.setTraceRecorder(self.settings.traceRecorder == 1, self.settings.traceRecorderSize)
+            if key == "pipelineCacheMB":
+                from voice_changer.RVC.pipeline.PipelineCache import PipelineCache
+
+                PipelineCache.get_instance().setBudget(self.settings.pipelineCacheMB * 1024 * 1024)
+        elif key in self.settings.floatData:
+            setattr(self.settings, key, float(val))
 
         self.serverDevice.update_settings(key, val)
         if self.voiceChanger is not None:
             self.voiceChanger.update_settings(key, val)
+            self.sessionManager.invalidate()  # 各セッションのコピーに反映する
 
         return self.get_info()
 
-    def changeVoice(self, receivedData: AudioInOut):
+    def update_session_settings(self, sid: str, key: str, val: str | int | float):
+        # クライアント(sid)毎の設定の上書き。対象は SESSION_OVERRIDE_KEYS のみ
+        # コピーを作れない VoiceChanger(V1 など)は全セッションで一つの設定を共有するので上書きできない
+        status = "OK"
+        if self.voiceChanger is None or self.sessionManager.canClone(self.voiceChanger) is False:
+            logger.info(f"[Voice Changer] the current model does not support per session settings. ({key})")
+            status = "NG"
+        elif self.sessionManager.setOverride(sid, key, val) is False:
+            logger.info(f"[Voice Changer] {key} cannot be overridden per session.")
+            status = "NG"
+        info = self.sessionManager.getSessionManagerInfo()
+        info["status"] = status
+        return info
+
+    def remove_session(self, sid: str):
+        self.sessionManager.removeSession(sid)
+        self.conversionExecutor.removeSession(sid)
+
+    def changeVoice(self, receivedData: AudioInOut, sid: str | None = None):
         if self.settings.passThrough is True:  # パススルー
             return receivedData, []
 
-        if hasattr(self, "voiceChanger") is True:
-            return self.voiceChanger.on_request(receivedData)
+        voiceChanger = self.voiceChanger
+        if voiceChanger is not None:
+            session = self.sessionManager.getSession(sid if sid is not None else DEFAULT_SESSION)
+            with session.lock:  # 同じセッションのチャンクは順番に処理する
+                sessionVoiceChanger = self.sessionManager.prepare(session, voiceChanger)
+                with tracer.span("chunk") as t:
+                    if sessionVoiceChanger is voiceChanger:
+                        with self.sessionManager.sharedLock:
+                            result = voiceChanger.on_request(receivedData)
+                    else:
+                        result = sessionVoiceChanger.on_request(receivedData)
+                        voiceChanger.settings.performance = sessionVoiceChanger.settings.performance  # get_performance は直近の変換の値を返す
+                processTime = t.secs
+
+            chunkTime = receivedData.shape[0] / voiceChanger.settings.inputSampleRate
+            rtf = processTime / chunkTime if chunkTime > 0 else 0.0
+            rtfGauge.set(rtf)
+            chunkCounter.inc()
+            if rtf > 1.0:
+                lateChunkCounter.inc()
+
+            if self.settings.adaptiveLatency == 1:
+                with self.latencyLock:
+                    self._controlLatency(processTime, chunkTime)
+            return result
         else:
             logger.info("Voice Change is not loaded. Did you load a correct model?")
             return np.zeros(1).astype(np.int16), []
 
+    def _controlLatency(self, processTime: float, chunkTime: float):
+        self.latencyController.record(processTime, chunkTime)
+
+        knobs: list[LatencyKnob] = []
+        if self.serverDevice.settings.enableServerAudio == 1:  # ブラウザ経由の場合チャンクサイズはクライアントが決める
+            knobs.append(LatencyKnob("serverReadChunkSize", self.serverDevice.settings.serverReadChunkSize, self.settings.latencyMinChunk, self.settings.latencyMaxChunk, 1.25))
+        modelSettings = getattr(getattr(self, "voiceChangerModel", None), "settings", None)
+        if hasattr(modelSettings, "extraConvertSize"):
+            knobs.append(LatencyKnob("extraConvertSize", modelSettings.extraConvertSize, self.settings.latencyMinExtra, self.settings.latencyMaxExtra, 2))
+        knobs.append(LatencyKnob("crossFadeOverlapSize", self.voiceChanger.settings.crossFadeOverlapSize, self.settings.latencyMinCrossFade, self.settings.latencyMaxCrossFade, 2))
+
+        rtf = self.latencyController.currentRTF()
+        step = self.latencyController.decide(knobs, self.settings.latencyTargetRTF, self.settings.latencyHysteresis)
+        if step is None:
+            return
+        key, val = step
+        logger.info(f"[Voice Changer] adaptive latency: rtf={rtf:.2f} (target={self.settings.latencyTargetRTF}), {key} -> {val}")
+        # 自動調整した値は保存しない(ユーザーが設定した値を上書きしない)
+        self.serverDevice.update_settings(key, val)
+        # 変換スレッドから呼ばれる。コピーを作れない VoiceChanger では他のセッションが同じオブジェクトで変換中のことがあるので、
+        # そのチャンクが終わってから変更する(コピーを使うセッションには次のチャンクで反映される)
+        with self.sessionManager.sharedLock:
+            self.voiceChanger.update_settings(key, val)
+        self.sessionManager.invalidate()
+
     def export2onnx(self):
         return self.voiceChanger.export2onnx()
 
@@ -400,6 +620,11 @@ class VoiceChangerManager(ServerDeviceCallbacks):
     def update_model_info(self, newData: str):
         # self.voiceChanger.update_model_info(newData)
         self.modelSlotManager.update_model_info(newData)
+        # スロットの情報(embedder, samplingRate, f0 など)が変わったので、キャッシュしたパイプラインは使わない
+        # (RVC を読み込んだことがなければキャッシュは空なので、PipelineCache のために torch や faiss をインポートしない)
+        module = sys.modules.get("voice_changer.RVC.pipeline.PipelineCache")
+        if module is not None:
+            module.PipelineCache.get_instance().invalidateSlot(int(json.loads(newData)["slot"]))
         return self.get_info()
 
     def upload_model_assets(self, params: str):
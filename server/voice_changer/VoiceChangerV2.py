@@ -3,6 +3,7 @@
 - VoiceChangerとの差分
 ・リサンプル処理の無駄を省くため、VoiceChangerModelにリサンプル処理を移譲
 ・前処理、メイン処理の分割を廃止(VoiceChangeModelでの無駄な型変換などを回避するため)
+・無音判定を共通化。無音区間はVoiceChangerModelを呼ばずにバッファだけ進める(skipInference)
 
 - 適用VoiceChangerModel
 ・DiffusionSVC
@@ -11,6 +12,7 @@
 
 from typing import Any, Union
 
+import copy
 from const import TMP_DIR
 import torch
 import os
@@ -22,8 +24,10 @@ from mods.log_control import VoiceChangaerLogger
 # from voice_changer.Beatrice.Beatrice import Beatrice
 
 from voice_changer.IORecorder import IORecorder
+from voice_changer.common.VoiceActivityGate import VoiceActivityGate
+from voice_changer.common.sola.SolaEngineManager import SolaEngineManager
 
-from voice_changer.utils.Timer import Timer2
+from voice_changer.utils.Tracer import Tracer
 from voice_changer.utils.VoiceChangerIF import VoiceChangerIF
 from voice_changer.utils.VoiceChangerModel import AudioInOut, VoiceChangerModel
 from Exceptions import (
@@ -41,6 +45,7 @@ from voice_changer.utils.VoiceChangerParams import VoiceChangerParams
 STREAM_INPUT_FILE = os.path.join(TMP_DIR, "in.wav")
 STREAM_OUTPUT_FILE = os.path.join(TMP_DIR, "out.wav")
 logger = VoiceChangaerLogger.get_instance().getLogger()
+tracer = Tracer.get_instance()
 
 
 @dataclass
@@ -53,6 +58,12 @@ class VoiceChangerV2Settings:
     crossFadeOverlapSize: int = 4096
 
     recordIO: int = 0  # 0:off, 1:on
+    solaEngine: str = "fft"  # time, fft or torch
+
+    # 無音判定(しきい値は各モデルの silentThreshold)
+    vadAttack: int = 1  # 有声チャンクがこの回数続いたら処理を再開
+    vadHangover: float = 0.3  # 最後の有声チャンクから処理を続ける秒数
+    vadFlatness: float = 0.0  # spectral flatness がこれを超えたら雑音として扱う (0: 使わない)
 
     performance: list[int] = field(default_factory=lambda: [0, 0, 0, 0])
 
@@ -63,15 +74,22 @@ class VoiceChangerV2Settings:
             "outputSampleRate",
             "crossFadeOverlapSize",
             "recordIO",
+            "vadAttack",
         ]
     )
     floatData: list[str] = field(
         default_factory=lambda: [
             "crossFadeOffsetRate",
             "crossFadeEndRate",
+            "vadHangover",
+            "vadFlatness",
+        ]
+    )
+    strData: list[str] = field(
+        default_factory=lambda: [
+            "solaEngine",
         ]
     )
-    strData: list[str] = field(default_factory=lambda: [])
 
 
 class VoiceChangerV2(VoiceChangerIF):
@@ -93,17 +111,64 @@ class VoiceChangerV2(VoiceChangerIF):
         self.mps_enabled: bool = getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available()
         self.onnx_device = onnxruntime.get_device()
         self.noCrossFade = False
+        self.t_prev_strength: torch.Tensor | None = None
+        self.t_cur_strength: torch.Tensor | None = None
+        self.solaEngine = SolaEngineManager.getSolaEngine(self.settings.solaEngine)
+        self.voiceActivityGate = VoiceActivityGate()
 
         logger.info(f"VoiceChangerV2 Initialized (GPU_NUM(cuda):{self.gpu_num}, mps_enabled:{self.mps_enabled}, onnx_device:{self.onnx_device})")
 
     def setModel(self, model: VoiceChangerModel):
         self.voiceChanger = model
         self.voiceChanger.setSamplingRate(self.settings.inputSampleRate, self.settings.outputSampleRate)
+        self.voiceActivityGate.reset()
         # if model.voiceChangerType == "Beatrice" or model.voiceChangerType == "LLVC":
         if model.voiceChangerType == "Beatrice":
             self.noCrossFade = True
         else:
             self.noCrossFade = False
+        self._applyTensorOutput()
+
+    def _applyTensorOutput(self):
+        # torchのSOLAを使う場合はモデルの出力をデバイス上に残してもらう(対応しているモデルのみ)
+        if self.voiceChanger is not None and hasattr(self.voiceChanger, "setTensorOutput"):
+            self.voiceChanger.setTensorOutput(self.solaEngine.solaEngineType == "torch")
+
+    def canCloneStream(self):
+        return hasattr(self.voiceChanger, "cloneStream")
+
+    def cloneStream(self):
+        # セッション用のコピー。モデルの重みは共有し、設定とストリーミング状態だけを別に持つ
+        clone = copy.copy(self)
+        clone.settings = copy.copy(self.settings)
+        clone.solaEngine = SolaEngineManager.getSolaEngine(self.settings.solaEngine)  # 探索用の状態(FFT のサイズ、torch の畳み込みのカーネルなど)を持つので共有しない
+        clone.voiceChanger = self.voiceChanger.cloneStream()
+        clone.setStreamState(None)
+        return clone
+
+    def getStreamState(self):
+        # クライアント毎に持つ状態(SessionManager で引き継ぐ)
+        return {
+            "sola_buffer": getattr(self, "sola_buffer", None),
+            "voiceActivityGate": self.voiceActivityGate,
+            "model": self.voiceChanger.getStreamState() if hasattr(self.voiceChanger, "getStreamState") else None,
+        }
+
+    def setStreamState(self, state: dict[str, Any] | None):
+        # None のときは新しいストリームとして初期化する
+        if hasattr(self, "sola_buffer") is True:
+            del self.sola_buffer
+        if state is None:
+            self.voiceActivityGate = VoiceActivityGate()
+            modelState = None
+        else:
+            # SOLAエンジンが変わって numpy / torch が合わなくなった場合は作り直す
+            if isinstance(state["sola_buffer"], np.ndarray) or (state["sola_buffer"] is not None and self.solaEngine.solaEngineType == "torch"):
+                self.sola_buffer = state["sola_buffer"]
+            self.voiceActivityGate = state["voiceActivityGate"]
+            modelState = state["model"]
+        if hasattr(self.voiceChanger, "setStreamState"):
+            self.voiceChanger.setStreamState(modelState)
 
     def setInputSampleRate(self, sr: int):
         self.settings.inputSampleRate = sr
@@ -115,6 +180,7 @@ class VoiceChangerV2(VoiceChangerIF):
 
     def get_info(self):
         data = asdict(self.settings)
+        data["voiceActivityGate"] = self.voiceActivityGate.getVoiceActivityGateInfo()
         if self.voiceChanger is not None:
             data.update(self.voiceChanger.get_info())
         return data
@@ -160,6 +226,13 @@ class VoiceChangerV2(VoiceChangerIF):
             setattr(self.settings, key, float(val))
         elif key in self.settings.strData:
             setattr(self.settings, key, str(val))
+            if key == "solaEngine":
+                self.solaEngine = SolaEngineManager.getSolaEngine(self.settings.solaEngine)
+                self.settings.solaEngine = self.solaEngine.solaEngineType
+                self._applyTensorOutput()
+                # numpy / torch でバッファの型が変わるので作り直す
+                if hasattr(self, "sola_buffer") is True:
+                    del self.sola_buffer
         else:
             ret = self.voiceChanger.update_settings(key, val)
             if ret is False:
@@ -204,6 +277,40 @@ class VoiceChangerV2(VoiceChangerIF):
                 delattr(self, "np_prev_audio1")
             if hasattr(self, "sola_buffer") is True:
                 del self.sola_buffer
+            self.t_prev_strength = None
+            self.t_cur_strength = None
+
+    def _on_device_sola(self, audio: torch.Tensor, block_frame: int, crossfade_frame: int, sola_search_frame: int) -> AudioInOut:
+        # SOLA、クロスフェード、int16変換までモデルの出力デバイス上で行い、CPUへのコピーは最後の一回だけにする。
+        audio = audio.to(torch.float32)
+        if self.t_prev_strength is None or self.t_prev_strength.device != audio.device:
+            self.t_prev_strength = torch.from_numpy(self.np_prev_strength).to(device=audio.device, dtype=torch.float32)
+            self.t_cur_strength = torch.from_numpy(self.np_cur_strength).to(device=audio.device, dtype=torch.float32)
+        if hasattr(self, "sola_buffer") is True and isinstance(self.sola_buffer, np.ndarray):
+            self.sola_buffer = torch.from_numpy(self.sola_buffer).to(device=audio.device, dtype=torch.float32)
+
+        if hasattr(self, "sola_buffer") is True:
+            audio_offset = -1 * (sola_search_frame + crossfade_frame + block_frame)
+            audio = audio[audio_offset:]
+
+            sola_offset = self.solaEngine.search(audio, self.sola_buffer, crossfade_frame, sola_search_frame)
+            sola_end = sola_offset + block_frame
+            output_wav = audio[sola_offset:sola_end].clone()
+            output_wav[:crossfade_frame] *= self.t_cur_strength
+            output_wav[:crossfade_frame] += self.sola_buffer
+
+            result = torch.clamp(output_wav, -32768, 32767).to(torch.int16).cpu().numpy()
+        else:
+            logger.info("[Voice Changer] warming up... generating sola buffer.")
+            result = np.zeros(4096).astype(np.int16)
+
+        if hasattr(self, "sola_buffer") is True and sola_offset < sola_search_frame:
+            offset = -1 * (sola_search_frame + crossfade_frame - sola_offset)
+            end = -1 * (sola_search_frame - sola_offset)
+            self.sola_buffer = audio[offset:end] * self.t_prev_strength
+        else:
+            self.sola_buffer = audio[-crossfade_frame:] * self.t_prev_strength
+        return result
 
     def get_processing_sampling_rate(self):
         if self.voiceChanger is None:
@@ -211,16 +318,36 @@ class VoiceChangerV2(VoiceChangerIF):
         else:
             return self.voiceChanger.get_processing_sampling_rate()
 
+    def _isSilent(self, receivedData: AudioInOut):
+        threshold = getattr(getattr(self.voiceChanger, "settings", None), "silentThreshold", 0.0)
+        self.voiceActivityGate.setParams(threshold, self.settings.vadAttack, self.settings.vadHangover, self.settings.vadFlatness)
+        return self.voiceActivityGate.process(receivedData, self.settings.inputSampleRate) is False
+
+    def _skipInference(self, receivedData: AudioInOut):
+        # モデルのバッファとストリーム位置だけ進める(無音として扱う)
+        if hasattr(self.voiceChanger, "skipInference"):
+            self.voiceChanger.skipInference(receivedData)
+        # 再開時は無音からクロスフェードする
+        if hasattr(self, "sola_buffer") is True:
+            self.sola_buffer = self.sola_buffer * 0
+
     #  receivedData: tuple of short
     def on_request(self, receivedData: AudioInOut) -> tuple[AudioInOut, list[Union[int, float]]]:
         try:
             if self.voiceChanger is None:
                 raise VoiceChangerIsNotSelectedException("Voice Changer is not selected.")
-            enableMainprocessTimer = False
-            with Timer2("main-process", enableMainprocessTimer) as t:
+            with tracer.span("vc.pre") as t:
                 processing_sampling_rate = self.voiceChanger.get_processing_sampling_rate()
-
-                if self.noCrossFade:  # Beatrice, LLVC
+                silent = self._isSilent(receivedData)
+            preprocess_time = t.secs
+
+            with tracer.span("vc.main") as t:
+                if silent:
+                    # 無音区間はリサンプル / pitch / embedding / 推論をすべて省略する
+                    self._skipInference(receivedData)
+                    result = np.zeros(receivedData.shape[0])
+                    t.lap("skip")
+                elif self.noCrossFade:  # Beatrice, LLVC
                     audio = self.voiceChanger.inference(
                         receivedData,
                         crossfade_frame=0,
@@ -234,35 +361,23 @@ class VoiceChangerV2(VoiceChangerIF):
                     block_frame = receivedData.shape[0]
                     crossfade_frame = min(self.settings.crossFadeOverlapSize, block_frame)
                     self._generate_strength(crossfade_frame)
-                    t.record("generate_strength")
+                    t.lap("generate_strength")
 
                     audio = self.voiceChanger.inference(
                         receivedData,
                         crossfade_frame=crossfade_frame,
                         sola_search_frame=sola_search_frame,
                     )
-                    t.record("inference")
+                    t.lap("inference")
 
-                    if hasattr(self, "sola_buffer") is True:
+                    if isinstance(audio, torch.Tensor):
+                        result = self._on_device_sola(audio, block_frame, crossfade_frame, sola_search_frame)
+                    elif hasattr(self, "sola_buffer") is True:
                         np.set_printoptions(threshold=10000)
                         audio_offset = -1 * (sola_search_frame + crossfade_frame + block_frame)
                         audio = audio[audio_offset:]
 
-                        # SOLA algorithm from https://github.com/yxlllc/DDSP-SVC, https://github.com/liujing04/Retrieval-based-Voice-Conversion-WebUI
-                        cor_nom = np.convolve(
-                            audio[: crossfade_frame + sola_search_frame],
-                            np.flip(self.sola_buffer),
-                            "valid",
-                        )
-                        cor_den = np.sqrt(
-                            np.convolve(
-                                audio[: crossfade_frame + sola_search_frame] ** 2,
-                                np.ones(crossfade_frame),
-                                "valid",
-                            )
-                            + 1e-3
-                        )
-                        sola_offset = int(np.argmax(cor_nom / cor_den))
+                        sola_offset = self.solaEngine.search(audio, self.sola_buffer, crossfade_frame, sola_search_frame)
                         sola_end = sola_offset + block_frame
                         output_wav = audio[sola_offset:sola_end].astype(np.float64)
                         output_wav[:crossfade_frame] *= self.np_cur_strength
@@ -273,9 +388,11 @@ class VoiceChangerV2(VoiceChangerIF):
                         logger.info("[Voice Changer] warming up... generating sola buffer.")
                         result = np.zeros(4096).astype(np.int16)
 
-                    t.record("sora")
+                    tracer.record("sola", t.lap("sola"))
 
-                    if hasattr(self, "sola_buffer") is True and sola_offset < sola_search_frame:
+                    if isinstance(audio, torch.Tensor):
+                        pass  # _on_device_sola で更新済み
+                    elif hasattr(self, "sola_buffer") is True and sola_offset < sola_search_frame:
                         offset = -1 * (sola_search_frame + crossfade_frame - sola_offset)
                         end = -1 * (sola_search_frame - sola_offset)
                         sola_buf_org = audio[offset:end]
@@ -284,12 +401,12 @@ class VoiceChangerV2(VoiceChangerIF):
                         self.sola_buffer = audio[-crossfade_frame:] * self.np_prev_strength
                         # self.sola_buffer = audio[- crossfade_frame:]
 
-                    t.record("post")
+                    t.lap("sola_buffer")
 
             mainprocess_time = t.secs
 
             # 後処理
-            with Timer2("post-process", False) as t:
+            with tracer.span("vc.post") as t:
                 result = result.astype(np.int16)
 
                 print_convert_processing(f" Output data size of {result.shape[0]}/{processing_sampling_rate}hz {result .shape[0]}/{self.settings.outputSampleRate}hz")
@@ -312,7 +429,8 @@ class VoiceChangerV2(VoiceChangerIF):
             postprocess_time = t.secs
 
             print_convert_processing(f" [fin] Input/Output size:{receivedData.shape[0]},{outputData.shape[0]}")
-            perf = [0, mainprocess_time, postprocess_time]
+            perf = [preprocess_time, mainprocess_time, postprocess_time]
+            self.settings.performance = [round((preprocess_time + mainprocess_time + postprocess_time) * 1000)] + [round(x * 1000) for x in perf]
 
             return outputData, perf
 
@@ -0,0 +1,102 @@
+"""
+■ RingBuffer
+- 固定長の履歴バッファ(audio / pitchf / feature 用)
+・チャンク毎の np.concatenate + スライスによる確保とコピーを廃止するため、容量の数倍の領域を事前確保し、書き込み位置を進めるだけにする。
+・view() は常に連続領域(ndarray の view)を返すので、そのまま torch.from_numpy や Pipeline.exec に渡せる(コピー無し)。
+・領域の末尾に達したときだけ、直近 capacity 分を先頭に詰め直す(容量 x (slack - 1) 分の書き込みに一回)。
+・view() に対するインプレースの書き込み(pitchExtractor の pitchf[-n:] = f0 など)はそのままバッファに反映される。
+・view() で得た配列は次の append / resize までの間だけ有効。
+"""
+
+from typing import Any
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, capacity: int, shape: tuple[int, ...] = (), dtype: Any = np.float32, slack: int = 4):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slack = max(2, slack)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self.buffer = np.zeros((self.capacity * self.slack, *self.shape), dtype=self.dtype)
+        self.pos = self.capacity  # 書き込み位置。[pos - capacity, pos) が現在のウィンドウ
+        self.filled = 0
+
+    def getRingBufferInfo(self):
+        return {
+            "capacity": self.capacity,
+            "filled": self.filled,
+            "shape": self.shape,
+            "dtype": str(self.dtype),
+        }
+
+    def clear(self):
+        self.buffer[self.pos - self.capacity : self.pos] = 0
+        self.filled = 0
+
+    def resize(self, capacity: int):
+        # 直近のデータは保持したまま容量を変更する。(足りない分はゼロ)
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity:
+            return
+        keep = min(capacity, self.capacity)
+        tail = self.buffer[self.pos - keep : self.pos].copy()
+        filled = min(self.filled, keep)
+        self._allocate(capacity)
+        self.buffer[self.pos - keep : self.pos] = tail
+        self.filled = filled
+
+    def _compact(self):
+        # 末尾に達したので直近 capacity 分を先頭に詰め直す
+        self.buffer[: self.capacity] = self.buffer[self.pos - self.capacity : self.pos]
+        self.pos = self.capacity
+
+    def append(self, data: np.ndarray):
+        length = data.shape[0]
+        if length == 0:
+            return
+        if length >= self.capacity:
+            # 容量を超えるデータは末尾だけ残す
+            self.buffer[: self.capacity] = data[-self.capacity :]
+            self.pos = self.capacity
+            self.filled = self.capacity
+            return
+        if self.pos + length > self.buffer.shape[0]:
+            self._compact()
+        self.buffer[self.pos : self.pos + length] = data
+        self.pos += length
+        self.filled = min(self.capacity, self.filled + length)
+
+    def append_zeros(self, length: int):
+        if length <= 0:
+            return
+        length = min(length, self.capacity)
+        if self.pos + length > self.buffer.shape[0]:
+            self._compact()
+        self.buffer[self.pos : self.pos + length] = 0
+        self.pos += length
+        self.filled = min(self.capacity, self.filled + length)
+
+    def overwrite_tail(self, data: np.ndarray):
+        # 末尾 len(data) 分を置き換える。(pipeline から戻ってきた pitchf / feature の書き戻し用)
+        length = min(data.shape[0], self.capacity)
+        if length == 0:
+            return
+        self.buffer[self.pos - length : self.pos] = data[-length:]
+        self.filled = max(self.filled, length)
+
+    def view(self, size: int | None = None) -> np.ndarray:
+        # 直近 size 分の連続領域を返す(コピーしない)。未書き込み部分はゼロ。
+        if size is None or size > self.capacity:
+            size = self.capacity
+        return self.buffer[self.pos - size : self.pos]
+
+    def filled_view(self) -> np.ndarray:
+        # 実際に書き込まれた分だけを返す(ゼロ埋めしない)。
+        return self.buffer[self.pos - self.filled : self.pos]
+
+    def __len__(self):
+        return self.capacity
@@ -0,0 +1,75 @@
+"""
+■ VoiceActivityGate
+- VoiceChangerV2 の先頭で使う無音判定(VAD)
+・リサンプル前の int16 の入力チャンクのエネルギー(RMS)だけで判定する。(オプションで spectral flatness も使う)
+・attack: 有声チャンクが attack 回続いたら開く。hangover: 最後の有声チャンクから hangover 秒間は開いたままにする。
+  (語尾や子音の途中で切れないように)
+・閉じている間は VoiceChangerV2 がリサンプル / pitch / embedding / 推論をすべて省略する。
+"""
+
+import numpy as np
+
+
+class VoiceActivityGate:
+    def __init__(self):
+        self.threshold = 0.0
+        self.attack = 1
+        self.hangover = 0.3
+        self.flatness = 0.0
+        self.reset()
+
+    def setParams(self, threshold: float, attack: int, hangover: float, flatness: float):
+        self.threshold = threshold
+        self.attack = max(1, attack)
+        self.hangover = max(0.0, hangover)
+        self.flatness = flatness
+
+    def reset(self):
+        self.opened = False
+        self.voicedRun = 0
+        self.hangoverLeft = 0  # サンプル数
+        self.lastRms = 0.0
+        self.lastFlatness = 0.0
+        self.totalChunks = 0
+        self.skippedChunks = 0
+
+    def getVoiceActivityGateInfo(self):
+        return {
+            "opened": self.opened,
+            "rms": self.lastRms,
+            "flatness": self.lastFlatness,
+            "totalChunks": self.totalChunks,
+            "skippedChunks": self.skippedChunks,
+        }
+
+    def _isVoiced(self, data: np.ndarray) -> bool:
+        x = data.astype(np.float32) / 32768.0
+        self.lastRms = float(np.sqrt(np.dot(x, x) / max(1, x.shape[0])))
+        if self.lastRms < self.threshold:
+            return False
+        if self.flatness > 0:
+            # 白色雑音に近いほど 1 に近づく。有声音は小さい。
+            power = np.square(np.abs(np.fft.rfft(x))) + 1e-12
+            self.lastFlatness = float(np.exp(np.mean(np.log(power))) / np.mean(power))
+            if self.lastFlatness > self.flatness:
+                return False
+        return True
+
+    def process(self, data: np.ndarray, sr: int) -> bool:
+        # True: 処理する(有声 or hangover 中), False: 無音なので処理を省略する
+        self.totalChunks += 1
+        if self._isVoiced(data):
+            self.voicedRun += 1
+            if self.opened or self.voicedRun >= self.attack:
+                self.opened = True
+                self.hangoverLeft = int(self.hangover * sr)
+        else:
+            self.voicedRun = 0
+            if self.opened:
+                self.hangoverLeft -= data.shape[0]
+                if self.hangoverLeft <= 0:
+                    self.opened = False
+
+        if self.opened is False:
+            self.skippedChunks += 1
+        return self.opened
@@ -0,0 +1,42 @@
+import numpy as np
+from scipy.fft import next_fast_len
+from const import SolaEngineType
+
+from voice_changer.common.sola.SolaEngine import SolaEngine
+
+
+class FFTSolaEngine(SolaEngine):
+    """
+    FFTの相互相関でSOLAのオフセットを探索する。
+    - 分子: rfft(audio) * conj(rfft(sola_buffer)) の逆変換(循環しないようにnfft >= crossfade + search)
+    - 分母: audio**2 の累積和から窓幅crossfadeの移動和を求める(O(n))
+    - nfft は crossfade / search のサイズが変わらない限り使いまわす。(sola_buffer はチャンク毎に新しくなるので、そのスペクトルは毎回計算する)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.solaEngineType: SolaEngineType = "fft"
+        self.crossfade_frame = -1
+        self.sola_search_frame = -1
+        self.nfft = 0
+
+    def _prepare(self, crossfade_frame: int, sola_search_frame: int):
+        if self.crossfade_frame == crossfade_frame and self.sola_search_frame == sola_search_frame:
+            return
+        self.crossfade_frame = crossfade_frame
+        self.sola_search_frame = sola_search_frame
+        self.nfft = next_fast_len(crossfade_frame + sola_search_frame, real=True)
+
+    def search(self, audio: np.ndarray, sola_buffer: np.ndarray, crossfade_frame: int, sola_search_frame: int) -> int:
+        self._prepare(crossfade_frame, sola_search_frame)
+        audio = audio[: crossfade_frame + sola_search_frame].astype(np.float64)
+
+        ref_spec = np.conj(np.fft.rfft(sola_buffer, self.nfft))
+        cor_nom = np.fft.irfft(np.fft.rfft(audio, self.nfft) * ref_spec, self.nfft)[: sola_search_frame + 1]
+
+        energy = np.empty(audio.shape[0] + 1)
+        energy[0] = 0.0
+        np.cumsum(audio * audio, out=energy[1:])
+        cor_den = np.sqrt(energy[crossfade_frame:] - energy[:-crossfade_frame] + 1e-3)
+
+        return int(np.argmax(cor_nom / cor_den))
@@ -0,0 +1,14 @@
+from typing import Protocol
+
+import numpy as np
+
+
+class SolaEngine(Protocol):
+
+    def search(self, audio: np.ndarray, sola_buffer: np.ndarray, crossfade_frame: int, sola_search_frame: int) -> int:
+        ...
+
+    def getSolaEngineInfo(self):
+        return {
+            "solaEngineType": self.solaEngineType,
+        }
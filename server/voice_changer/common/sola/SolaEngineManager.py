@@ -0,0 +1,25 @@
+from typing import Protocol
+from const import SolaEngineType
+from mods.log_control import VoiceChangaerLogger
+
+from voice_changer.common.sola.FFTSolaEngine import FFTSolaEngine
+from voice_changer.common.sola.SolaEngine import SolaEngine
+from voice_changer.common.sola.TimeDomainSolaEngine import TimeDomainSolaEngine
+from voice_changer.common.sola.TorchSolaEngine import TorchSolaEngine
+
+logger = VoiceChangaerLogger.get_instance().getLogger()
+
+
+class SolaEngineManager(Protocol):
+
+    @classmethod
+    def getSolaEngine(cls, solaEngineType: SolaEngineType) -> SolaEngine:
+        if solaEngineType == "time":
+            return TimeDomainSolaEngine()
+        elif solaEngineType == "fft":
+            return FFTSolaEngine()
+        elif solaEngineType == "torch":
+            return TorchSolaEngine()
+        else:
+            logger.warn(f"[Voice Changer] SolaEngine not found {solaEngineType}, fallback to fft")
+            return FFTSolaEngine()
@@ -0,0 +1,32 @@
+import numpy as np
+from const import SolaEngineType
+
+from voice_changer.common.sola.SolaEngine import SolaEngine
+
+
+class TimeDomainSolaEngine(SolaEngine):
+    """
+    従来のSOLA(np.convolveを二回)。O(crossfade x search)。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.solaEngineType: SolaEngineType = "time"
+
+    def search(self, audio: np.ndarray, sola_buffer: np.ndarray, crossfade_frame: int, sola_search_frame: int) -> int:
+        # SOLA algorithm from https://github.com/yxlllc/DDSP-SVC, https://github.com/liujing04/Retrieval-based-Voice-Conversion-WebUI
+        audio = audio[: crossfade_frame + sola_search_frame]
+        cor_nom = np.convolve(
+            audio,
+            np.flip(sola_buffer),
+            "valid",
+        )
+        cor_den = np.sqrt(
+            np.convolve(
+                audio**2,
+                np.ones(crossfade_frame),
+                "valid",
+            )
+            + 1e-3
+        )
+        return int(np.argmax(cor_nom / cor_den))
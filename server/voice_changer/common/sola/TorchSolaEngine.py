@@ -0,0 +1,37 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from const import SolaEngineType
+
+from voice_changer.common.sola.SolaEngine import SolaEngine
+
+
+class TorchSolaEngine(SolaEngine):
+    """
+    モデルの出力デバイス上でSOLAのオフセットを探索する。(VoiceChangerV2のデバイス上パス用)
+    - 分子: conv1d(相関なのでflip不要)
+    - 分母: audio**2 と ones の conv1d(float32の累積和だと桁落ちするため。mpsはfloat64非対応)
+    - CPUへ戻すのはオフセット(スカラ)のみ。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.solaEngineType: SolaEngineType = "torch"
+        self.ones: torch.Tensor | None = None  # 分母用の窓。crossfadeサイズ・デバイスが変わらない限り使いまわす
+
+    @torch.no_grad()
+    def search(self, audio: torch.Tensor, sola_buffer: torch.Tensor, crossfade_frame: int, sola_search_frame: int) -> int:
+        if isinstance(audio, np.ndarray):
+            audio = torch.from_numpy(audio)
+        if isinstance(sola_buffer, np.ndarray):
+            sola_buffer = torch.from_numpy(sola_buffer).to(audio.device)
+        audio = audio[: crossfade_frame + sola_search_frame].to(torch.float32)
+        sola_buffer = sola_buffer.to(torch.float32)
+
+        cor_nom = F.conv1d(audio[None, None, :], sola_buffer[None, None, :])[0, 0]
+
+        if self.ones is None or self.ones.shape[-1] != crossfade_frame or self.ones.device != audio.device:
+            self.ones = torch.ones(1, 1, crossfade_frame, device=audio.device, dtype=torch.float32)
+        cor_den = torch.sqrt(F.conv1d((audio * audio)[None, None, :], self.ones)[0, 0] + 1e-3)
+
+        return int(torch.argmax(cor_nom / cor_den).item())
@@ -0,0 +1,83 @@
+"""
+■ ConversionExecutor
+- socket.io などの async ハンドラから、ブロックする変換処理(changeVoice)を専用のスレッドプールに逃がす。
+  変換中もイベントループが止まらないので、他のクライアントや REST(/info, /performance など)に応答できる。
+・同じセッションの要求は到着順に一つずつ実行する。(セッション毎の asyncio.Lock は待っている順に取得される)
+  別のセッション同士はワーカーの数まで同時に実行する。(SessionManager のセッション毎のコピーで並行に変換できる)
+・セッション毎の実行待ち + 実行中の数(in-flight)が maxInFlight に達していたら、新しい要求は実行せずに None を返す。
+  (処理が追いつかない場合に遅延が際限なく増えるのを防ぐ。呼び出し側で無音を返すなどする)
+・カウンタはイベントループのスレッドからしか触らないのでロックは不要。
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import time
+from typing import Any, Callable
+
+
+@dataclass
+class SessionQueue:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    inFlight: int = 0
+    dropped: int = 0
+
+
+class ConversionExecutor:
+    def __init__(self, maxWorkers: int = 4, maxInFlight: int = 4):
+        self.maxWorkers = max(1, maxWorkers)
+        self.maxInFlight = max(1, maxInFlight)
+        self.executor = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="vc-convert")
+        self.queues: dict[str, SessionQueue] = {}
+
+        self.inFlight = 0
+        self.peakInFlight = 0
+        self.submitted = 0
+        self.dropped = 0
+        self.lastWait = 0.0  # 直近の要求の実行待ち時間(秒)
+
+    def setParams(self, maxWorkers: int, maxInFlight: int):
+        self.maxInFlight = max(1, maxInFlight)
+        if max(1, maxWorkers) != self.maxWorkers:
+            # 実行中の変換はそのまま古いプールで終わらせる
+            old = self.executor
+            self.maxWorkers = max(1, maxWorkers)
+            self.executor = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="vc-convert")
+            old.shutdown(wait=False)
+
+    async def submit(self, sid: str, func: Callable[..., Any], *args):
+        queue = self.queues.setdefault(sid, SessionQueue())
+        self.submitted += 1
+        if queue.inFlight >= self.maxInFlight:
+            queue.dropped += 1
+            self.dropped += 1
+            return None
+
+        queue.inFlight += 1
+        self.inFlight += 1
+        self.peakInFlight = max(self.peakInFlight, self.inFlight)
+        start = time.perf_counter()
+        try:
+            async with queue.lock:
+                self.lastWait = time.perf_counter() - start
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            queue.inFlight -= 1
+            self.inFlight -= 1
+
+    def removeSession(self, sid: str):
+        # 実行中の要求は queue を参照しているので、そのまま終わる
+        self.queues.pop(sid, None)
+
+    def getConversionExecutorInfo(self):
+        return {
+            "maxWorkers": self.maxWorkers,
+            "maxInFlight": self.maxInFlight,
+            "inFlight": self.inFlight,  # 全セッションの実行待ち + 実行中
+            "peakInFlight": self.peakInFlight,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "lastWaitMs": self.lastWait * 1000,
+            "queueDepth": {sid: queue.inFlight for sid, queue in self.queues.items()},
+        }
@@ -0,0 +1,114 @@
+"""
+■ LatencyController
+- チャンク毎の処理時間から serverReadChunkSize / extraConvertSize / crossFadeOverlapSize を自動で調整する。
+・処理時間 / チャンク長(real time factor, RTF)の直近 window チャンク分のパーセンタイルを見る。
+・RTF が targetRTF を超えたら余裕を作る方向に 1 段階動かす。
+  (extraConvertSize を減らす → crossFadeOverlapSize を減らす → チャンクを大きくする の順。遅延が増えるのは最後)
+・RTF が targetRTF * hysteresis を下回ったら遅延を減らす方向に 1 段階動かす。
+  (チャンクを小さくする → extraConvertSize を戻す → crossFadeOverlapSize を戻す の順)
+・動かした後はサンプルを捨てて、新しい設定で minSamples 分計測するまで次の判断をしない。
+  直前と逆向きに同じ設定を動かす場合(行ったり来たり)は待ち時間を倍にしていく。
+"""
+
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class LatencyKnob:
+    key: str
+    value: int
+    minValue: int
+    maxValue: int
+    ratio: float  # 1 段階の倍率
+
+
+# 余裕を作る方向(RTF が高すぎる時)。-1: 減らす, 1: 増やす
+RELIEVE_ORDER = [("extraConvertSize", -1), ("crossFadeOverlapSize", -1), ("serverReadChunkSize", 1)]
+# 遅延を減らす/品質を戻す方向(RTF に余裕がある時)
+TIGHTEN_ORDER = [("serverReadChunkSize", -1), ("extraConvertSize", 1), ("crossFadeOverlapSize", 1)]
+
+MAX_BACKOFF = 8
+
+
+class LatencyController:
+    def __init__(self, window: int = 64, minSamples: int = 24, percentile: float = 90.0):
+        self.window = window
+        self.minSamples = minSamples
+        self.percentile = percentile
+        self.rtfs: deque[float] = deque(maxlen=window)
+        self.steps = 0
+        self.lastStep: tuple[str, int] | None = None
+        self.backoff = 1
+        self.reset()
+
+    def reset(self):
+        self.rtfs.clear()
+        self.wait = self.minSamples
+
+    def record(self, processTime: float, chunkTime: float):
+        if chunkTime <= 0:
+            return
+        self.rtfs.append(processTime / chunkTime)
+        if self.wait > 0:
+            self.wait -= 1
+
+    def currentRTF(self) -> float | None:
+        if len(self.rtfs) == 0:
+            return None
+        return float(np.percentile(self.rtfs, self.percentile))
+
+    def _step(self, knob: LatencyKnob, direction: int):
+        if direction > 0:
+            newVal = max(int(round(knob.value * knob.ratio)), knob.value + 1)
+        else:
+            newVal = min(int(round(knob.value / knob.ratio)), knob.value - 1)
+        newVal = max(knob.minValue, min(knob.maxValue, newVal))
+        return newVal if newVal != knob.value else None
+
+    def decide(self, knobs: list[LatencyKnob], targetRTF: float, hysteresis: float):
+        # 変更する設定 (key, 新しい値) を返す。変更なしなら None
+        if self.wait > 0 or len(self.rtfs) < self.minSamples:
+            return None
+
+        rtf = self.currentRTF()
+        if rtf > targetRTF:
+            order = RELIEVE_ORDER
+        elif rtf < targetRTF * hysteresis:
+            order = TIGHTEN_ORDER
+        else:
+            return None
+
+        knobMap = {knob.key: knob for knob in knobs}
+        for key, direction in order:
+            if key not in knobMap:
+                continue
+            newVal = self._step(knobMap[key], direction)
+            if newVal is None:
+                continue
+
+            # 直前の変更を打ち消す向きなら、次の判断までの待ちを長くする
+            if self.lastStep is not None and self.lastStep == (key, -direction):
+                self.backoff = min(MAX_BACKOFF, self.backoff * 2)
+            elif self.lastStep is not None and self.lastStep != (key, direction):
+                self.backoff = 1
+            self.lastStep = (key, direction)
+            self.steps += 1
+
+            self.rtfs.clear()
+            self.wait = self.minSamples * self.backoff
+            return key, newVal
+        return None
+
+    def getLatencyControllerInfo(self):
+        rtf = self.currentRTF()
+        return {
+            "rtf": rtf if rtf is not None else 0,  # 直近の RTF のパーセンタイル
+            "percentile": self.percentile,
+            "samples": len(self.rtfs),
+            "wait": self.wait,
+            "steps": self.steps,
+            "lastStep": list(self.lastStep) if self.lastStep is not None else [],
+        }
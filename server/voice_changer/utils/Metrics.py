@@ -0,0 +1,182 @@
+"""
+■ Metrics
+- /metrics(Prometheus のテキスト形式)用のレジストリ
+・Counter / Gauge は値を一つ持つだけのオブジェクト。変換の経路では作成済みのオブジェクトの inc / set を呼ぶだけで、ロックは取らない。
+  (複数のスレッドから同時に inc した場合にまれに一回分数え損ねることがあるが、監視用なので許容する)
+・処理時間のヒストグラムは Tracer の各ステージ(StageStats.buckets)をそのまま vc_stage_duration_seconds として出す。
+・キューの深さやセッション数など、他のクラスが既に持っている値は addCollector で登録した関数で、scrape のときにだけ集める。
+・prometheus_client には依存しない。
+"""
+
+import ctypes
+import os
+import sys
+import threading
+from typing import Callable
+
+from voice_changer.utils.Tracer import BUCKET_BOUNDS_MS, Tracer
+
+
+def _escape(value: str):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatLabels(labels: tuple[tuple[str, str], ...]):
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join([f'{key}="{_escape(val)}"' for key, val in labels]) + "}"
+
+
+def _windowsRssBytes(peak: bool) -> int:
+    # GetProcessMemoryInfo の WorkingSetSize / PeakWorkingSetSize
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    try:
+        kernel32 = ctypes.WinDLL("kernel32")
+        psapi = ctypes.WinDLL("psapi")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(PROCESS_MEMORY_COUNTERS)
+        if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return 0
+        return counters.PeakWorkingSetSize if peak else counters.WorkingSetSize
+    except Exception:
+        return 0
+
+
+def processRssBytes(peak: bool = False) -> int:
+    # 現在の RSS(peak=True ならピークの RSS)。取れない環境では 0
+    # /proc が無い環境(macOS など)では peak=False でもピークの RSS を返す
+    if sys.platform == "win32":
+        return _windowsRssBytes(peak)
+    try:
+        if peak:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        else:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource  # Unix のみ
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # macOS は byte, linux は KB
+
+
+class Metric:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    __slots__ = ()
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge(Metric):
+    __slots__ = ()
+
+
+class MetricsRegistry:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        # name -> (type, help, {labels: Metric})
+        self.families: dict[str, tuple[str, str, dict[tuple[tuple[str, str], ...], Metric]]] = {}
+        self.collectors: list[Callable[[], None]] = []
+        self.lock = threading.Lock()  # 登録と scrape だけ
+
+    def _get(self, cls, type: str, name: str, help: str, labels: dict[str, str]):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        family = self.families.get(name)
+        if family is None or key not in family[2]:
+            with self.lock:
+                family = self.families.setdefault(name, (type, help, {}))
+                family[2].setdefault(key, cls())
+        return family[2][key]
+
+    def counter(self, name: str, help: str, **labels) -> Counter:
+        return self._get(Counter, "counter", name, help, labels)
+
+    def gauge(self, name: str, help: str, **labels) -> Gauge:
+        return self._get(Gauge, "gauge", name, help, labels)
+
+    def removeGauges(self, name: str):
+        # ラベルの値が変わるもの(読み込んでいるスロットなど)を作り直す前に呼ぶ
+        family = self.families.get(name)
+        if family is not None:
+            family[2].clear()
+
+    def addCollector(self, collector: Callable[[], None]):
+        with self.lock:
+            self.collectors.append(collector)
+
+    def render(self, tracer: Tracer | None = None) -> str:
+        with self.lock:
+            collectors = list(self.collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print("[Voice Changer] metrics collector failed:", e)
+
+        lines: list[str] = []
+        with self.lock:
+            for name, (type, help, metrics) in sorted(self.families.items()):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, metric in list(metrics.items()):
+                    lines.append(f"{name}{_formatLabels(labels)} {float(metric.value)}")
+
+        if tracer is not None:
+            lines.extend(self._renderStages(tracer))
+        return "\n".join(lines) + "\n"
+
+    def _renderStages(self, tracer: Tracer):
+        name = "vc_stage_duration_seconds"
+        lines = [f"# HELP {name} processing time per stage", f"# TYPE {name} histogram"]
+        for stage, stats in sorted(tracer.stages.items()):
+            buckets = list(stats.buckets)
+            cumulative = 0
+            for bound, count in zip(BUCKET_BOUNDS_MS, buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{_escape(stage)}",le="{bound / 1000}"}} {cumulative}')
+            cumulative += buckets[-1]
+            lines.append(f'{name}_bucket{{stage="{_escape(stage)}",le="+Inf"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{_escape(stage)}"}} {stats.totalNs / 1_000_000_000}')
+            lines.append(f'{name}_count{{stage="{_escape(stage)}"}} {cumulative}')
+        return lines
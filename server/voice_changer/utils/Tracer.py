@@ -0,0 +1,179 @@
+"""
+■ Tracer
+- 常に有効にしておける軽い計測(Timer2 の置き換え)
+・time.perf_counter_ns(単調)で区間(span)を測る。呼び出し元のフレームの参照や print はしない。
+・ステージ毎に StageStats を一つ持ち、事前に確保した二つのバッファに記録する。
+  samples: 直近 window 個の処理時間のリングバッファ(percentile 用)
+  buckets: BUCKET_BOUNDS_MS の区切りの累積ヒストグラム(起動してからの全件)
+  記録はリストへの代入と加算だけで、集計(percentile など)は読むとき(getTracerInfo)にだけ行う。
+・複数のスレッドから同じステージに記録する場合はロックしない。(まれにサンプルが一つ上書きされても集計には影響しない)
+・トレース(オプション): setTraceRecorder で有効にすると、span と lap の開始時刻 / 長さ / スレッドを
+  最大 size 件のリング(deque)にも記録する。getChromeTrace で Chrome trace(Perfetto / chrome://tracing)の JSON にする。
+  無効の間は span の終了時に None かどうかを見るだけ。
+
+使い方:
+  tracer = Tracer.get_instance()
+  with tracer.span("vc.main") as t:
+      ...
+      t.lap("inference")  # "vc.main.inference" に直前の lap(または開始)からの時間を記録
+  t.secs  # 区間全体(秒)
+"""
+
+from bisect import bisect_left
+from collections import deque
+import os
+import threading
+import time
+
+import numpy as np
+
+# モデルによらない共通のステージ(各モデルはこの名前で記録する)。getStageInfo で返す。
+# transport: 受信したデータのデコード、送信するデータのエンコードと送信(socket.io / REST / WebSocket)
+PIPELINE_STAGES = ("resampleIn", "pitch", "embed", "indexSearch", "synth", "resampleOut", "sola", "transport")
+
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0)
+BUCKET_BOUNDS_NS = tuple(int(x * 1_000_000) for x in BUCKET_BOUNDS_MS)
+
+
+class StageStats:
+    __slots__ = ("name", "window", "samples", "pos", "count", "totalNs", "lastNs", "buckets")
+
+    def __init__(self, name: str, window: int = 512):
+        self.name = name
+        self.window = window
+        self.samples = [0] * window
+        self.buckets = [0] * (len(BUCKET_BOUNDS_NS) + 1)  # 最後は +Inf
+        self.reset()
+
+    def reset(self):
+        self.pos = 0
+        self.count = 0
+        self.totalNs = 0
+        self.lastNs = 0
+        for i in range(len(self.buckets)):
+            self.buckets[i] = 0
+
+    def add(self, ns: int):
+        pos = self.pos
+        self.samples[pos] = ns
+        self.pos = pos + 1 if pos + 1 < self.window else 0
+        self.count += 1
+        self.totalNs += ns
+        self.lastNs = ns
+        self.buckets[bisect_left(BUCKET_BOUNDS_NS, ns)] += 1
+
+    def getStageStatsInfo(self):
+        # 時間は ms。p50 / p95 / p99 / mean / max は直近 window 個から計算する。
+        n = min(self.count, self.window)
+        if n == 0:
+            return {"count": 0}
+        recent = np.array(self.samples[:n], dtype=np.float64) / 1_000_000
+        p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+        return {
+            "count": self.count,
+            "last": self.lastNs / 1_000_000,
+            "mean": float(np.mean(recent)),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(np.max(recent)),
+        }
+
+
+class Span:
+    __slots__ = ("tracer", "stats", "start", "lapStart", "ns")
+
+    def __init__(self, tracer: "Tracer", stats: StageStats):
+        self.tracer = tracer
+        self.stats = stats
+        self.ns = 0
+
+    def __enter__(self):
+        self.start = self.lapStart = time.perf_counter_ns()
+        return self
+
+    def lap(self, name: str) -> int:
+        now = time.perf_counter_ns()
+        ns = now - self.lapStart
+        stats = self.tracer.stage(f"{self.stats.name}.{name}")
+        stats.add(ns)
+        events = self.tracer.traceEvents
+        if events is not None:
+            events.append((stats.name, self.lapStart, ns, threading.get_ident()))
+        self.lapStart = now
+        return ns
+
+    def __exit__(self, *_):
+        self.ns = time.perf_counter_ns() - self.start
+        self.stats.add(self.ns)
+        events = self.tracer.traceEvents
+        if events is not None:
+            events.append((self.stats.name, self.start, self.ns, threading.get_ident()))
+
+    @property
+    def secs(self):
+        return self.ns / 1_000_000_000
+
+    @property
+    def msecs(self):
+        return self.ns / 1_000_000
+
+
+class Tracer:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self.stages: dict[str, StageStats] = {}
+        self.lock = threading.Lock()  # ステージの追加だけ
+        self.traceEvents: deque[tuple[str, int, int, int]] | None = None  # (name, start ns, duration ns, thread)
+
+    def stage(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            with self.lock:
+                stats = self.stages.setdefault(name, StageStats(name, self.window))
+        return stats
+
+    def span(self, name: str) -> Span:
+        return Span(self, self.stage(name))
+
+    def record(self, name: str, ns: int):
+        self.stage(name).add(ns)
+        events = self.traceEvents
+        if events is not None:
+            events.append((name, time.perf_counter_ns() - ns, ns, threading.get_ident()))
+
+    def setTraceRecorder(self, enabled: bool, size: int = 20000):
+        if enabled is False:
+            self.traceEvents = None
+        elif self.traceEvents is None or self.traceEvents.maxlen != size:
+            self.traceEvents = deque(self.traceEvents or [], maxlen=max(1, size))
+
+    def getChromeTrace(self):
+        # Chrome trace の JSON(dict)。時刻は μs。同じスレッドの span は入れ子で表示される
+        events = list(self.traceEvents or [])
+        pid = os.getpid()
+        threadNames = {thread.ident: thread.name for thread in threading.enumerate()}
+        traceEvents = []
+        for tid in sorted(set([event[3] for event in events])):
+            traceEvents.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": threadNames.get(tid, str(tid))}})
+        for name, start, ns, tid in events:
+            traceEvents.append({"name": name, "cat": name.split(".")[0], "ph": "X", "ts": start / 1000, "dur": ns / 1000, "pid": pid, "tid": tid})
+        return {"traceEvents": traceEvents, "displayTimeUnit": "ms"}
+
+    def reset(self):
+        for stats in list(self.stages.values()):
+            stats.reset()
+
+    def getTracerInfo(self):
+        return {name: stats.getStageStatsInfo() for name, stats in sorted(self.stages.items())}
+
+    def getStageInfo(self):
+        return {name: self.stage(name).getStageStatsInfo() for name in PIPELINE_STAGES}